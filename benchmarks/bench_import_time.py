@@ -0,0 +1,87 @@
+"""
+Import time of nighres
+======================
+
+Times, in fresh Python processes, ``import nighres`` alone and followed by
+the first use of one function (which imports its module, nighresjava and the
+other dependencies of that module only), and lists the modules loaded by
+``import nighres``. Exits with an error when ``import nighres`` loads
+nighresjava, or, with --max, when its median time exceeds the maximum, to
+catch modules imported eagerly again.
+
+Usage::
+
+    python benchmarks/bench_import_time.py --repeat 10 --max 0.5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+_STATEMENTS = [
+    ('import nighres', 'import nighres'),
+    ('first function', 'import nighres; nighres.surface.levelset_to_probability'),
+    ('all subpackages', 'import nighres; '
+     '[getattr(getattr(nighres, p), f) for p in nighres.__all__ '
+     'if hasattr(getattr(nighres, p, None), "_lazy_functions") '
+     'for f in getattr(nighres, p)._lazy_functions]'),
+]
+
+
+def _time_import(statement):
+    # Wall time of the statement in a new interpreter, without its startup
+    code = ('import time; start = time.perf_counter(); {0}; '
+            'print(time.perf_counter() - start)').format(statement)
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True)
+    return float(output.stdout.split()[-1])
+
+
+def _loaded_modules():
+    code = ('import sys; before = set(sys.modules); import nighres; '
+            'print(len(set(sys.modules) - before)); '
+            'print(" ".join(sorted(m for m in sys.modules '
+            'if m.startswith("nighres"))))')
+    # nighresjava starts with nighres, so it is listed when loaded
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True)
+    count, modules = output.stdout.strip().split('\n')
+    return int(count), modules.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max', type=float, default=None,
+                        help='maximum median time of import nighres (s)')
+    args = parser.parse_args()
+
+    print('{0:16} {1:>9} {2:>9} {3:>9}'.format('statement', 'median s',
+                                              'min s', 'max s'))
+    medians = {}
+    for name, statement in _STATEMENTS:
+        try:
+            times = [_time_import(statement) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError:
+            print('{0:16} failed (is nighresjava installed?)'.format(name))
+            continue
+        medians[name] = statistics.median(times)
+        print('{0:16} {1:>9.3f} {2:>9.3f} {3:>9.3f}'.format(
+              name, medians[name], min(times), max(times)))
+
+    count, modules = _loaded_modules()
+    print('\nimport nighres loads {0} modules, {1} of nighres:\n  {2}'.format(
+          count, len(modules), ' '.join(modules)))
+
+    if 'nighresjava' in modules:
+        sys.exit('import nighres loads nighresjava')
+
+    if args.max is not None and medians['import nighres'] > args.max:
+        sys.exit('import nighres took {0:.3f} s, more than {1} s'.format(
+                 medians['import nighres'], args.max))
+
+
+if __name__ == '__main__':
+    main()
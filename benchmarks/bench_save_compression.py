@@ -0,0 +1,89 @@
+"""
+Size/speed trade-off of the output compression codecs of save_volume
+=====================================================================
+
+Writes a synthetic 4D membership-like volume (smooth values in [0,1] with a
+large zero background, similar to the _mgdm-mems or _lps-data outputs) with
+every codec and compression level, reads it back with load_volume and
+reports timings, throughput and file sizes.
+
+Usage::
+
+    python benchmarks/bench_save_compression.py --shape 256 256 192 6 \\
+        --threads 8 --output_dir /path/to/shared/storage
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import nibabel as nb
+
+from nighres import global_settings
+from nighres.io import load_volume, save_volume
+
+
+def _synthetic_volume(shape, seed=0):
+    # Smooth 4D probabilities inside an ellipsoid, zero outside
+    rng = np.random.RandomState(seed)
+    grid = np.meshgrid(*[np.linspace(-1, 1, n) for n in shape[:3]],
+                       indexing='ij')
+    inside = sum(g**2 for g in grid) < 0.8
+    data = np.zeros(shape, dtype=np.float32)
+    for c in range(shape[3]):
+        wave = np.cos((c+1)*np.pi*grid[0])*np.sin((c+2)*np.pi*grid[1])
+        data[..., c] = inside*np.clip(0.5 + 0.5*wave
+                                      + 0.05*rng.randn(*shape[:3]), 0, 1)
+    return nb.Nifti1Image(data, np.eye(4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--shape', type=int, nargs=4,
+                        default=[192, 192, 160, 6])
+    parser.add_argument('--threads', type=int, default=0,
+                        help='threads for bgzf, 0 uses all cores')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 3, 6])
+    parser.add_argument('--output_dir', default=None,
+                        help='where to write, default is a temporary dir')
+    args = parser.parse_args()
+
+    global_settings.IO_THREADS = args.threads
+    volume = _synthetic_volume(args.shape)
+    raw_mb = volume.get_fdata(dtype=np.float32).nbytes / 1e6
+
+    output_dir = tempfile.mkdtemp(dir=args.output_dir)
+    log_file = os.path.join(output_dir, 'timelog.json')
+    runs = [('none', 0)] + [(codec, level) for codec in ('gzip', 'bgzf')
+                            for level in args.levels]
+
+    print('{0:6} {1:>5} {2:>9} {3:>10} {4:>9} {5:>9} {6:>7}'.format(
+          'codec', 'level', 'write s', 'write MB/s', 'read s', 'size MB',
+          'ratio'))
+    try:
+        for codec, level in runs:
+            start = time.time()
+            filename = save_volume(os.path.join(output_dir, 'bench.nii'),
+                                   volume, compression=codec,
+                                   compression_level=level,
+                                   log_file=log_file)
+            write_time = time.time() - start
+
+            start = time.time()
+            np.asanyarray(load_volume(filename, log_file=log_file).dataobj)
+            read_time = time.time() - start
+
+            size_mb = os.path.getsize(filename) / 1e6
+            print('{0:6} {1:>5} {2:>9.2f} {3:>10.1f} {4:>9.2f} {5:>9.1f} '
+                  '{6:>7.2f}'.format(codec, level, write_time,
+                                     raw_mb / write_time, read_time,
+                                     size_mb, raw_mb / size_mb))
+            os.remove(filename)
+    finally:
+        shutil.rmtree(output_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -141,6 +141,16 @@ jcc_args=(
 	"--include lib/commons-math3-3.5.jar"
 	"--include lib/Jama-mipav.jar"
 
+	# JVM heap statistics for nighres.profiling
+	"java.lang.Runtime"
+
+	# bulk array transfers between NumPy and Java (nighres.utils)
+	"java.nio.ByteBuffer"
+	"java.nio.ByteOrder"
+	"java.nio.FloatBuffer"
+	"java.nio.IntBuffer"
+	"java.nio.DoubleBuffer"
+
 	# Name the python module
 	"--python nighresjava"
 
@@ -14,6 +14,7 @@ an MGDM segmentation result with the following steps:
    :func:`nighres.cortex.cruise_cortex_extraction` [1]_
 4. Anatomical depth estimation trough
    :func:`nighres.laminar.volumetric_layering` [2]_
+5. The same steps chained in memory with :class:`nighres.pipeline.Pipeline`
 
 Important note: this example assumes you have run the tissue classification
 example first (example_tissue_classification.py)
@@ -177,6 +178,57 @@ if not skip_plots:
 
 #############################################################################
 
+#############################################################################
+# The same steps as a pipeline
+# -----------------------------
+# The steps above pass their results on through the files they save. With
+# :class:`nighres.pipeline.Pipeline`, the same chain runs with the outputs
+# passed on in memory: only the nodes added with ``save=True`` write their
+# results to disk. Nodes whose inputs are ready run at the same time, here
+# the surface meshing and inflation branch and the volumetric layering.
+pipeline = nighres.pipeline.Pipeline(
+                        output_dir=os.path.join(out_dir, 'pipeline'))
+
+region = pipeline.add('extract_brain_region',
+                        nighres.brain.extract_brain_region,
+                        segmentation=segmentation,
+                        levelset_boundary=boundary_dist,
+                        maximum_membership=max_probas,
+                        maximum_label=max_labels,
+                        extracted_region='left_cerebrum')
+
+reconstruction = pipeline.add('cruise_cortex_extraction',
+                        nighres.cortex.cruise_cortex_extraction,
+                        init_image=region['inside_mask'],
+                        wm_image=region['inside_proba'],
+                        gm_image=region['region_proba'],
+                        csf_image=region['background_proba'],
+                        normalize_probabilities=True)
+
+mesh = pipeline.add('levelset_to_mesh',
+                        nighres.surface.levelset_to_mesh,
+                        levelset_image=reconstruction['avg'])
+
+pipeline.add('surface_inflation', nighres.surface.surface_inflation,
+                        save=True,
+                        surface_mesh=mesh['result'],
+                        file_name="sub001_sess1_left_cerebrum.vtk")
+
+pipeline.add('volumetric_layering', nighres.laminar.volumetric_layering,
+                        save=True,
+                        inner_levelset=reconstruction['gwb'],
+                        outer_levelset=reconstruction['cgb'],
+                        n_layers=4,
+                        file_name="sub001_sess1_left_cerebrum")
+
+results = pipeline.run()
+
+############################################################################
+# The outputs of every node are returned by node name, and the time spent
+# in each of them is available from the pipeline
+for name, timing in pipeline.timings()['nodes'].items():
+    print('{0}: {1:.1f} s'.format(name, timing['duration']))
+
 #############################################################################
 # If the example is not run in a jupyter notebook, render the plots:
 if not skip_plots:
@@ -1,18 +1,18 @@
+import importlib
 import nighres.io
-import nighres.brain
-import nighres.cortex
-import nighres.data
-import nighres.filtering
-import nighres.intensity
-import nighres.laminar
-import nighres.microscopy
-import nighres.parcellation
-import nighres.registration
-import nighres.segmentation
-import nighres.shape
-import nighres.surface
-import nighres.statistics
 from nighres.global_settings import ATLAS_DIR, TOPOLOGY_LUT_DIR, DEFAULT_ATLAS
 
 __all__ = ['io', 'brain', 'cortex', 'data', 'filtering', 'intensity', 'laminar',
-'microscopy', 'parcellation', 'registration', 'segmentation', 'shape', 'surface', 'statistics', '__version__']
+'microscopy', 'parcellation', 'registration', 'segmentation', 'shape', 'surface', 'statistics', 'profiling', 'jvm', 'batch', 'pipeline', 'cache', 'tiling', '__version__']
+
+
+def __getattr__(name):
+    # subpackages are imported when first used, so that importing nighres
+    # does not load every module (and nighresjava)
+    if name in __all__ and name != '__version__':
+        return importlib.import_module('nighres.' + name)
+    raise AttributeError("module 'nighres' has no attribute {0!r}".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,41 @@
+import importlib
+import sys
+import types
+
+
+class _LazyPackage(types.ModuleType):
+    # Package whose functions are only imported, with their module and its
+    # dependencies (nighresjava, ...), when they are first used
+
+    def __getattr__(self, name):
+        functions = self.__dict__.get('_lazy_functions', {})
+        if name not in functions:
+            raise AttributeError("module {0!r} has no attribute "
+                                 "{1!r}".format(self.__name__, name))
+        module = importlib.import_module(functions[name], self.__name__)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        # the import system sets each loaded submodule as an attribute of its
+        # package, which must not hide the function of the same name (e.g.
+        # nighres.brain.mgdm_segmentation)
+        functions = self.__dict__.get('_lazy_functions', {})
+        if isinstance(value, types.ModuleType) and name in functions \
+                and value.__name__ == self.__name__ + functions[name]:
+            value = getattr(value, name)
+        super(_LazyPackage, self).__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(super(_LazyPackage, self).__dir__())
+                      | set(self.__dict__.get('_lazy_functions', {})))
+
+
+def lazy_functions(package, functions):
+    # Make the functions of a subpackage load on first use, functions maps
+    # each function name to its module relative to the package ('.massp')
+    module = sys.modules[package]
+    module._lazy_functions = dict(functions)
+    module.__all__ = list(functions)
+    module.__class__ = _LazyPackage
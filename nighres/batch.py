@@ -0,0 +1,187 @@
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import psutil
+from nighres import global_settings
+from nighres.io.io_timelog import flush_time_log
+from nighres.jvm import _heap_bytes
+
+
+def _worker_settings(**overrides):
+    # Global settings of this process to set in the workers, which are new
+    # processes importing the defaults from the environment, with the given
+    # values replaced
+    settings = {name: value for name, value in vars(global_settings).items()
+                if name.isupper()}
+    settings.update(overrides)
+    return settings
+
+
+def _init_worker(settings):
+    # Configure the JVM (and other global settings) of a worker process
+    # before it runs any task
+    for name, value in settings.items():
+        setattr(global_settings, name, value)
+
+
+def _run_task(func, kwargs):
+    # Run one task in a worker, returning its result or the error instead of
+    # raising it, so that one failing subject does not stop the batch
+    start = time.time()
+    try:
+        result = func(**kwargs)
+        error = None
+    except Exception as exc:
+        result = None
+        error = {'error': repr(exc), 'traceback': traceback.format_exc()}
+    # workers of a process pool exit without running atexit handlers
+    flush_time_log()
+    return result, error, start, time.time()
+
+
+def _worker_count(workers, mem_per_worker):
+    # Number of workers fitting the cores and, if the memory of each worker
+    # is given, the available memory
+    count = workers or os.cpu_count() or 1
+    if mem_per_worker is not None:
+        available = psutil.virtual_memory().available
+        fit = available // _heap_bytes(mem_per_worker, 1, available)
+        count = min(count, max(int(fit), 1))
+    return count
+
+
+def map(func, list_of_kwargs, workers=None, mem_per_worker=None,
+        threads_per_worker=None, progress=True):
+    """
+    Apply a nighres function to many inputs (e.g. subjects) in parallel
+    worker processes
+
+    Each worker process runs its own JVM, sized so that all workers fit in
+    the memory of the node, and its own Java threads, so that all workers
+    together use the available cores without oversubscribing them. A task
+    failing does not stop the others: its error is collected and reported.
+
+    Parameters
+    ----------
+    func: function
+        Function to apply, e.g. nighres.brain.mp2rage_skullstripping. It
+        must be importable from a module, as the workers are new Python
+        processes
+    list_of_kwargs: list of dict
+        Keyword arguments of each call of func
+    workers: int, optional
+        Number of worker processes (default is the number of cores, limited
+        by mem_per_worker)
+    mem_per_worker: str, optional
+        Maximum JVM heap of each worker, e.g. '8g' (see
+        :func:`nighres.jvm.start_jvm`). The number of workers is reduced to
+        fit the available memory. Default is an equal share of the available
+        memory for each worker
+    threads_per_worker: int, optional
+        Processors used by the Java code of each worker (default is the
+        number of cores divided by the number of workers)
+    progress: bool, optional
+        Print the progress and throughput of the batch (default is True)
+
+    Returns
+    ----------
+    dict
+        Dictionary collecting the outputs with the following keys:
+
+        * results (list): Output of func for each input, in the order of
+          list_of_kwargs, None for failed tasks
+        * failures (list): For each failed task, a dict with its index in
+          list_of_kwargs, kwargs, error and traceback
+        * report (dict): Number of tasks, completed and failed tasks, number
+          of workers, wall time and mean task time (s) and throughput
+          (completed tasks per hour)
+
+    Notes
+    ----------
+    The workers get the nighres.global_settings of the calling process,
+    with the JVM settings above. They are started with the 'spawn' method,
+    as forking a process running a JVM is unsafe: scripts calling this
+    function must do so under ``if __name__ == '__main__':``.
+
+    Examples
+    ----------
+    >>> subjects = [{'second_inversion': f, 'save_data': True,
+    ...              'output_dir': 'skullstripping'} for f in files]
+    >>> batch = nighres.batch.map(  # doctest: +SKIP
+    ...     nighres.brain.mp2rage_skullstripping, subjects, mem_per_worker='4g')
+    """
+    list_of_kwargs = list(list_of_kwargs)
+    if not callable(func):
+        raise ValueError("func must be a function, got {0}".format(func))
+
+    workers = min(_worker_count(workers, mem_per_worker),
+                  max(len(list_of_kwargs), 1))
+    if threads_per_worker is None:
+        threads_per_worker = max((os.cpu_count() or 1) // workers, 1)
+    # percentages of the available memory are shared between the workers
+    settings = _worker_settings(JVM_THREADS=threads_per_worker,
+                                JVM_PROCESSES=workers)
+    if mem_per_worker is not None:
+        settings['JVM_MAX_HEAP'] = mem_per_worker
+
+    results = [None] * len(list_of_kwargs)
+    failures = []
+    durations = []
+    start = time.time()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(settings,)) as pool:
+        futures = {pool.submit(_run_task, func, kwargs): index
+                   for index, kwargs in enumerate(list_of_kwargs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            try:
+                result, error, task_start, task_end = future.result()
+                durations.append(task_end - task_start)
+            except Exception as exc:
+                # the worker itself died (e.g. killed when out of memory)
+                result = None
+                error = {'error': repr(exc), 'traceback': None}
+            if error is None:
+                results[index] = result
+            else:
+                error.update(index=index, kwargs=list_of_kwargs[index])
+                failures.append(error)
+            if progress:
+                _print_progress(func, done, len(list_of_kwargs),
+                                len(failures), time.time() - start, error)
+
+    wall = time.time() - start
+    completed = len(list_of_kwargs) - len(failures)
+    report = {'tasks': len(list_of_kwargs),
+              'completed': completed,
+              'failed': len(failures), 'workers': workers,
+              'threads_per_worker': threads_per_worker,
+              'mem_per_worker': mem_per_worker, 'wall': wall,
+              'mean_task': sum(durations) / len(durations)
+              if durations else None,
+              'throughput': 3600.0 * completed / wall
+              if wall > 0 else None}
+    if progress:
+        print("\n{0}: {1} of {2} tasks completed in {3:.1f} s on {4} "
+              "workers".format(func.__name__, report['completed'],
+                               report['tasks'], wall, workers))
+        for failure in failures:
+            print("  task {0} failed: {1}".format(failure['index'],
+                                                 failure['error']))
+        sys.stdout.flush()
+    return {'results': results, 'failures': failures, 'report': report}
+
+
+def _print_progress(func, done, total, failed, elapsed, error):
+    rate = done / elapsed if elapsed > 0 else 0.0
+    remaining = (total - done) / rate if rate > 0 else 0.0
+    print("{0}: {1}/{2} done, {3} failed, {4:.1f} tasks/h, about {5:.0f} s "
+          "left{6}".format(func.__name__, done, total, failed, 3600.0*rate,
+                           remaining, '' if error is None else
+                           ' (last failed: {0})'.format(error['error'])))
+    sys.stdout.flush()
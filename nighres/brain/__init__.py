@@ -1,7 +1,11 @@
-from nighres.brain.extract_brain_region import extract_brain_region
-from nighres.brain.filter_stacking import filter_stacking
-from nighres.brain.intensity_based_skullstripping import intensity_based_skullstripping
-from nighres.brain.mgdm_segmentation import mgdm_segmentation
-from nighres.brain.mp2rage_dura_estimation import mp2rage_dura_estimation
-from nighres.brain.mp2rage_skullstripping import mp2rage_skullstripping
-from nighres.brain.dots_segmentation import dots_segmentation
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'extract_brain_region': '.extract_brain_region',
+    'filter_stacking': '.filter_stacking',
+    'intensity_based_skullstripping': '.intensity_based_skullstripping',
+    'mgdm_segmentation': '.mgdm_segmentation',
+    'mp2rage_dura_estimation': '.mp2rage_dura_estimation',
+    'mp2rage_skullstripping': '.mp2rage_skullstripping',
+    'dots_segmentation': '.dots_segmentation'})
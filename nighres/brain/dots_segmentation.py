@@ -3,6 +3,8 @@ import time
 import numpy as np
 import nibabel as nb
 from ..io import load_volume, save_volume
+from ..profiling import profiled
+from ..cache import cached, _is_cached
 from ..utils import _output_dir_4saving, _fname_4saving
 
 
@@ -64,265 +66,308 @@ tract_pair_sets_2 = [{2, 4}, {3, 4}, {2, 6}, {3, 6}, {4, 6}, {4, 7}, {5, 7},
                      {40, 18}, {40, 20}, {40, 27}]
 
 
-def _theta(v_1, v_2):
-    # Return angle between vectors v_1 and v_2 normalized to be in [0,1]
-    angle = (2/np.pi) * np.arccos(np.abs(np.dot(v_1, v_2)))
-    return angle
-
-
-def _calc_s_T(i, j, k, a, b, c, evecs, v_xy):
-    # Return connectivity between voxels i,j,k and a,b,c assuming a single 
-    # tract (Eq 5)
-    s_T = (1 - np.nanmin([_theta(evecs[i,j,k,:,0], v_xy[a-i+1,b-j+1,c-k+1,:]),
-           _theta(evecs[a,b,c,:,0], v_xy[a-i+1,b-j+1,c-k+1,:])])) * \
-          (1 - 2*_theta(evecs[i,j,k,:,0], evecs[a,b,c,:,0]))
-    return s_T
-
-    
-def _calc_s_O(i, j, k, a, b, c, evals, evecs, v_xy):
-    # Return connectivity between voxels i,j,k and a,b,c assuming
-    # overlapping tracts (Eq 6)
-    temp = np.zeros((4,2,3))
-    temp[0,0,:] = evecs[i,j,k,:,0]
-    temp[0,1,:] = evecs[a,b,c,:,0]
-    temp[1,0,:] = evals[i,j,k,1] / evals[i,j,k,0] * evecs[i,j,k,:,1]
-    temp[1,1,:] = evecs[a,b,c,:,0]
-    temp[2,0,:] = evecs[i,j,k,:,0]
-    temp[2,1,:] = evals[a,b,c,1] / evals[a,b,c,0] * evecs[a,b,c,:,1]
-    temp[3,0,:] = evals[i,j,k,1] / evals[i,j,k,0] * evecs[i,j,k,:,1]
-    temp[3,1,:] = evals[a,b,c,1] / evals[a,b,c,0] * evecs[a,b,c,:,1]
-    vals = np.zeros(4)
-    for x in range(4):
-        vals[x] = _theta(temp[x,0,:], temp[x,1,:])
-    v_O = temp[np.nanargmin(vals),:,:]
-    s_O = (1 - np.nanmin([_theta(v_O[0,:], v_xy[a-i+1,b-j+1,c-k+1,:]),
-          _theta(v_O[1,:], v_xy[a-i+1,b-j+1,c-k+1,:])])) * \
-          (1 - 2*_theta(v_O[0,:], v_O[1,:]))
-    return s_O
-
-
-def _half_pos_nhood(i, j, k, evecs, v_xy):
-    # Return half-neighborhood where dot product between principal diffusion
-    # direction of voxel i,j,k and the direction between neighboring voxels
-    # is positive
-    pos_indices = []
-    for a in range(3):
-        for b in range(3):
-            for c in range(3):
-                if np.dot(evecs[i,j,k,:,0], v_xy[a,b,c]) > 0:
-                    pos_indices.append(np.array([a,b,c]))
-    return np.array(pos_indices) + [i,j,k] - [1,1,1]
+def _dot(v_1, v_2):
+    # Dot products of arrays of vectors along the last axis, as a batched
+    # matrix product which is rounded like np.dot
+    return np.matmul(v_1[...,np.newaxis,:], v_2[...,:,np.newaxis])[...,0,0]
 
 
-def _half_neg_nhood(i, j, k, evecs, v_xy):
-    # Return half-neighborhood where dot product between principal diffusion
-    # direction of voxel i,j,k and the direction between neighboring voxels
-    # is negative
-    neg_indices = []
+def _theta(v_1, v_2):
+    # Return angles between arrays of vectors along the last axis normalized
+    # to be in [0,1]
+    return (2/np.pi) * np.arccos(np.abs(_dot(v_1, v_2)))
+
+
+def _neighbor_connectivity(evals, evecs, brain_mask, v_xy):
+    # Return x plus and x minus (neighbors maximizing the connectivity in the
+    # positive and negative half-neighborhoods of the principal diffusion
+    # direction) for s_T and s_O, and the corresponding connectivities
+    # (Eqs 5, 6), for voxels of the mask away from the volume border. All
+    # voxels are processed at once for each of the 26 neighbor directions,
+    # which are visited in the same order as a per voxel search so that ties
+    # are resolved identically. Voxels without neighbors in a
+    # half-neighborhood get themselves as neighbor and a connectivity of 0.
+    inside = np.zeros(brain_mask.shape, dtype=bool)
+    inside[1:-1,1:-1,1:-1] = brain_mask[1:-1,1:-1,1:-1]
+    voxels = np.argwhere(inside)
+    n_vox = voxels.shape[0]
+    vec_1 = evecs[inside][:,:,0]
+    vec_2 = (evals[inside][:,1] / evals[inside][:,0])[:,np.newaxis] * \
+            evecs[inside][:,:,1]
+
+    x = {key: voxels.copy() for key in ('p_T', 'm_T', 'p_O', 'm_O')}
+    s = {key: np.full(n_vox, -np.inf) for key in x}
     for a in range(3):
         for b in range(3):
             for c in range(3):
-                if np.dot(evecs[i,j,k,:,0], v_xy[a,b,c]) < 0:
-                    neg_indices.append(np.array([a,b,c]))         
-    return np.array(neg_indices) + [i,j,k] - [1,1,1]
-
-
-def _calc_x_plus_s_T(i,j,k,evecs,v_xy):
-    # Return x plus for s_T
-    pos_indices = _half_pos_nhood(i,j,k,evecs,v_xy)
-    max_s_T = -np.inf
-    for idx in pos_indices:
-        temp_s_T = _calc_s_T(i,j,k,idx[0],idx[1],idx[2],evecs,v_xy)
-        if temp_s_T > max_s_T:
-            max_s_T = temp_s_T
-            argmax = idx
-    return argmax, max_s_T
-
-
-def _calc_x_minus_s_T(i,j,k,evecs,v_xy):
-    # Return x minus for s_T
-    neg_indices = _half_neg_nhood(i,j,k,evecs,v_xy)
-    max_s_T = -np.inf
-    for idx in neg_indices:
-        temp_s_T = _calc_s_T(i,j,k,idx[0],idx[1],idx[2],evecs,v_xy)
-        if temp_s_T > max_s_T:
-            max_s_T = temp_s_T
-            argmax = idx
-    return argmax, max_s_T
-
-
-def _calc_x_plus_s_O(i,j,k,evals,evecs,v_xy):
-    # Return x plus for s_O
-    pos_indices = _half_pos_nhood(i,j,k,evecs,v_xy)
-    max_s_O = -np.inf
-    for idx in pos_indices:
-        temp_s_O = _calc_s_O(i,j,k,idx[0],idx[1],idx[2],evals,evecs,v_xy)
-        if temp_s_O > max_s_O:
-            max_s_O = temp_s_O
-            argmax = idx
-    return argmax, max_s_O
-
-
-def _calc_x_minus_s_O(i,j,k,evals,evecs,v_xy):
-    # Return x minus for s_O
-    neg_indices = _half_neg_nhood(i,j,k,evecs,v_xy)
-    max_s_O = -np.inf
-    for idx in neg_indices:
-        temp_s_O = _calc_s_O(i,j,k,idx[0],idx[1],idx[2],evals,evecs,v_xy)
-        if temp_s_O > max_s_O:
-            max_s_O = temp_s_O
-            argmax = idx
-    return argmax, max_s_O
-
-
-def _calc_c_l(i, j, k, l, m, evecs, fiber_dir, c_C):
-    # Return direction index (Eqs 8, 9)
-    if m == None:
-        c_l = np.linalg.norm(fiber_dir[i,j,k,:,l]) * (1 - c_C *
-              _theta(evecs[i,j,k,:,0], fiber_dir[i,j,k,:,l] /
-              np.linalg.norm(fiber_dir[i,j,k,:,l])))
-    else:
-        comp_dir = np.stack((fiber_dir[i,j,k,:,l] + fiber_dir[i,j,k,:,m],
-                             fiber_dir[i,j,k,:,l] - fiber_dir[i,j,k,:,m]))
-        comp_dir = comp_dir[np.argmax(np.linalg.norm(comp_dir, axis=1)),:]
-        comp_dir = (comp_dir / np.linalg.norm(comp_dir) * 
-                    (np.linalg.norm(fiber_dir[i,j,k,:,l]) +
-                     np.linalg.norm(fiber_dir[i,j,k,:,m])) / 2)
-        c_l = np.linalg.norm(comp_dir) * (1 - c_C * 
-              _theta(evecs[i,j,k,:,0], comp_dir /
-              np.linalg.norm(comp_dir)))
-    return c_l
-
-
-def _calc_V1(d_T, d_O, d_I, u_l, u_lm, c_l, c_lm, c_I, fiber_p, 
-             tract_pair_sets, N_t, N_o, brain_mask):
-    # Return energy using the unary term only (Eq 11)
-    xs, ys, zs = d_T.shape
-    MRF_V1 = np.zeros((xs, ys, zs, N_t + N_o))
+                if (a,b,c) == (1,1,1):
+                    continue
+                v = v_xy[a,b,c,:]
+                nbr = voxels + [a-1, b-1, c-1]
+                nbr_evals = evals[nbr[:,0],nbr[:,1],nbr[:,2]]
+                nbr_evecs = evecs[nbr[:,0],nbr[:,1],nbr[:,2]]
+                nbr_1 = nbr_evecs[:,:,0]
+                nbr_2 = (nbr_evals[:,1] / nbr_evals[:,0])[:,np.newaxis] * \
+                        nbr_evecs[:,:,1]
+
+                # Connectivity assuming a single tract (Eq 5)
+                s_T = (1 - np.fmin(_theta(vec_1, v),
+                                   _theta(nbr_1, v))) * \
+                      (1 - 2*_theta(vec_1, nbr_1))
+
+                # Connectivity assuming overlapping tracts (Eq 6), along the
+                # pair of directions with the smallest angle
+                pairs = [(vec_1, nbr_1), (vec_2, nbr_1), (vec_1, nbr_2),
+                         (vec_2, nbr_2)]
+                angles = np.stack([_theta(v_1, v_2)
+                                   for v_1, v_2 in pairs], axis=1)
+                best = np.argmin(np.where(np.isnan(angles), np.inf, angles),
+                                 axis=1)
+                v_O_1 = np.where((best % 2 == 0)[:,np.newaxis], vec_1, vec_2)
+                v_O_2 = np.where((best < 2)[:,np.newaxis], nbr_1, nbr_2)
+                s_O = (1 - np.fmin(_theta(v_O_1, v),
+                                   _theta(v_O_2, v))) * \
+                      (1 - 2*_theta(v_O_1, v_O_2))
+
+                direction = _dot(vec_1, v)
+                for side, half in (('p', direction > 0), ('m', direction < 0)):
+                    for key, s_new in (('T', s_T), ('O', s_O)):
+                        update = half & (s_new > s[side+'_'+key])
+                        s[side+'_'+key][update] = s_new[update]
+                        x[side+'_'+key][update] = nbr[update]
+
+    xs, ys, zs = brain_mask.shape
+    x_vol = {key: np.zeros((xs, ys, zs, 3), dtype=int) for key in x}
+    s_vol = {key: np.zeros((xs, ys, zs)) for key in s}
+    for key in x:
+        s[key][np.isneginf(s[key])] = 0
+        x_vol[key][inside] = x[key]
+        s_vol[key][inside] = s[key]
+    return x_vol, s_vol
+
+
+def _norm(v):
+    # Norms of an array of vectors along the last axis, rounded like
+    # np.linalg.norm of each vector
+    return np.sqrt(_dot(v, v))
+
+
+def _tract_coefficient(vec, fiber_dir, c_C):
+    # Return direction index of tracts with atlas directions fiber_dir for
+    # voxels with principal diffusion directions vec (Eq 8)
+    norm = _norm(fiber_dir)
+    return norm * (1 - c_C * _theta(vec, fiber_dir /
+                                    norm[:,np.newaxis]))
+
+
+def _pair_coefficient(vec, fiber_dir_l, fiber_dir_m, c_C):
+    # Return direction index of overlapping tracts (Eq 9), using the sum or
+    # the difference of their directions, whichever is longer
+    comp_dirs = np.stack((fiber_dir_l + fiber_dir_m,
+                          fiber_dir_l - fiber_dir_m), axis=1)
+    longest = np.argmax(np.sqrt(np.sum(comp_dirs*comp_dirs, axis=2)), axis=1)
+    comp_dir = comp_dirs[np.arange(comp_dirs.shape[0]),longest,:]
+    comp_dir = (comp_dir / _norm(comp_dir)[:,np.newaxis] *
+                (_norm(fiber_dir_l) + _norm(fiber_dir_m))[:,np.newaxis] / 2)
+    return _tract_coefficient(vec, comp_dir, c_C)
+
+
+def _direction_coefficients(vec, p, fiber_dir, pairs, N_t, c_C):
+    # Return direction indices c_l and c_lm (Eqs 8, 9) of voxels with
+    # principal diffusion directions vec, atlas priors p and atlas
+    # directions fiber_dir, where the priors of the tract (or both tracts of
+    # the pair) are nonzero, nan elsewhere. They are computed as arrays of
+    # (voxel, tract) and (voxel, pair) entries.
+    nonzero = p != 0
+    c_l = np.full((p.shape[0], N_t), np.nan)
+    c_lm = np.full((p.shape[0], pairs.shape[0]), np.nan)
+
+    v, l = np.nonzero(nonzero[:,1:N_t])
+    l = l + 1
+    c_l[v,l] = _tract_coefficient(vec[v], fiber_dir[v,:,l], c_C)
+
+    v, q = np.nonzero(nonzero[:,pairs[:,0]] & nonzero[:,pairs[:,1]])
+    c_lm[v,q] = _pair_coefficient(vec[v], fiber_dir[v,:,pairs[q,0]],
+                                  fiber_dir[v,:,pairs[q,1]], c_C)
+    return c_l, c_lm
+
+
+def _tensor_eigen(tensor_volume, brain_mask):
+    # Return eigenvalues of the diffusion tensors in decreasing order and the
+    # corresponding eigenvectors (as columns), for voxels in the mask only
+    # (zero elsewhere). The tensors are symmetric, so a batched symmetric
+    # solver gives real eigenpairs already sorted (in increasing order).
+    xs, ys, zs, _ = tensor_volume.shape
+    coeffs = tensor_volume[brain_mask][:,:6]
+    coeffs = np.where(np.isnan(coeffs), 0, coeffs)
+    tensors = np.empty((coeffs.shape[0], 3, 3))
+    for n, (a, b) in enumerate([(0,0), (1,1), (2,2), (0,1), (0,2), (1,2)]):
+        tensors[:,a,b] = coeffs[:,n]
+        tensors[:,b,a] = coeffs[:,n]
+    vals, vecs = np.linalg.eigh(tensors)
+    evals = np.zeros((xs, ys, zs, 3))
+    evecs = np.zeros((xs, ys, zs, 3, 3))
+    evals[brain_mask] = vals[:,::-1]
+    evecs[brain_mask] = vecs[:,:,::-1]
+    return evals, evecs
+
+
+def _fractional_anisotropy(tensor_volume):
+    # Return FA of the diffusion tensors. With R = D / trace(D), trace(R R)
+    # is the sum of the squared coefficients of D divided by trace(D)^2.
+    coeffs = tensor_volume[:,:,:,:6]
+    coeffs = np.where(np.isnan(coeffs), 0, coeffs)
+    trace = coeffs[:,:,:,0] + coeffs[:,:,:,1] + coeffs[:,:,:,2]
+    squares = np.sum(coeffs[:,:,:,:3]**2, axis=3) + \
+              2*np.sum(coeffs[:,:,:,3:]**2, axis=3)
+    FA = np.sqrt(0.5 * (3 - trace**2 / squares))
+    FA[np.isnan(FA) | (trace == 0)] = 0
+    return FA
+
+
+def _diffusion_types(evals, brain_mask):
+    # Return diffusion type indices d_T, d_O, d_I computed for voxels in the
+    # mask only (nan for d_T and d_O and 1 for d_I elsewhere)
+    lambdas = evals[brain_mask]
+    d_T = np.full(brain_mask.shape, np.nan)
+    d_O = np.full(brain_mask.shape, np.nan)
+    d_I = np.ones(brain_mask.shape)
+    d_T[brain_mask] = (lambdas[:,0] - lambdas[:,1]) / lambdas[:,0]
+    d_O[brain_mask] = (lambdas[:,0] - lambdas[:,2]) / lambdas[:,0]
+    d_I[brain_mask] = lambdas[:,2] / lambdas[:,0]
+    return d_T, d_O, d_I
+
+
+def _calc_V1(d_T, d_O, d_I, evecs, fiber_p, fiber_dir, c_I, c_O, c_C,
+             tract_pair_sets, N_t, N_o, brain_mask, chunk_size=2**16):
+    # Return energy using the unary term only (Eq 11) for the voxels of the
+    # mask, as a float32 array with a row per voxel plus a last row of zeros
+    # standing for all voxels outside of the mask. The shape priors u_l,
+    # u_lm and direction coefficients c_l, c_lm are computed for chunks of
+    # voxels at a time, to bound memory use.
     print('Calculating V1')
-    for i in range(xs):
-        print(str(np.round((i / xs)*100, 0)) + ' %', end="\r")
-        for j in range(ys):
-            for k in range(zs):
-                if brain_mask[i,j,k]:
-                        
-                    # Calculate isotropic energy
-                    MRF_V1[i,j,k,0] = c_I * d_I[i,j,k] * u_l[i,j,k,0]
-                        
-                    # Calculate individual tract energies
-                    for idx in range(1,N_t):
-                        l = idx
-                        if fiber_p[i,j,k,l] == 0:
-                            MRF_V1[i,j,k,idx] = np.nan
-                        else:
-                            MRF_V1[i,j,k,idx] = d_T[i,j,k] * u_l[i,j,k,l] * \
-                                                c_l[i,j,k,l]
-
-                    # Calculate overlapping tract energies
-                    for idx in range(N_t,N_t+N_o):
-                        l,m = tract_pair_sets[idx - N_t]
-                        if fiber_p[i,j,k,l] == 0 or fiber_p[i,j,k,m] == 0:
-                            MRF_V1[i,j,k,idx] = np.nan
-                        else:
-                            MRF_V1[i,j,k,idx] = d_O[i,j,k] * \
-                                                u_lm[i,j,k,idx-N_t] * \
-                                                c_lm[i,j,k,idx-N_t]
+    pairs = np.array([list(pair) for pair in tract_pair_sets])
+    voxels = np.argwhere(brain_mask)
+    MRF_V1 = np.zeros((voxels.shape[0] + 1, N_t + N_o), dtype=np.float32)
+    for start in range(0, voxels.shape[0], chunk_size):
+        i, j, k = voxels[start:start+chunk_size].T
+        p = fiber_p[i,j,k]
+        V1 = MRF_V1[start:start+len(i)]
+
+        # Calculate shape priors, only ROIs where p != 0 are of interest
+        p_sum = np.nansum(p, axis=1)[:,np.newaxis]
+        u_l = p**2 / p_sum
+        u_l[:,1] *= c_O # Scale by weight parameter
+        u_lm = p[:,pairs[:,0]]*p[:,pairs[:,1]]*(p[:,pairs[:,0]]
+               + p[:,pairs[:,1]]) / p_sum
+        u_l[u_l == 0] = np.nan
+        u_lm[u_lm == 0] = np.nan
+
+        # Calculate direction coefficients
+        c_l, c_lm = _direction_coefficients(evecs[i,j,k,:,0], p,
+                                            fiber_dir[i,j,k], pairs, N_t,
+                                            c_C)
+
+        # Calculate isotropic energy
+        V1[:,0] = c_I * d_I[i,j,k] * u_l[:,0]
+
+        # Calculate individual tract energies
+        V1[:,1:N_t] = d_T[i,j,k][:,np.newaxis] * u_l[:,1:N_t] * c_l[:,1:N_t]
+        V1[:,1:N_t][p[:,1:N_t] == 0] = np.nan
+
+        # Calculate overlapping tract energies
+        V1[:,N_t:] = d_O[i,j,k][:,np.newaxis] * u_lm * c_lm
+        V1[:,N_t:][(p[:,pairs[:,0]] == 0) | (p[:,pairs[:,1]] == 0)] = np.nan
     return MRF_V1
-            
-
-def _calc_U(prev_iter_U, d_T, d_O, d_I, u_l, u_lm, c_l, c_lm, c_I, fiber_p, 
-            tract_pair_sets, s_I, s_T_x_p, s_T_x_m, s_O_x_m, s_O_x_p, 
-            brain_mask, N_t, N_o, x_m_s_T, x_p_s_T, x_m_s_O, x_p_s_O):
-    # Return total energy (Eq 12)
-    tract_pair_array = np.array([list(i) for i in tract_pair_sets])
-    xs, ys, zs = d_T.shape
-    curr_U = np.zeros((xs, ys, zs, N_t + N_o))
-    
-    for i in range(xs):
-        print(str(np.round((i / xs)*100, 0)) +   ' %', end="\r")
-        for j in range(ys):
-            for k in range(zs):
-                if brain_mask[i,j,k]:
-                    
-                    # Check isotropic energy
-                    curr_U[i,j,k,0] = c_I * d_I[i,j,k] * u_l[i,j,k,0] + \
-                                      (s_I * (np.nansum(prev_iter_U[i-1:i+2,
-                                       j-1:j+2,k-1:k+2,0]) - prev_iter_U[i,j,
-                                       k,0]) / 26)
-                    
-                    
-                    # Check individual tract energy
-                    for l in range(1,N_t):
-                        if fiber_p[i,j,k,l] == 0:
-                            curr_U[i,j,k,l] = np.nan
-                        else:
-                            idx = np.concatenate(([l], np.where(np.any(
-                                                 tract_pair_array
-                                                 == l, axis=1))[0]+N_t))
-                            curr_U[i,j,k,l] = d_T[i,j,k] * u_l[i,j,k,l] * \
-                                              c_l[i,j,k,l] + \
-                                              0.5 * (s_T_x_p[i,j,k] * 
-                                              np.nanmax(prev_iter_U[
-                                                        x_p_s_T[i,j,k,0],
-                                                        x_p_s_T[i,j,k,1],
-                                                        x_p_s_T[i,j,k,2],
-                                                        idx])) + \
-                                              0.5 * (s_T_x_m[i,j,k] * 
-                                              np.nanmax(prev_iter_U[
-                                                        x_m_s_T[i,j,k,0],
-                                                        x_m_s_T[i,j,k,1],
-                                                        x_m_s_T[i,j,k,2],
-                                                        idx]))
-                                                
-                    # Check overlapping tract energy
-                    for idx in range(N_t,N_t+N_o):
-                        l,m = tract_pair_sets[idx-N_t]
-                        if fiber_p[i,j,k,l] == 0 or fiber_p[i,j,k,m] == 0:
-                            curr_U[i,j,k,idx] = np.nan
-                        else:
-                            curr_U[i,j,k,idx] = d_O[i,j,k] * \
-                                                u_lm[i,j,k,idx-N_t] * \
-                                                c_lm[i,j,k,idx-N_t] + \
-                                                0.5 * (s_O_x_p[i,j,k] *
-                                                np.nanmax([prev_iter_U[
-                                                           x_p_s_O[i,j,k,0],
-                                                           x_p_s_O[i,j,k,1],
-                                                           x_p_s_O[i,j,k,2],
-                                                           idx],
-                                                           prev_iter_U[
-                                                           x_p_s_O[i,j,k,0],
-                                                           x_p_s_O[i,j,k,1],
-                                                           x_p_s_O[i,j,k,2],
-                                                           l],
-                                                           prev_iter_U[
-                                                           x_p_s_O[i,j,k,0],
-                                                           x_p_s_O[i,j,k,1],
-                                                           x_p_s_O[i,j,k,2],
-                                                           m]])) + \
-                                               0.5 * (s_O_x_m[i,j,k] *
-                                               np.nanmax([prev_iter_U[
-                                                          x_m_s_O[i,j,k,0],
-                                                          x_m_s_O[i,j,k,1],
-                                                          x_m_s_O[i,j,k,2],
-                                                          idx],
-                                                          prev_iter_U[
-                                                          x_m_s_O[i,j,k,0],
-                                                          x_m_s_O[i,j,k,1],
-                                                          x_m_s_O[i,j,k,2],
-                                                          l],
-                                                          prev_iter_U[
-                                                          x_m_s_O[i,j,k,0],
-                                                          x_m_s_O[i,j,k,1],
-                                                          x_m_s_O[i,j,k,2],
-                                                          m]]))
+
+
+def _mrf_neighbors(brain_mask, tract_pair_sets, N_t, s_T_x_p, s_T_x_m,
+                   s_O_x_m, s_O_x_p, x_m_s_T, x_p_s_T, x_m_s_O, x_p_s_O):
+    # Precompute, for the voxels of the mask, what the iterations of
+    # _calc_U use: the rows of their x plus and x minus neighbors and of
+    # their 26-neighborhood in the energy arrays (the last row for voxels
+    # outside of the mask), the connectivities, and for each tract the
+    # labels involving it (the tract and its pairs)
+    shape = brain_mask.shape
+    coords = np.argwhere(brain_mask)
+    n_vox = coords.shape[0]
+    rows = np.full(shape, n_vox, dtype=np.intp)
+    rows[brain_mask] = np.arange(n_vox)
+
+    interior = np.all((coords >= 1) & (coords <= np.array(shape) - 2),
+                      axis=1)
+    offsets = np.array([[a, b, c] for a in range(-1, 2)
+                        for b in range(-1, 2) for c in range(-1, 2)])
+    nhood = coords[interior][:,np.newaxis,:] + offsets
+    nhood = rows[nhood[:,:,0],nhood[:,:,1],nhood[:,:,2]]
+    # neighborhoods cut by the volume border, sliced as the volume would be
+    border = [(n, rows[i-1:i+2,j-1:j+2,k-1:k+2].ravel())
+              for n, (i, j, k) in zip(np.flatnonzero(~interior),
+                                      coords[~interior])]
+
+    def neighbor_rows(x):
+        x = x[brain_mask]
+        return rows[x[:,0],x[:,1],x[:,2]]
+
+    tract_pair_array = np.array([list(pair) for pair in tract_pair_sets])
+    tract_labels = [np.concatenate(([l], np.where(np.any(
+                        tract_pair_array == l, axis=1))[0]+N_t))
+                    for l in range(N_t)]
+    return {'interior': interior, 'nhood': nhood, 'border': border,
+            'x_p_T': neighbor_rows(x_p_s_T), 'x_m_T': neighbor_rows(x_m_s_T),
+            'x_p_O': neighbor_rows(x_p_s_O), 'x_m_O': neighbor_rows(x_m_s_O),
+            's_T_p': s_T_x_p[brain_mask].astype(np.float32),
+            's_T_m': s_T_x_m[brain_mask].astype(np.float32),
+            's_O_p': s_O_x_p[brain_mask].astype(np.float32),
+            's_O_m': s_O_x_m[brain_mask].astype(np.float32),
+            'pairs': tract_pair_array, 'tract_labels': tract_labels}
+
+
+def _calc_U(prev_iter_U, MRF_V1, s_I, neighbors, N_t, N_o):
+    # Return total energy (Eq 12) in the layout of MRF_V1: the unary energy
+    # plus the neighbor energies of the previous iteration, for all voxels
+    # of the mask at once (nan labels stay nan). Maxima ignore nan as
+    # np.nanmax, sums are computed like np.nansum on each neighborhood.
+    prev = prev_iter_U
+    curr_U = np.copy(MRF_V1)
+    n_vox = curr_U.shape[0] - 1
+    curr = curr_U[:n_vox]
+
+    # Check isotropic energy
+    nhood_sum = np.zeros(n_vox, dtype=curr_U.dtype)
+    nhood_sum[neighbors['interior']] = np.nansum(prev[neighbors['nhood'],0],
+                                                 axis=1)
+    for n, nhood in neighbors['border']:
+        nhood_sum[n] = np.nansum(prev[nhood,0])
+    curr[:,0] = curr[:,0] + (s_I * (nhood_sum - prev[:n_vox,0]) / 26)
+
+    # Check individual tract energy
+    x_p, x_m = neighbors['x_p_T'], neighbors['x_m_T']
+    for l in range(1, N_t):
+        labels = neighbors['tract_labels'][l]
+        curr[:,l] = curr[:,l] + \
+                    0.5 * (neighbors['s_T_p'] * np.fmax.reduce(
+                           prev[x_p[:,np.newaxis],labels], axis=1)) + \
+                    0.5 * (neighbors['s_T_m'] * np.fmax.reduce(
+                           prev[x_m[:,np.newaxis],labels], axis=1))
+
+    # Check overlapping tract energy
+    x_p, x_m = neighbors['x_p_O'], neighbors['x_m_O']
+    for idx in range(N_t, N_t + N_o):
+        l, m = neighbors['pairs'][idx-N_t]
+        curr[:,idx] = curr[:,idx] + \
+                      0.5 * (neighbors['s_O_p'] * np.fmax(np.fmax(
+                             prev[x_p,idx], prev[x_p,l]), prev[x_p,m])) + \
+                      0.5 * (neighbors['s_O_m'] * np.fmax(np.fmax(
+                             prev[x_m,idx], prev[x_m,l]), prev[x_m,m]))
     return curr_U
 
 
 def _calc_segmentation(U):
-    # Return hard segmentation based on MRF energy U  
+    # Return hard segmentation based on MRF energy U (labels on last axis)
     U_temp = np.copy(U)
     U_temp[np.isnan(U_temp)] = -np.inf
-    segmentation = np.argmax(U_temp, axis = 3)
+    segmentation = np.argmax(U_temp, axis = -1)
     return segmentation
 
 
@@ -338,11 +383,13 @@ def calc_posterior_probability(l, U, wm_atlas, g0 = None):
         g0 = N_t
     idx = np.concatenate(([l], np.where(np.any(tract_pair_array 
                                                == l, axis=1))[0]+N_t))
-    posterior_l = (np.nansum(np.exp(g0*U[:,:,:,idx]), axis=3) /
-                   np.nansum(np.exp(g0*U),axis=3))
+    posterior_l = (np.nansum(np.exp(g0*U[...,idx]), axis=-1) /
+                   np.nansum(np.exp(g0*U),axis=-1))
     return posterior_l
     
 
+@profiled
+@cached
 def dots_segmentation(tensor_image, mask, atlas_dir, wm_atlas = 1, 
                       max_iter = 25, convergence_threshold = 0.005, s_I = 1/42, 
                       c_O = 0.5, max_angle = 67.5, save_data = False, 
@@ -404,7 +451,8 @@ def dots_segmentation(tensor_image, mask, atlas_dir, wm_atlas = 1,
         
     Notes
     ----------
-    Algorithm details can be found in the references below.
+    Algorithm details can be found in the references below. The MRF
+    energies are stored in single precision for the voxels of the mask only.
 
     References
     ----------
@@ -433,7 +481,7 @@ def dots_segmentation(tensor_image, mask, atlas_dir, wm_atlas = 1,
                                    suffix='dots-proba'))
 
         if overwrite is False \
-            and os.path.isfile(seg_file) and os.path.isfile(proba_file) :
+            and _is_cached(seg_file) and _is_cached(proba_file) :
                 print("skip computation (use existing results)")
                 output = {'segmentation': seg_file,
                           'posterior': proba_file}
@@ -479,7 +527,8 @@ def dots_segmentation(tensor_image, mask, atlas_dir, wm_atlas = 1,
     
     
     # Load tensor image
-    tensor_volume = load_volume(tensor_image).get_data()
+    tensor_img = load_volume(tensor_image)
+    tensor_volume = tensor_img.get_data()
     
     
     # Load brain mask
@@ -488,37 +537,15 @@ def dots_segmentation(tensor_image, mask, atlas_dir, wm_atlas = 1,
     
     # Get dimensions of diffusion data
     xs, ys, zs, _ = tensor_volume.shape
-    DWI_affine = load_volume(tensor_image).affine
+    DWI_affine = tensor_img.affine
     
     
     # Calculate diffusion tensor eigenvalues and eigenvectors
-    tenfit = np.zeros((xs, ys, zs, 3, 3))
-    tenfit[:,:,:,0,0] = tensor_volume[:,:,:,0]
-    tenfit[:,:,:,1,1] = tensor_volume[:,:,:,1]
-    tenfit[:,:,:,2,2] = tensor_volume[:,:,:,2]
-    tenfit[:,:,:,0,1] = tensor_volume[:,:,:,3]
-    tenfit[:,:,:,1,0] = tensor_volume[:,:,:,3]
-    tenfit[:,:,:,0,2] = tensor_volume[:,:,:,4]
-    tenfit[:,:,:,2,0] = tensor_volume[:,:,:,4]
-    tenfit[:,:,:,1,2] = tensor_volume[:,:,:,5]
-    tenfit[:,:,:,2,1] = tensor_volume[:,:,:,5]
-    tenfit[np.isnan(tenfit)] = 0
-    evals, evecs = np.linalg.eig(tenfit)
-    evals, evecs = np.real(evals), np.real(evecs)
-    for i in range(xs):
-        for j in range(ys):
-            for k in range(zs):
-                idx = np.argsort(evals[i,j,k,:])[::-1]
-                evecs[i,j,k,:,:] = evecs[i,j,k,:,idx].T
-                evals[i,j,k,:] = evals[i,j,k,idx]           
-    evals[~brain_mask] = 0
-    evecs[~brain_mask] = 0
+    evals, evecs = _tensor_eigen(tensor_volume, brain_mask)
 
 
     # Calculate FA
-    R = tenfit / np.trace(tenfit, axis1=3, axis2=4)[:,:,:,np.newaxis,np.newaxis]
-    FA = np.sqrt(0.5 * (3 - 1/(np.trace(np.matmul(R,R), axis1=3, axis2=4))))
-    FA[np.isnan(FA)] = 0    
+    FA = _fractional_anisotropy(tensor_volume)
 
     
     if wm_atlas == 1:
@@ -595,115 +622,44 @@ def dots_segmentation(tensor_image, mask, atlas_dir, wm_atlas = 1,
 
     # Calculate diffusion type indices
     print('Calculating d_T, d_O, d_I')
-    d_T = (evals[:,:,:,0] - evals[:,:,:,1]) / evals[:,:,:,0]
-    d_O = (evals[:,:,:,0] - evals[:,:,:,2]) / evals[:,:,:,0]
-    d_I = evals[:,:,:,2] / evals[:,:,:,0]
+    d_T, d_O, d_I = _diffusion_types(evals, brain_mask)
     print('Finished calculating d_T, d_O, d_I')
   
     
     # Calculate xplus and xminus
-    x_m_s_T = np.zeros((xs,ys,zs,3))
-    x_p_s_T = np.zeros((xs,ys,zs,3))
-    x_m_s_O = np.zeros((xs,ys,zs,3))
-    x_p_s_O = np.zeros((xs,ys,zs,3))
-    s_T_x_m = np.zeros((xs,ys,zs))
-    s_T_x_p = np.zeros((xs,ys,zs))
-    s_O_x_m = np.zeros((xs,ys,zs))
-    s_O_x_p = np.zeros((xs,ys,zs))
     print('Calculating x^+, x^-, s_T, s_O')
-    for i in range(1,xs-1):
-        print(str(np.round((i / xs)*100, 0)) + ' %', end="\r")
-        for j in range(1,ys-1):
-            for k in range(1,zs-1):
-                if brain_mask[i,j,k]:
-                    x_m_s_T[i,j,k,:], s_T_x_m[i,j,k] = _calc_x_minus_s_T(i,j,k,evecs,v_xy)
-                    x_p_s_T[i,j,k,:], s_T_x_p[i,j,k] = _calc_x_plus_s_T(i,j,k,evecs,v_xy)
-                    x_m_s_O[i,j,k,:], s_O_x_m[i,j,k] = _calc_x_minus_s_O(i,j,k,evals,evecs,v_xy)
-                    x_p_s_O[i,j,k,:], s_O_x_p[i,j,k] = _calc_x_plus_s_O(i,j,k,evals,evecs,v_xy)   
-    x_p_s_T = x_p_s_T.astype(int)
-    x_m_s_T = x_m_s_T.astype(int)
-    x_p_s_O = x_p_s_T.astype(int)
-    x_m_s_O = x_m_s_T.astype(int)
+    x_vol, s_vol = _neighbor_connectivity(evals, evecs, brain_mask, v_xy)
+    x_p_s_T, x_m_s_T = x_vol['p_T'], x_vol['m_T']
+    # x^+ and x^- of s_O are those of s_T, as in the original implementation
+    x_p_s_O, x_m_s_O = x_vol['p_T'], x_vol['m_T']
+    s_T_x_p, s_T_x_m = s_vol['p_T'], s_vol['m_T']
+    s_O_x_p, s_O_x_m = s_vol['p_O'], s_vol['m_O']
     print('Finished calculating x^+, x^-, s_T, s_O')
 
         
-    # Calculate shape prior arrays
-    print('Calculating u_l, u_lm')
-    u_l = fiber_p**2 / np.nansum(fiber_p, axis=3)[:,:,:,np.newaxis]
-    u_lm = np.zeros((xs, ys, zs, len(tract_pair_sets)))
-    for idx in range(len(tract_pair_sets)):
-        l,m = tract_pair_sets[idx]
-        u_lm[:,:,:,idx] = fiber_p[:,:,:,l]*fiber_p[:,:,:,m]*(fiber_p[:,:,:,l]
-                          + fiber_p[:,:,:,m]) / \
-                          np.nansum(fiber_p, axis=3) 
-    u_l[:,:,:,1] *= c_O # Scale by weight parameter
-    print('Finished calculating u_l, u_lm')
-        
-        
-    # Calculate direction coefficients
-    c_l = np.zeros((xs, ys, zs, N_t))*np.nan
-    c_lm = np.zeros((xs, ys, zs, len(tract_pair_sets)))*np.nan
-    print('Calculating c_l, c_lm')
-    for i in range(xs):
-        print(str(np.round((i / xs)*100, 0)) + ' %', end="\r")
-        for j in range(ys):
-            for k in range(zs):
-                for l in range(1,N_t):
-                    if fiber_p[i,j,k,l] != 0:
-                        c_l[i,j,k,l] = _calc_c_l(i,j,k,l,None,evecs,
-                                                 fiber_dir,c_C)
-                for idx in range(len(tract_pair_sets)):
-                    l,m = tract_pair_sets[idx]
-                    if fiber_p[i,j,k,l] != 0 and fiber_p[i,j,k,m] != 0:
-                        c_lm[i,j,k,idx] = _calc_c_l(i,j,k,l,m,evecs,
-                                                    fiber_dir,c_C)
-    print('Finished calculating c_l, c_lm')
-                        
-    
-    # Mask arrays
-    d_T[~brain_mask] = np.nan
-    d_O[~brain_mask] = np.nan
-    d_I[~brain_mask] = 1
-    fiber_p[~brain_mask,0] = 1
-    fiber_p[~brain_mask,1:] = np.nan
-    fiber_dir[~brain_mask] = np.nan
-    c_l[~brain_mask] = np.nan
-    c_lm[~brain_mask] = np.nan
-    u_l[~brain_mask] = np.nan
-    u_l[~brain_mask,0] = 1
-    u_lm[~brain_mask] = np.nan
-    s_T_x_p[~brain_mask] = np.nan
-    s_T_x_m[~brain_mask] = np.nan
-    s_O_x_p[~brain_mask] = np.nan
-    s_O_x_m[~brain_mask] = np.nan
-    
-    
-    # Only ROIs where p != 0 are of interest
-    u_l[u_l == 0] = np.nan
-    u_lm[u_lm == 0] = np.nan
-
-
-    # Calculate energy based on unary term only
-    MRF_V1 = _calc_V1(d_T, d_O, d_I, u_l, u_lm, c_l, c_lm, c_I, fiber_p, 
-                      tract_pair_sets, N_t, N_o, brain_mask)
+    # Calculate energy based on unary term only, for the voxels of the mask
+    # (along with the shape priors u_l, u_lm and direction coefficients
+    # c_l, c_lm it depends on)
+    MRF_V1 = _calc_V1(d_T, d_O, d_I, evecs, fiber_p, fiber_dir, c_I, c_O,
+                      c_C, tract_pair_sets, N_t, N_o, brain_mask)
 
 
     # Maximize U
     print('Maximizing U')
-    curr_U = np.copy(MRF_V1)
+    neighbors = _mrf_neighbors(brain_mask, tract_pair_sets, N_t, s_T_x_p,
+                               s_T_x_m, s_O_x_m, s_O_x_p, x_m_s_T, x_p_s_T,
+                               x_m_s_O, x_p_s_O)
+    curr_U = MRF_V1
     iteration = 0
     change_in_labels = np.inf
     while iteration < max_iter and change_in_labels > convergence_threshold:
         at = time.time()
-        prev_U = np.copy(curr_U)
+        prev_U = curr_U
         prev_segmentation = _calc_segmentation(prev_U)
         iteration += 1
         print('Iteration '+str(iteration))
         
-        curr_U = _calc_U(prev_U, d_T, d_O, d_I, u_l, u_lm, c_l, c_lm, c_I, 
-                         fiber_p, tract_pair_sets, s_I, s_T_x_p, s_T_x_m, 
-                         s_O_x_m, s_O_x_p, brain_mask, N_t, N_o,
-                         x_m_s_T, x_p_s_T, x_m_s_O, x_p_s_O)
+        curr_U = _calc_U(prev_U, MRF_V1, s_I, neighbors, N_t, N_o)
         
         curr_segmentation = _calc_segmentation(curr_U)           
         change_in_labels = (np.nansum(prev_segmentation != curr_segmentation) /
@@ -715,17 +671,30 @@ def dots_segmentation(tensor_image, mask, atlas_dir, wm_atlas = 1,
     print('Finished maximizing U') 
 
 
-    # Calculate posterior probabilities
+    # Calculate posterior probabilities of the voxels of the mask (nan
+    # elsewhere), in double precision and by chunks of voxels
     print('Calculating posterior probabilities')
-    fiber_posterior = np.zeros(fiber_p.shape)
-    curr_U[curr_U == 0] = np.nan
-    for l in range(N_t):
-        print(str(np.round((l / N_t)*100, 0)) + ' %', end="\r")
-        fiber_posterior[:,:,:,l] = calc_posterior_probability(l, curr_U, 1)
+    curr_U = curr_U[:-1]
+    posterior = np.zeros((curr_U.shape[0], N_t))
+    for start in range(0, posterior.shape[0], 2**16):
+        print(str(np.round((start / posterior.shape[0])*100, 0)) + ' %',
+              end="\r")
+        U = curr_U[start:start+2**16].astype(np.float64)
+        U[U == 0] = np.nan
+        for l in range(N_t):
+            posterior[start:start+2**16,l] = calc_posterior_probability(l, U,
+                                                                        1)
+    fiber_posterior = np.full(fiber_p.shape, np.nan)
+    fiber_posterior[brain_mask] = posterior
     fiber_posterior[fiber_posterior == 0] = np.nan
     fiber_posterior[np.isinf(fiber_posterior)] = np.nan
-    curr_U[np.isnan(curr_U)] = 0
     print('Finished calculating posterior probabilities')
+
+
+    # Scatter the segmentation of the voxels of the mask back to the volume
+    segmentation = np.zeros(brain_mask.shape, dtype=curr_segmentation.dtype)
+    segmentation[brain_mask] = curr_segmentation[:-1]
+    curr_segmentation = segmentation
     
     
     # Save results
@@ -3,12 +3,18 @@ import nibabel as nb
 import os
 import sys
 import nighresjava
-from ..io import load_volume, save_volume, time_log
+from ..io import load_volume, load_volume_header, save_volume, time_log
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-    _check_topology_lut_dir, _check_atlas_file, _check_available_memory
+    _check_topology_lut_dir, _check_atlas_file, \
+    _to_java, _from_java, _volume_data
 import time
 
 
+@profiled
+@cached
 def extract_brain_region(segmentation, levelset_boundary,
                          maximum_membership, maximum_label,
                          extracted_region, atlas_file=None,
@@ -102,11 +108,8 @@ def extract_brain_region(segmentation, levelset_boundary,
         output_dir = _output_dir_4saving(output_dir, segmentation)
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     xbr = nighresjava.BrainExtractBrainRegion()
 
@@ -164,15 +167,15 @@ def extract_brain_region(segmentation, levelset_boundary,
                                      rootfile=segmentation,
                                      suffix='xlvl-'+xbr.getBackgroundName(), ))
         if overwrite is False \
-            and os.path.isfile(reg_mask_file) \
-            and os.path.isfile(ins_mask_file) \
-            and os.path.isfile(bg_mask_file) \
-            and os.path.isfile(reg_proba_file) \
-            and os.path.isfile(ins_proba_file) \
-            and os.path.isfile(bg_proba_file) \
-            and os.path.isfile(reg_lvl_file) \
-            and os.path.isfile(ins_lvl_file) \
-            and os.path.isfile(bg_lvl_file) :
+            and _is_cached(reg_mask_file) \
+            and _is_cached(ins_mask_file) \
+            and _is_cached(bg_mask_file) \
+            and _is_cached(reg_proba_file) \
+            and _is_cached(ins_proba_file) \
+            and _is_cached(bg_proba_file) \
+            and _is_cached(reg_lvl_file) \
+            and _is_cached(ins_lvl_file) \
+            and _is_cached(bg_lvl_file) :
 
             print("skip computation (use existing results)")
             output = {'inside_mask': ins_mask_file,
@@ -188,7 +191,7 @@ def extract_brain_region(segmentation, levelset_boundary,
 
     # load images and set dimensions and resolution
     seg = load_volume(segmentation, log_file=log_file)
-    data = seg.get_data()
+    data = _volume_data(seg, 'int')
     affine = seg.affine
     header = seg.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -196,24 +199,21 @@ def extract_brain_region(segmentation, levelset_boundary,
 
     xbr.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     xbr.setResolutions(resolution[0], resolution[1], resolution[2])
-    xbr.setComponents(load_volume(maximum_membership, log_file=log_file).header.get_data_shape()[3])
+    xbr.setComponents(load_volume_header(maximum_membership, log_file=log_file).get_data_shape()[3])
 
-    xbr.setSegmentationImage(nighresjava.JArray('int')(
-        (data.flatten('F')).astype(int).tolist()))
+    xbr.setSegmentationImage(_to_java(data, 'int'))
 
-    data = load_volume(levelset_boundary, log_file=log_file).get_data()
-    xbr.setLevelsetBoundaryImage(nighresjava.JArray('float')(
-        (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(levelset_boundary, log_file=log_file), 'float')
+    xbr.setLevelsetBoundaryImage(_to_java(data, 'float'))
 
-    data = load_volume(maximum_membership, log_file=log_file).get_data()
-    xbr.setMaximumMembershipImage(nighresjava.JArray('float')(
-        (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(maximum_membership, log_file=log_file), 'float')
+    xbr.setMaximumMembershipImage(_to_java(data, 'float'))
 
-    data = load_volume(maximum_label, log_file=log_file).get_data()
-    xbr.setMaximumLabelImage(nighresjava.JArray('int')(
-        (data.flatten('F')).astype(int).tolist()))
+    data = _volume_data(load_volume(maximum_label, log_file=log_file), 'int')
+    xbr.setMaximumLabelImage(_to_java(data, 'int'))
 
     # execute
+    phase('execute')
     try:
         xbr.execute()
 
@@ -223,17 +223,15 @@ def extract_brain_region(segmentation, levelset_boundary,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # inside region
     # reshape output to what nibabel likes
-    mask_data = np.reshape(np.array(xbr.getInsideWMmask(),
-                                    dtype=np.int32), dimensions, 'F')
+    mask_data = _from_java(xbr.getInsideWMmask(), dimensions, np.int32)
 
-    proba_data = np.reshape(np.array(xbr.getInsideWMprobability(),
-                                     dtype=np.float32), dimensions, 'F')
+    proba_data = _from_java(xbr.getInsideWMprobability(), dimensions)
 
-    lvl_data = np.reshape(np.array(xbr.getInsideWMlevelset(),
-                                   dtype=np.float32), dimensions, 'F')
+    lvl_data = _from_java(xbr.getInsideWMlevelset(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -251,14 +249,11 @@ def extract_brain_region(segmentation, levelset_boundary,
 
     # main region
     # reshape output to what nibabel likes
-    mask_data = np.reshape(np.array(xbr.getStructureGMmask(),
-                                    dtype=np.int32), dimensions, 'F')
+    mask_data = _from_java(xbr.getStructureGMmask(), dimensions, np.int32)
 
-    proba_data = np.reshape(np.array(xbr.getStructureGMprobability(),
-                                     dtype=np.float32), dimensions, 'F')
+    proba_data = _from_java(xbr.getStructureGMprobability(), dimensions)
 
-    lvl_data = np.reshape(np.array(xbr.getStructureGMlevelset(),
-                                   dtype=np.float32), dimensions, 'F')
+    lvl_data = _from_java(xbr.getStructureGMlevelset(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -276,14 +271,11 @@ def extract_brain_region(segmentation, levelset_boundary,
 
     # background region
     # reshape output to what nibabel likes
-    mask_data = np.reshape(np.array(xbr.getBackgroundCSFmask(),
-                                    dtype=np.int32), dimensions, 'F')
+    mask_data = _from_java(xbr.getBackgroundCSFmask(), dimensions, np.int32)
 
-    proba_data = np.reshape(np.array(xbr.getBackgroundCSFprobability(),
-                                     dtype=np.float32), dimensions, 'F')
+    proba_data = _from_java(xbr.getBackgroundCSFprobability(), dimensions)
 
-    lvl_data = np.reshape(np.array(xbr.getBackgroundCSFlevelset(),
-                                   dtype=np.float32), dimensions, 'F')
+    lvl_data = _from_java(xbr.getBackgroundCSFlevelset(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -2,10 +2,14 @@ import numpy as np
 import nibabel as nb
 import os
 import sys
-from ..io import load_volume, save_volume
+from ..io import load_volume, load_volume_header, save_volume
+from ..profiling import profiled
+from ..cache import cached, _is_cached
 from ..utils import _output_dir_4saving, _fname_4saving
 
 
+@profiled
+@cached
 def filter_stacking(dura_img=None, pvcsf_img=None, arteries_img=None,
                            save_data=False, overwrite=False, output_dir=None,
                            file_name=None):
@@ -74,14 +78,14 @@ def filter_stacking(dura_img=None, pvcsf_img=None, arteries_img=None,
                                    rootfile=img,
                                    suffix='bfs-img'))
         if overwrite is False \
-            and os.path.isfile(filter_file) :
+            and _is_cached(filter_file) :
 
             print("skip computation (use existing results)")
             output = {"result": filter_file}
             return output
 
-    affine = load_volume(img).affine
-    header = load_volume(img).header
+    header = load_volume_header(img)
+    affine = header.get_best_affine()
     resolution = [x.item() for x in header.get_zooms()]
     dimensions = header.get_data_shape()
     nx = dimensions[0];
@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def intensity_based_skullstripping(main_image, extra_image=None,
                             noise_model='exponential', skip_zero_values=True,
                             iterate=False, dilate_mask=0, dynamic_range=0.8,
@@ -107,49 +113,44 @@ def intensity_based_skullstripping(main_image, extra_image=None,
             extra_file = None
         
         if overwrite is False \
-            and os.path.isfile(mask_file) \
-            and os.path.isfile(proba_file) \
-            and os.path.isfile(main_file) :
+            and _is_cached(mask_file) \
+            and _is_cached(proba_file) \
+            and _is_cached(main_file) :
             
             print("skip computation (use existing results)")
             output = {'brain_mask': mask_file, 
                     'brain_proba': proba_file, 
                     'main_masked': main_file}
             if extra_file is not None:
-                if os.path.isfile(extra_file) :     
+                if _is_cached(extra_file) :     
                     output['extra_masked'] = extra_file
             return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # create skulltripping instance
     algo = nighresjava.BrainIntensityBasedSkullStripping()
 
     # get dimensions and resolution from second inversion image
     main_img = load_volume(main_image)
-    main_data = main_img.get_data()
+    main_data = _volume_data(main_img, 'float')
     main_affine = main_img.affine
     main_hdr = main_img.header
     resolution = [x.item() for x in main_hdr.get_zooms()]
     dimensions = main_data.shape
     algo.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     algo.setResolutions(resolution[0], resolution[1], resolution[2])
-    algo.setMainIntensityImage(nighresjava.JArray('float')(
-                                    (main_data.flatten('F')).astype(float)))
+    algo.setMainIntensityImage(_to_java(main_data, 'float'))
 
     # pass other inputs
     if extra_image is not None:
         extra_img = load_volume(extra_image)
-        extra_data = extra_img.get_data()
+        extra_data = _volume_data(extra_img, 'float')
         extra_affine = extra_img.affine
         extra_hdr = extra_img.header
-        algo.setExtraIntensityImage(nighresjava.JArray('float')(
-                                    (extra_data.flatten('F')).astype(float)))
+        algo.setExtraIntensityImage(_to_java(extra_data, 'float'))
 
     algo.setBackgroundNoiseModel(noise_model)
     algo.setIterativeEstimation(iterate)
@@ -159,6 +160,7 @@ def intensity_based_skullstripping(main_image, extra_image=None,
     algo.setDynamicRange(dynamic_range)
 
     # execute skull stripping
+    phase('execute')
     try:
         algo.execute()
 
@@ -168,29 +170,23 @@ def intensity_based_skullstripping(main_image, extra_image=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs and potentially save
-    main_masked_data = np.reshape(np.array(
-                                algo.getMaskedMainImage(),
-                                dtype=np.float32), dimensions, 'F')
+    main_masked_data = _from_java(algo.getMaskedMainImage(), dimensions)
     main_hdr['cal_max'] = np.nanmax(main_masked_data)
     main_masked = nb.Nifti1Image(main_masked_data, main_affine, main_hdr)
 
-    mask_data = np.reshape(np.array(algo.getBrainMaskImage(),
-                                    dtype=np.uint32), dimensions, 'F')
+    mask_data = _from_java(algo.getBrainMaskImage(), dimensions, np.uint32)
     main_hdr['cal_max'] = np.nanmax(mask_data)
     mask = nb.Nifti1Image(mask_data, main_affine, main_hdr)
 
-    proba_data = np.reshape(np.array(
-                                algo.getForegroundProbabilityImage(),
-                                dtype=np.float32), dimensions, 'F')
+    proba_data = _from_java(algo.getForegroundProbabilityImage(), dimensions)
     main_hdr['cal_max'] = np.nanmax(proba_data)
     proba = nb.Nifti1Image(proba_data, main_affine, main_hdr)
 
     if extra_image is not None:
-        extra_data = np.reshape(np.array(
-                                algo.getMaskedExtraImage(),
-                                dtype=np.float32), dimensions, 'F')
+        extra_data = _from_java(algo.getMaskedExtraImage(), dimensions)
         extra_hdr['cal_max'] = np.nanmax(extra_data)
         extra_masked = nb.Nifti1Image(extra_data, extra_affine, extra_hdr)
 
@@ -4,9 +4,12 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume, time_log
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
                     _check_topology_lut_dir, _check_atlas_file, \
-                    _check_available_memory
+                    _to_java, _from_java, _volume_data
 import time
 
 def _get_mgdm_orientation(affine, mgdm):
@@ -56,6 +59,8 @@ def _get_mgdm_intensity_priors(atlas_file):
     return priors
 
 
+@profiled
+@cached
 def mgdm_segmentation(contrast_image1, contrast_type1,
                       contrast_image2=None, contrast_type2=None,
                       contrast_image3=None, contrast_type3=None,
@@ -228,10 +233,10 @@ def mgdm_segmentation(contrast_image1, contrast_type1,
                                    rootfile=contrast_image1,
                                    suffix='mgdm-dist'))
         if overwrite is False \
-            and os.path.isfile(seg_file) \
-            and os.path.isfile(lbl_file) \
-            and os.path.isfile(mems_file) \
-            and os.path.isfile(dist_file) :
+            and _is_cached(seg_file) \
+            and _is_cached(lbl_file) \
+            and _is_cached(mems_file) \
+            and _is_cached(dist_file) :
             
             print("skip computation (use existing results)")
             output = {
@@ -243,11 +248,8 @@ def mgdm_segmentation(contrast_image1, contrast_type1,
             return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create mgdm instance
     mgdm = nighresjava.BrainMgdmMultiSegmentation2()
 
@@ -268,7 +270,7 @@ def mgdm_segmentation(contrast_image1, contrast_type1,
 
     # load contrast image 1 and use it to set dimensions and resolution
     img = load_volume(contrast_image1, log_file=log_file)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -282,30 +284,27 @@ def mgdm_segmentation(contrast_image1, contrast_type1,
     mgdm.setOrientations(sliceorder, LR, AP, IS)
 
     # input image 1
-    mgdm.setContrastImage1(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+    mgdm.setContrastImage1(_to_java(data, 'float'))
     mgdm.setContrastType1(contrast_type1)
 
     # if further contrast are specified, input them
     if contrast_image2 is not None:
-        data = load_volume(contrast_image2, log_file=log_file).get_data()
-        mgdm.setContrastImage2(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(contrast_image2, log_file=log_file), 'float')
+        mgdm.setContrastImage2(_to_java(data, 'float'))
         mgdm.setContrastType2(contrast_type2)
 
         if contrast_image3 is not None:
-            data = load_volume(contrast_image3, log_file=log_file).get_data()
-            mgdm.setContrastImage3(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(contrast_image3, log_file=log_file), 'float')
+            mgdm.setContrastImage3(_to_java(data, 'float'))
             mgdm.setContrastType3(contrast_type3)
 
             if contrast_image4 is not None:
-                data = load_volume(contrast_image4, log_file=log_file).get_data()
-                mgdm.setContrastImage4(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+                data = _volume_data(load_volume(contrast_image4, log_file=log_file), 'float')
+                mgdm.setContrastImage4(_to_java(data, 'float'))
                 mgdm.setContrastType4(contrast_type4)
 
     # execute MGDM
+    phase('execute')
     try:
         mgdm.execute()
 
@@ -315,20 +314,17 @@ def mgdm_segmentation(contrast_image1, contrast_type1,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    seg_data = np.reshape(np.array(mgdm.getSegmentedBrainImage(),
-                                   dtype=np.int32), dimensions, 'F')
+    seg_data = _from_java(mgdm.getSegmentedBrainImage(), dimensions, np.int32)
 
-    dist_data = np.reshape(np.array(mgdm.getLevelsetBoundaryImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    dist_data = _from_java(mgdm.getLevelsetBoundaryImage(), dimensions)
 
     # membership and labels output has a 4th dimension, set to 6
     dimensions4d = [dimensions[0], dimensions[1], dimensions[2], 6]
-    lbl_data = np.reshape(np.array(mgdm.getPosteriorMaximumLabels4D(),
-                                   dtype=np.int32), dimensions4d, 'F')
-    mems_data = np.reshape(np.array(mgdm.getPosteriorMaximumMemberships4D(),
-                                    dtype=np.float32), dimensions4d, 'F')
+    lbl_data = _from_java(mgdm.getPosteriorMaximumLabels4D(), dimensions4d, np.int32)
+    mems_data = _from_java(mgdm.getPosteriorMaximumMemberships4D(), dimensions4d)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
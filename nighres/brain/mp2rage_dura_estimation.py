@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def mp2rage_dura_estimation(second_inversion, skullstrip_mask,
                            background_distance=5.0, output_type='dura_region',
                            save_data=False, overwrite=False, output_dir=None,
@@ -74,43 +80,39 @@ def mp2rage_dura_estimation(second_inversion, skullstrip_mask,
                                    suffix='dura-proba'))
 
         if overwrite is False \
-            and os.path.isfile(result_file) :
+            and _is_cached(result_file) :
 
             print("skip computation (use existing results)")
             output = {'result': result_file}
             return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # create skulltripping instance
     algo = nighresjava.BrainMp2rageDuraEstimation()
 
     # get dimensions and resolution from second inversion image
     inv2_img = load_volume(second_inversion)
-    inv2_data = inv2_img.get_data()
+    inv2_data = _volume_data(inv2_img, 'float')
     inv2_affine = inv2_img.affine
     inv2_hdr = inv2_img.header
     resolution = [x.item() for x in inv2_hdr.get_zooms()]
     dimensions = inv2_data.shape
     algo.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     algo.setResolutions(resolution[0], resolution[1], resolution[2])
-    algo.setSecondInversionImage(nighresjava.JArray('float')(
-                                    (inv2_data.flatten('F')).astype(float)))
+    algo.setSecondInversionImage(_to_java(inv2_data, 'float'))
 
     # pass other inputs
-    mask_data = load_volume(skullstrip_mask).get_data()
-    algo.setSkullStrippingMask(nighresjava.JArray('int')(
-                                    (mask_data.flatten('F')).astype(int).tolist()))
+    mask_data = _volume_data(load_volume(skullstrip_mask), 'int')
+    algo.setSkullStrippingMask(_to_java(mask_data, 'int'))
 
     algo.setDistanceToBackground_mm(background_distance)
     algo.setOutputType(output_type)
 
     # execute skull stripping
+    phase('execute')
     try:
         algo.execute()
 
@@ -120,11 +122,10 @@ def mp2rage_dura_estimation(second_inversion, skullstrip_mask,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs and potentially save
-    result_data = np.reshape(np.array(
-                                algo.getDuraImage(),
-                                dtype=np.float32), dimensions, 'F')
+    result_data = _from_java(algo.getDuraImage(), dimensions)
     inv2_hdr['cal_max'] = np.nanmax(result_data)
     result_img = nb.Nifti1Image(result_data, inv2_affine, inv2_hdr)
 
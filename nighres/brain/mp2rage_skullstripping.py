@@ -4,11 +4,17 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume, time_log
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 import time
 import json
 
+@profiled
+@cached
 def mp2rage_skullstripping(second_inversion, t1_weighted=None, t1_map=None,
                            skip_zero_values=True, topology_lut_dir=None,
                            save_data=False, overwrite=False, output_dir=None,
@@ -105,41 +111,37 @@ def mp2rage_skullstripping(second_inversion, t1_weighted=None, t1_map=None,
             t1map_file = None
         
         if overwrite is False \
-            and os.path.isfile(mask_file) \
-            and os.path.isfile(inv2_file) :
+            and _is_cached(mask_file) \
+            and _is_cached(inv2_file) :
             
             print("skip computation (use existing results)")
             output = {'brain_mask': mask_file,
                     'inv2_masked': inv2_file}
             if t1w_file is not None:
-                if os.path.isfile(t1w_file) :
+                if _is_cached(t1w_file) :
                     output['t1w_masked'] = t1w_file
             if t1map_file is not None:
-                if os.path.isfile(t1map_file) :
+                if _is_cached(t1map_file) :
                     output['t1map_masked'] = t1map_file
             return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # create skulltripping instance
     algo = nighresjava.BrainMp2rageSkullStripping()
 
     # get dimensions and resolution from second inversion image
     inv2_img = load_volume(second_inversion, log_file=log_file)
-    inv2_data = inv2_img.get_data()
+    inv2_data = _volume_data(inv2_img, 'float')
     inv2_affine = inv2_img.affine
     inv2_hdr = inv2_img.header
     resolution = [x.item() for x in inv2_hdr.get_zooms()]
     dimensions = inv2_data.shape
     algo.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     algo.setResolutions(resolution[0], resolution[1], resolution[2])
-    algo.setSecondInversionImage(nighresjava.JArray('float')(
-                                    (inv2_data.flatten('F')).astype(float)))
+    algo.setSecondInversionImage(_to_java(inv2_data, 'float'))
 
     # pass other inputs
     if (t1_weighted is None and t1_map is None):
@@ -147,23 +149,22 @@ def mp2rage_skullstripping(second_inversion, t1_weighted=None, t1_map=None,
                          't1_weighted and t1_map')
     if t1_weighted is not None:
         t1w_img = load_volume(t1_weighted, log_file=log_file)
-        t1w_data = t1w_img.get_data()
+        t1w_data = _volume_data(t1w_img, 'float')
         t1w_affine = t1w_img.affine
         t1w_hdr = t1w_img.header
-        algo.setT1weightedImage(nighresjava.JArray('float')(
-                                      (t1w_data.flatten('F')).astype(float)))
+        algo.setT1weightedImage(_to_java(t1w_data, 'float'))
     if t1_map is not None:
         t1map_img = load_volume(t1_map, log_file=log_file)
-        t1map_data = t1map_img.get_data()
+        t1map_data = _volume_data(t1map_img, 'float')
         t1map_affine = t1map_img.affine
         t1map_hdr = t1map_img.header
-        algo.setT1MapImage(nighresjava.JArray('float')(
-                                    (t1map_data.flatten('F')).astype(float)))
+        algo.setT1MapImage(_to_java(t1map_data, 'float'))
 
     algo.setSkipZeroValues(skip_zero_values)
     algo.setTopologyLUTdirectory(topology_lut_dir)
 
     # execute skull stripping
+    phase('execute')
     try:
         algo.execute()
 
@@ -173,16 +174,14 @@ def mp2rage_skullstripping(second_inversion, t1_weighted=None, t1_map=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs and potentially save
-    inv2_masked_data = np.reshape(np.array(
-                                algo.getMaskedSecondInversionImage(),
-                                dtype=np.float32), dimensions, 'F')
+    inv2_masked_data = _from_java(algo.getMaskedSecondInversionImage(), dimensions)
     inv2_hdr['cal_max'] = np.nanmax(inv2_masked_data)
     inv2_masked = nb.Nifti1Image(inv2_masked_data, inv2_affine, inv2_hdr)
 
-    mask_data = np.reshape(np.array(algo.getBrainMaskImage(),
-                                    dtype=np.uint32), dimensions, 'F')
+    mask_data = _from_java(algo.getBrainMaskImage(), dimensions, np.uint32)
     inv2_hdr['cal_max'] = np.nanmax(mask_data)
     mask = nb.Nifti1Image(mask_data, inv2_affine, inv2_hdr)
 
@@ -194,9 +193,7 @@ def mp2rage_skullstripping(second_inversion, t1_weighted=None, t1_map=None,
         outputs = {'brain_mask': mask, 'inv2_masked': inv2_masked}
 
     if t1_weighted is not None:
-        t1w_masked_data = np.reshape(np.array(
-                                algo.getMaskedT1weightedImage(),
-                                dtype=np.float32), dimensions, 'F')
+        t1w_masked_data = _from_java(algo.getMaskedT1weightedImage(), dimensions)
         t1w_hdr['cal_max'] = np.nanmax(t1w_masked_data)
         t1w_masked = nb.Nifti1Image(t1w_masked_data, t1w_affine, t1w_hdr)
 
@@ -207,9 +204,7 @@ def mp2rage_skullstripping(second_inversion, t1_weighted=None, t1_map=None,
             outputs['t1w_masked'] = t1w_masked
 
     if t1_map is not None:
-        t1map_masked_data = np.reshape(np.array(
-                                        algo.getMaskedT1MapImage(),
-                                        dtype=np.float32), dimensions, 'F')
+        t1map_masked_data = _from_java(algo.getMaskedT1MapImage(), dimensions)
         t1map_hdr['cal_max'] = np.nanmax(t1map_masked_data)
         t1map_masked = nb.Nifti1Image(t1map_masked_data, t1map_affine,
                                       t1map_hdr)
@@ -0,0 +1,418 @@
+import importlib
+import warnings
+import numpy as np
+
+# the module, not the function of the same name exported by nighres.brain
+dots = importlib.import_module('nighres.brain.dots_segmentation')
+
+
+def _phantom(shape=(9, 8, 7), seed=0):
+    # Tensor volume (xx, yy, zz, xy, xz, yz) of a bent fiber bundle with
+    # noisy directions inside an ellipsoidal mask, with a slab along x where
+    # neighbors tie, an isotropic region and a NaN voxel
+    rng = np.random.RandomState(seed)
+    grid = np.meshgrid(*[np.linspace(-1, 1, n) for n in shape], indexing='ij')
+    mask = sum(g**2 for g in grid) < 0.9
+    d_1 = np.stack([np.cos(2*grid[1]), np.sin(2*grid[1]), 0.3*grid[2]], -1)
+    d_1 += 0.2*rng.randn(*(shape + (3,)))
+    d_1[grid[0] < -0.4] = [1, 0, 0]
+    d_1 /= np.linalg.norm(d_1, axis=-1, keepdims=True)
+    d_2 = np.cross(d_1, [0, 0, 1.0])
+    d_2 /= np.linalg.norm(d_2, axis=-1, keepdims=True)
+    d_3 = np.cross(d_1, d_2)
+    l_1 = 1.5e-3 + 0.3e-3*rng.rand(*shape)
+    l_2 = 0.5e-3 + 0.3e-3*rng.rand(*shape)
+    l_3 = 0.3e-3 + 0.1e-3*rng.rand(*shape)
+    tensors = sum(l[..., None, None] * d[..., :, None] * d[..., None, :]
+                  for l, d in ((l_1, d_1), (l_2, d_2), (l_3, d_3)))
+    tensor_volume = np.stack([tensors[..., a, b] for a, b in
+                              [(0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)]],
+                             axis=-1)
+    tensor_volume[~mask] = 0
+    iso = sum((g - 0.3)**2 for g in grid) < 0.1
+    tensor_volume[iso, :3] = 1e-3
+    tensor_volume[iso, 3:] = 0
+    tensor_volume[3, 3, 3] = np.nan
+    return tensor_volume, mask
+
+
+def _tensor_eigen_loop(tensor_volume, mask):
+    # Eigenvalues (decreasing) and eigenvectors with np.linalg.eig and a per
+    # voxel sort, and the tensors, as in the original implementation
+    xs, ys, zs, _ = tensor_volume.shape
+    tenfit = np.zeros((xs, ys, zs, 3, 3))
+    for n, (a, b) in enumerate([(0, 0), (1, 1), (2, 2), (0, 1), (0, 2),
+                                (1, 2)]):
+        tenfit[..., a, b] = tensor_volume[..., n]
+        tenfit[..., b, a] = tensor_volume[..., n]
+    tenfit[np.isnan(tenfit)] = 0
+    evals, evecs = np.linalg.eig(tenfit)
+    evals, evecs = np.real(evals), np.real(evecs)
+    for i in range(xs):
+        for j in range(ys):
+            for k in range(zs):
+                idx = np.argsort(evals[i, j, k, :])[::-1]
+                evecs[i, j, k, :, :] = evecs[i, j, k, :, idx].T
+                evals[i, j, k, :] = evals[i, j, k, idx]
+    evals[~mask] = 0
+    evecs[~mask] = 0
+    return evals, evecs, tenfit
+
+
+def _neighbor_directions():
+    # Unit vectors between a voxel and its 26 neighbors, as in
+    # dots_segmentation
+    v_xy = np.zeros((3, 3, 3, 3))
+    for i in range(3):
+        for j in range(3):
+            for k in range(3):
+                if (i, j, k) == (1, 1, 1):
+                    v_xy[i, j, k, :] = np.nan
+                else:
+                    v_xy[i, j, k, :] = np.array([i, j, k]) - 1
+                    v_xy[i, j, k, :] /= np.linalg.norm(v_xy[i, j, k, :])
+    return v_xy
+
+
+def _theta(v_1, v_2):
+    return (2/np.pi) * np.arccos(np.abs(np.dot(v_1, v_2)))
+
+
+def _s_T(i, j, k, a, b, c, evecs, v_xy):
+    # Per voxel connectivity assuming a single tract (Eq 5)
+    v = v_xy[a-i+1, b-j+1, c-k+1, :]
+    return (1 - np.nanmin([_theta(evecs[i, j, k, :, 0], v),
+                           _theta(evecs[a, b, c, :, 0], v)])) * \
+        (1 - 2*_theta(evecs[i, j, k, :, 0], evecs[a, b, c, :, 0]))
+
+
+def _s_O(i, j, k, a, b, c, evals, evecs, v_xy):
+    # Per voxel connectivity assuming overlapping tracts (Eq 6)
+    vec_1 = evecs[i, j, k, :, 0]
+    vec_2 = evals[i, j, k, 1] / evals[i, j, k, 0] * evecs[i, j, k, :, 1]
+    nbr_1 = evecs[a, b, c, :, 0]
+    nbr_2 = evals[a, b, c, 1] / evals[a, b, c, 0] * evecs[a, b, c, :, 1]
+    pairs = np.array([[vec_1, nbr_1], [vec_2, nbr_1], [vec_1, nbr_2],
+                      [vec_2, nbr_2]])
+    angles = np.array([_theta(v_1, v_2) for v_1, v_2 in pairs])
+    v_O = pairs[np.nanargmin(angles)]
+    v = v_xy[a-i+1, b-j+1, c-k+1, :]
+    return (1 - np.nanmin([_theta(v_O[0], v), _theta(v_O[1], v)])) * \
+        (1 - 2*_theta(v_O[0], v_O[1]))
+
+
+def _neighbor_connectivity_loop(evals, evecs, brain_mask, v_xy):
+    # Search of the neighbors maximizing s_T and s_O in each
+    # half-neighborhood, one voxel at a time
+    xs, ys, zs = brain_mask.shape
+    x_vol = {key: np.zeros((xs, ys, zs, 3), dtype=int)
+             for key in ('p_T', 'm_T', 'p_O', 'm_O')}
+    s_vol = {key: np.zeros((xs, ys, zs)) for key in x_vol}
+    for i in range(1, xs-1):
+        for j in range(1, ys-1):
+            for k in range(1, zs-1):
+                if not brain_mask[i, j, k]:
+                    continue
+                for key in x_vol:
+                    best, argmax = -np.inf, np.array([i, j, k])
+                    for a in range(3):
+                        for b in range(3):
+                            for c in range(3):
+                                direction = np.dot(evecs[i, j, k, :, 0],
+                                                   v_xy[a, b, c])
+                                if not (direction > 0 if key[0] == 'p'
+                                        else direction < 0):
+                                    continue
+                                nbr = (i+a-1, j+b-1, k+c-1)
+                                if key[2] == 'T':
+                                    s = _s_T(i, j, k, *nbr, evecs, v_xy)
+                                else:
+                                    s = _s_O(i, j, k, *nbr, evals, evecs,
+                                             v_xy)
+                                if s > best:
+                                    best, argmax = s, np.array(nbr)
+                    x_vol[key][i, j, k] = argmax
+                    s_vol[key][i, j, k] = 0 if np.isneginf(best) else best
+    return x_vol, s_vol
+
+
+def test_neighbor_connectivity_matches_voxel_loop():
+    tensor_volume, mask = _phantom()
+    evals, evecs = dots._tensor_eigen(tensor_volume, mask)
+    v_xy = _neighbor_directions()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_vol, s_vol = dots._neighbor_connectivity(evals, evecs, mask, v_xy)
+        x_ref, s_ref = _neighbor_connectivity_loop(evals, evecs, mask, v_xy)
+    for key in x_ref:
+        np.testing.assert_array_equal(x_vol[key], x_ref[key], err_msg=key)
+        np.testing.assert_allclose(s_vol[key], s_ref[key], rtol=1e-12,
+                                   atol=1e-12, err_msg=key)
+
+
+def test_tensor_eigen_fa_and_diffusion_types_match_eig():
+    tensor_volume, mask = _phantom()
+    evals, evecs = dots._tensor_eigen(tensor_volume, mask)
+    evals_ref, evecs_ref, tenfit = _tensor_eigen_loop(tensor_volume, mask)
+    # the NaN voxel and the isotropic region are part of the comparison
+    assert mask[3, 3, 3] and np.any(mask & (evals_ref[..., 0] > 0) &
+                                    (evals_ref[..., 0] == evals_ref[..., 2]))
+
+    np.testing.assert_allclose(evals, evals_ref, rtol=1e-10, atol=1e-18)
+    # eigenvectors are defined up to their sign
+    signs = np.sign(np.sum(evecs * evecs_ref, axis=-2))
+    np.testing.assert_allclose(evecs * signs[..., np.newaxis, :], evecs_ref,
+                               rtol=0, atol=1e-10)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = tenfit / np.trace(tenfit, axis1=3, axis2=4)[..., np.newaxis,
+                                                         np.newaxis]
+        FA_ref = np.sqrt(0.5 * (3 - 1/(np.trace(np.matmul(R, R), axis1=3,
+                                                axis2=4))))
+        FA_ref[np.isnan(FA_ref)] = 0
+        FA = dots._fractional_anisotropy(tensor_volume)
+
+        d_T, d_O, d_I = dots._diffusion_types(evals, mask)
+        d_T_ref = (evals_ref[..., 0] - evals_ref[..., 1]) / evals_ref[..., 0]
+        d_O_ref = (evals_ref[..., 0] - evals_ref[..., 2]) / evals_ref[..., 0]
+        d_I_ref = evals_ref[..., 2] / evals_ref[..., 0]
+    d_T_ref[~mask] = np.nan
+    d_O_ref[~mask] = np.nan
+    d_I_ref[~mask] = 1
+    np.testing.assert_allclose(FA, FA_ref, rtol=1e-10, atol=1e-12)
+    for value, ref in ((d_T, d_T_ref), (d_O, d_O_ref), (d_I, d_I_ref)):
+        np.testing.assert_allclose(value, ref, rtol=1e-10, atol=1e-12)
+
+
+# small atlas: isotropic, unclassified white matter, four tracts and pairs
+_N_T = 6
+_PAIRS = [{2, 3}, {2, 4}, {3, 5}, {4, 5}, {2, 5}]
+
+
+def _problem(seed=1):
+    # DOTS inputs on the phantom, with random atlas priors and directions
+    # near the principal diffusion directions (tracts 4 and 5 sharing
+    # theirs) and a few masked voxels on the volume border, where the
+    # neighborhoods are cut
+    tensor_volume, mask = _phantom()
+    mask[0, 3:5, 3:5] = True
+    tensor_volume[0, 3:5, 3:5] = tensor_volume[1, 3:5, 3:5]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        evals, evecs = dots._tensor_eigen(tensor_volume, mask)
+        d_T, d_O, d_I = dots._diffusion_types(evals, mask)
+
+    rng = np.random.RandomState(seed)
+    fiber_p = rng.rand(*(mask.shape + (_N_T,)))
+    fiber_p[fiber_p < 0.4] = 0
+    fiber_p[..., 0] *= 0.2
+    fiber_dir = evecs[..., 0, np.newaxis] + \
+        0.6*rng.randn(*(mask.shape + (3, _N_T)))
+    fiber_dir[..., 5] = fiber_dir[..., 4]
+    fiber_p[~mask, 0] = 1
+    fiber_p[~mask, 1:] = 0
+    fiber_dir[~mask] = 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_vol, s_vol = dots._neighbor_connectivity(evals, evecs, mask,
+                                                   _neighbor_directions())
+    # x plus and x minus of s_O are those of s_T, as in dots_segmentation
+    x_vol['p_O'], x_vol['m_O'] = x_vol['p_T'], x_vol['m_T']
+    return {'mask': mask, 'evecs': evecs, 'fiber_p': fiber_p,
+            'fiber_dir': fiber_dir, 'd_T': d_T, 'd_O': d_O, 'd_I': d_I,
+            'x': x_vol, 's': s_vol, 'pairs': [tuple(p) for p in _PAIRS],
+            'c_I': 1/2, 'c_O': 0.5, 'c_C': 90/67.5, 's_I': 1/42}
+
+
+def _c_l(vec, fiber_dir, l, m, c_C):
+    # Direction index (Eqs 8, 9) of one voxel, for tract l or pair l, m
+    if m is None:
+        return np.linalg.norm(fiber_dir[:, l]) * (1 - c_C * _theta(
+            vec, fiber_dir[:, l] / np.linalg.norm(fiber_dir[:, l])))
+    comp_dir = np.stack((fiber_dir[:, l] + fiber_dir[:, m],
+                         fiber_dir[:, l] - fiber_dir[:, m]))
+    comp_dir = comp_dir[np.argmax(np.linalg.norm(comp_dir, axis=1)), :]
+    comp_dir = (comp_dir / np.linalg.norm(comp_dir) *
+                (np.linalg.norm(fiber_dir[:, l]) +
+                 np.linalg.norm(fiber_dir[:, m])) / 2)
+    return np.linalg.norm(comp_dir) * (1 - c_C * _theta(
+        vec, comp_dir / np.linalg.norm(comp_dir)))
+
+
+def test_direction_coefficients_match_voxel_loop():
+    pb = _problem()
+    mask = pb['mask']
+    vec = pb['evecs'][mask][:, :, 0]
+    p, fiber_dir = pb['fiber_p'][mask], pb['fiber_dir'][mask]
+    c_l, c_lm = dots._direction_coefficients(vec, p, fiber_dir,
+                                             np.array(pb['pairs']), _N_T,
+                                             pb['c_C'])
+    c_l_ref = np.full(c_l.shape, np.nan)
+    c_lm_ref = np.full(c_lm.shape, np.nan)
+    for v in range(vec.shape[0]):
+        for l in range(1, _N_T):
+            if p[v, l] != 0:
+                c_l_ref[v, l] = _c_l(vec[v], fiber_dir[v], l, None,
+                                     pb['c_C'])
+        for n, (l, m) in enumerate(pb['pairs']):
+            if p[v, l] != 0 and p[v, m] != 0:
+                c_lm_ref[v, n] = _c_l(vec[v], fiber_dir[v], l, m, pb['c_C'])
+    # tracts 4 and 5 share their direction, so their pair is exercised
+    assert np.any(np.isfinite(c_lm_ref[:, pb['pairs'].index((4, 5))]))
+    np.testing.assert_allclose(c_l, c_l_ref, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(c_lm, c_lm_ref, rtol=1e-12, atol=1e-12)
+
+
+def _energies(pb, chunk_size=64):
+    # Unary energy and neighbors as dots_segmentation computes them
+    x, s = pb['x'], pb['s']
+    V1 = dots._calc_V1(pb['d_T'], pb['d_O'], pb['d_I'], pb['evecs'],
+                       pb['fiber_p'], pb['fiber_dir'], pb['c_I'], pb['c_O'],
+                       pb['c_C'], _PAIRS, _N_T, len(_PAIRS), pb['mask'],
+                       chunk_size=chunk_size)
+    neighbors = dots._mrf_neighbors(pb['mask'], _PAIRS, _N_T, s['p_T'],
+                                    s['m_T'], s['m_O'], s['p_O'], x['m_T'],
+                                    x['p_T'], x['m_O'], x['p_O'])
+    return V1, neighbors
+
+
+def _dense_inputs(pb):
+    # Shape priors u_l, u_lm, direction coefficients c_l, c_lm and
+    # connectivities as volumes, masked as in the original implementation
+    mask, fiber_p = pb['mask'], pb['fiber_p']
+    p_sum = np.nansum(fiber_p, axis=3)
+    u_l = fiber_p**2 / p_sum[..., np.newaxis]
+    u_l[..., 1] *= pb['c_O']
+    u_lm = np.stack([fiber_p[..., l]*fiber_p[..., m] *
+                     (fiber_p[..., l] + fiber_p[..., m]) / p_sum
+                     for l, m in pb['pairs']], axis=-1)
+    c_l = np.full(mask.shape + (_N_T,), np.nan)
+    c_lm = np.full(mask.shape + (len(_PAIRS),), np.nan)
+    c_l[mask], c_lm[mask] = dots._direction_coefficients(
+        pb['evecs'][mask][:, :, 0], fiber_p[mask], pb['fiber_dir'][mask],
+        np.array(pb['pairs']), _N_T, pb['c_C'])
+    u_l[~mask] = np.nan
+    u_l[~mask, 0] = 1
+    u_lm[~mask] = np.nan
+    u_l[u_l == 0] = np.nan
+    u_lm[u_lm == 0] = np.nan
+    s = {key: value.copy() for key, value in pb['s'].items()}
+    for value in s.values():
+        value[~mask] = np.nan
+    return {'u_l': u_l, 'u_lm': u_lm, 'c_l': c_l, 'c_lm': c_lm, 's': s}
+
+
+def _V1_loop(pb, dense):
+    # Unary energy (Eq 11) of each voxel of the mask, in double precision
+    mask, fiber_p = pb['mask'], pb['fiber_p']
+    u_l, u_lm, c_l, c_lm = (dense[key] for key in ('u_l', 'u_lm', 'c_l',
+                                                   'c_lm'))
+    V1 = np.zeros(mask.shape + (_N_T + len(_PAIRS),))
+    for i, j, k in np.argwhere(mask):
+        V1[i, j, k, 0] = pb['c_I'] * pb['d_I'][i, j, k] * u_l[i, j, k, 0]
+        for l in range(1, _N_T):
+            if fiber_p[i, j, k, l] == 0:
+                V1[i, j, k, l] = np.nan
+            else:
+                V1[i, j, k, l] = pb['d_T'][i, j, k] * u_l[i, j, k, l] * \
+                    c_l[i, j, k, l]
+        for n, (l, m) in enumerate(pb['pairs']):
+            if fiber_p[i, j, k, l] == 0 or fiber_p[i, j, k, m] == 0:
+                V1[i, j, k, _N_T+n] = np.nan
+            else:
+                V1[i, j, k, _N_T+n] = pb['d_O'][i, j, k] * \
+                    u_lm[i, j, k, n] * c_lm[i, j, k, n]
+    return V1
+
+
+def _U_loop(prev, V1, pb, dense):
+    # Total energy (Eq 12) of each voxel of the mask, from the energy of the
+    # previous iteration, in double precision
+    mask, fiber_p, s, x = pb['mask'], pb['fiber_p'], dense['s'], pb['x']
+    pairs = np.array(pb['pairs'])
+    U = np.zeros(V1.shape)
+    for i, j, k in np.argwhere(mask):
+        U[i, j, k, 0] = V1[i, j, k, 0] + \
+            (pb['s_I'] * (np.nansum(prev[i-1:i+2, j-1:j+2, k-1:k+2, 0]) -
+                          prev[i, j, k, 0]) / 26)
+        for l in range(1, _N_T):
+            if fiber_p[i, j, k, l] == 0:
+                U[i, j, k, l] = np.nan
+                continue
+            labels = np.concatenate(([l], np.where(np.any(pairs == l,
+                                                          axis=1))[0]+_N_T))
+            U[i, j, k, l] = V1[i, j, k, l] + \
+                0.5 * (s['p_T'][i, j, k] *
+                       np.nanmax(prev[tuple(x['p_T'][i, j, k])][labels])) + \
+                0.5 * (s['m_T'][i, j, k] *
+                       np.nanmax(prev[tuple(x['m_T'][i, j, k])][labels]))
+        for n, (l, m) in enumerate(pb['pairs']):
+            idx = _N_T + n
+            if fiber_p[i, j, k, l] == 0 or fiber_p[i, j, k, m] == 0:
+                U[i, j, k, idx] = np.nan
+                continue
+            U[i, j, k, idx] = V1[i, j, k, idx] + \
+                0.5 * (s['p_O'][i, j, k] *
+                       np.nanmax(prev[tuple(x['p_O'][i, j, k])][[idx, l, m]])
+                       ) + \
+                0.5 * (s['m_O'][i, j, k] *
+                       np.nanmax(prev[tuple(x['m_O'][i, j, k])][[idx, l, m]]))
+    return U
+
+
+def test_icm_labels_match_voxel_loop():
+    pb = _problem()
+    mask = pb['mask']
+    with np.errstate(divide='ignore', invalid='ignore'), \
+            warnings.catch_warnings():
+        # all-nan neighbor energies in the reference loop
+        warnings.simplefilter('ignore', RuntimeWarning)
+        V1, neighbors = _energies(pb)
+        dense = _dense_inputs(pb)
+        V1_ref = _V1_loop(pb, dense)
+        U, U_ref = V1, V1_ref
+        for iteration in range(4):
+            U = dots._calc_U(U, V1, pb['s_I'], neighbors, _N_T, len(_PAIRS))
+            U_ref = _U_loop(U_ref, V1_ref, pb, dense)
+            labels = dots._calc_segmentation(U)[:-1]
+            np.testing.assert_array_equal(
+                labels, dots._calc_segmentation(U_ref)[mask],
+                err_msg='iteration {0}'.format(iteration))
+    # the phantom exercises isotropic, single and overlapping tract labels
+    assert 0 in labels and np.any((labels > 1) & (labels < _N_T)) \
+        and np.any(labels >= _N_T)
+
+
+def _scatter(U, mask):
+    # Energies of the voxels of the mask back in volume space (zero
+    # elsewhere, as the last row stands for)
+    dense = np.zeros(mask.shape + U.shape[1:])
+    dense[mask] = U[:-1]
+    return dense
+
+
+def test_float32_energies_match_dense_double_precision():
+    pb = _problem()
+    mask = pb['mask']
+    with np.errstate(divide='ignore', invalid='ignore'), \
+            warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        V1, neighbors = _energies(pb)
+        dense = _dense_inputs(pb)
+        V1_ref = _V1_loop(pb, dense)
+        assert V1.dtype == np.float32
+        assert V1.shape == (np.sum(mask) + 1, _N_T + len(_PAIRS))
+        assert not np.any(V1[-1])
+        # the unary energy is computed in double precision, then rounded
+        np.testing.assert_array_equal(_scatter(V1, mask),
+                                      V1_ref.astype(np.float32))
+
+        U, U_ref = V1, V1_ref
+        for iteration in range(10):
+            U = dots._calc_U(U, V1, pb['s_I'], neighbors, _N_T, len(_PAIRS))
+            U_ref = _U_loop(U_ref, V1_ref, pb, dense)
+            assert U.dtype == np.float32 and not np.any(U[-1])
+            np.testing.assert_allclose(_scatter(U, mask), U_ref, rtol=1e-5,
+                                       atol=1e-6,
+                                       err_msg='iteration {0}'.format(
+                                           iteration))
+    np.testing.assert_array_equal(dots._calc_segmentation(U)[:-1],
+                                  dots._calc_segmentation(U_ref)[mask])
@@ -0,0 +1,236 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+import numpy as np
+import nibabel as nb
+from nighres import global_settings
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (e.g. Windows), manifests are only locked per process
+    fcntl = None
+
+try:
+    from importlib.metadata import version as _package_version
+    _VERSION = _package_version('nighres')
+except Exception:
+    _VERSION = ''
+
+# manifest of the results saved in an output directory
+MANIFEST = 'nighres_manifest.json'
+
+# arguments that choose where and whether results are saved, not what they
+# contain (the output file names identify the results in the manifest)
+_IGNORED_ARGUMENTS = ('save_data', 'overwrite', 'output_dir', 'file_name',
+                      'log_file')
+
+# stack of the cached calls running in each thread
+_local = threading.local()
+_manifest_lock = threading.Lock()
+
+
+class _Call(object):
+    # Arguments of a running cached call, its key is only computed when an
+    # output is checked or saved
+
+    def __init__(self, func, arguments):
+        self.function = func.__module__ + '.' + func.__name__
+        self.arguments = arguments
+        self._key = None
+
+    def key(self):
+        if self._key is None:
+            digest = hashlib.sha256()
+            digest.update(json.dumps([self.function, _VERSION,
+                                      global_settings.RESULT_CACHE]).encode())
+            for name in sorted(self.arguments):
+                digest.update(json.dumps([name, _token(
+                                    self.arguments[name])]).encode())
+            self._key = digest.hexdigest()
+        return self._key
+
+
+def _hash_array(array):
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str((array.dtype.str, array.shape)).encode())
+    digest.update(array.data)
+    return digest.hexdigest()
+
+
+def _hash_file(filename):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as data:
+        for block in iter(lambda: data.read(1 << 24), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _token(value):
+    # JSON-serialisable identity of an argument value: input files by their
+    # size and modification time (or content), in-memory images and arrays
+    # by a hash of their data
+    if isinstance(value, str):
+        if os.path.isfile(value):
+            if global_settings.RESULT_CACHE == 'content':
+                return ['file', os.path.abspath(value), _hash_file(value)]
+            stat = os.stat(value)
+            return ['file', os.path.abspath(value), stat.st_size,
+                    stat.st_mtime_ns]
+        return value
+    if isinstance(value, nb.spatialimages.SpatialImage):
+        return ['image', _hash_array(np.asanyarray(value.dataobj)),
+                _hash_array(value.affine)]
+    if isinstance(value, np.ndarray):
+        return ['array', _hash_array(value)]
+    if isinstance(value, dict):
+        return ['dict', [[str(key), _token(value[key])]
+                         for key in sorted(value, key=str)]]
+    if isinstance(value, (list, tuple)):
+        return ['list', [_token(item) for item in value]]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def _current():
+    # Innermost cached call of this thread, or None
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+def cached(func):
+    """
+    Decorator making the existing results of a nighres function reusable
+    only if they were computed with the same parameters and inputs
+
+    While the function runs, the outputs it saves with
+    :func:`nighres.io.save_volume` or the mesh I/O functions are recorded in
+    the manifest of their directory (nighres_manifest.json), together with a
+    key computed from the function, its parameters and its inputs. When
+    overwrite is False, the function skips the computation only if all its
+    outputs are recorded with the key of the current call and unchanged
+    since. Input files are identified by their size and modification time,
+    or by their content with global_settings.RESULT_CACHE = 'content';
+    in-memory images by their data. The key is only computed when an output
+    is checked or saved.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if global_settings.RESULT_CACHE == 'off':
+            return func(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {name: value for name, value in bound.arguments.items()
+                     if name not in _IGNORED_ARGUMENTS}
+        stack = _local.__dict__.setdefault('stack', [])
+        stack.append(_Call(func, arguments))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stack.pop()
+
+    return wrapper
+
+
+def _manifest_file(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), MANIFEST)
+
+
+def load_manifest(output_dir):
+    """
+    Load the manifest of the results saved in a directory
+
+    Parameters
+    ----------
+    output_dir: str
+        Directory of saved nighres results
+
+    Returns
+    ----------
+    dict
+        For each output file name, the function that computed it, its
+        cache key, the size and modification time of the file and the time
+        it was recorded
+    """
+    manifest = os.path.join(output_dir, MANIFEST)
+    if not os.path.isfile(manifest):
+        return {}
+    try:
+        with open(manifest) as data:
+            return json.load(data)
+    except ValueError:
+        # damaged manifest: all results will be recomputed
+        return {}
+
+
+def _is_cached(filename):
+    # Whether an existing output of the running cached call can be reused:
+    # the file exists and the manifest of its directory shows that it was
+    # saved by a call with the same key and has not changed since. Replaces
+    # os.path.isfile() in the overwrite checks of the nighres functions.
+    if not os.path.isfile(filename):
+        return False
+    call = _current()
+    if call is None or global_settings.RESULT_CACHE == 'off':
+        return True
+    entry = load_manifest(os.path.dirname(os.path.abspath(filename))).get(
+                os.path.basename(filename))
+    if entry is None or entry.get('key') != call.key():
+        return False
+    stat = os.stat(filename)
+    return entry.get('size') == stat.st_size \
+        and entry.get('mtime_ns') == stat.st_mtime_ns
+
+
+def _output_call():
+    # Running cached call of this thread, to be passed to _record_output when
+    # an output is written later on (e.g. by a background save)
+    if global_settings.RESULT_CACHE == 'off':
+        return None
+    call = _current()
+    if call is not None:
+        # hash the inputs now rather than from the writing thread
+        call.key()
+    return call
+
+
+def _record_output(filename, call=None):
+    # Record a saved output in the manifest of its directory, under the key
+    # of the cached call that produced it (by default the running one)
+    if call is None:
+        call = _output_call()
+    if call is None or not os.path.isfile(filename):
+        return
+    stat = os.stat(filename)
+    entry = {'function': call.function, 'key': call.key(),
+             'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+             'time': time.time()}
+
+    manifest = _manifest_file(filename)
+    with _manifest_lock, open(manifest + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            entries = load_manifest(os.path.dirname(manifest))
+            entries[os.path.basename(filename)] = entry
+            # replace the manifest atomically, readers do not lock it
+            temporary = '{0}.{1}.tmp'.format(manifest, os.getpid())
+            with open(temporary, 'w') as data:
+                json.dump(entries, data, indent=1, sort_keys=True)
+            os.replace(temporary, manifest)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -1 +1,5 @@
-from nighres.cortex.cruise_cortex_extraction import cruise_cortex_extraction
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'cruise_cortex_extraction': '.cruise_cortex_extraction'})
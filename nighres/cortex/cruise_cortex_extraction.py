@@ -4,11 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume, time_log
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
                     _check_topology_lut_dir, _check_atlas_file, \
-                    _check_available_memory
+                    _to_java, _from_java, _volume_data
 import time
 
+@profiled
+@cached
 def cruise_cortex_extraction(init_image, wm_image, gm_image, csf_image,
                              vd_image=None, data_weight=0.4,
                              regularization_weight=0.1,
@@ -163,14 +168,14 @@ def cruise_cortex_extraction(init_image, wm_image, gm_image, csf_image,
                                    rootfile=gm_image,
                                    suffix='cruise-pcsf', ))
         if overwrite is False \
-            and os.path.isfile(cortex_file) \
-            and os.path.isfile(gwb_file) \
-            and os.path.isfile(cgb_file) \
-            and os.path.isfile(avg_file) \
-            and os.path.isfile(thick_file) \
-            and os.path.isfile(pwm_file) \
-            and os.path.isfile(pgm_file) \
-            and os.path.isfile(pcsf_file) :
+            and _is_cached(cortex_file) \
+            and _is_cached(gwb_file) \
+            and _is_cached(cgb_file) \
+            and _is_cached(avg_file) \
+            and _is_cached(thick_file) \
+            and _is_cached(pwm_file) \
+            and _is_cached(pgm_file) \
+            and _is_cached(pcsf_file) :
 
             print("skip computation (use existing results)")
             output = {'cortex': cortex_file,
@@ -184,11 +189,8 @@ def cruise_cortex_extraction(init_image, wm_image, gm_image, csf_image,
             return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     cruise = nighresjava.CortexOptimCRUISE()
 
@@ -204,34 +206,30 @@ def cruise_cortex_extraction(init_image, wm_image, gm_image, csf_image,
 
     # load images
     init = load_volume(init_image, log_file=log_file)
-    init_data = init.get_data()
+    init_data = _volume_data(init, 'int')
     affine = init.affine
     header = init.header
     resolution = [x.item() for x in header.get_zooms()]
     dimensions = init_data.shape
     cruise.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     cruise.setResolutions(resolution[0], resolution[1], resolution[2])
-    cruise.importInitialWMSegmentationImage(nighresjava.JArray('int')(
-                                (init_data.flatten('F')).astype(int).tolist()))
+    cruise.importInitialWMSegmentationImage(_to_java(init_data, 'int'))
 
-    wm_data = load_volume(wm_image, log_file=log_file).get_data()
-    cruise.setFilledWMProbabilityImage(nighresjava.JArray('float')(
-                                        (wm_data.flatten('F')).astype(float)))
+    wm_data = _volume_data(load_volume(wm_image, log_file=log_file), 'float')
+    cruise.setFilledWMProbabilityImage(_to_java(wm_data, 'float'))
 
-    gm_data = load_volume(gm_image, log_file=log_file).get_data()
-    cruise.setGMProbabilityImage(nighresjava.JArray('float')(
-                                        (gm_data.flatten('F')).astype(float)))
+    gm_data = _volume_data(load_volume(gm_image, log_file=log_file), 'float')
+    cruise.setGMProbabilityImage(_to_java(gm_data, 'float'))
 
-    csf_data = load_volume(csf_image, log_file=log_file).get_data()
-    cruise.setCSFandBGProbabilityImage(nighresjava.JArray('float')(
-                                        (csf_data.flatten('F')).astype(float)))
+    csf_data = _volume_data(load_volume(csf_image, log_file=log_file), 'float')
+    cruise.setCSFandBGProbabilityImage(_to_java(csf_data, 'float'))
 
     if vd_image is not None:
-        vd_data = load_volume(vd_image, log_file=log_file).get_data()
-        cruise.setVeinsAndDuraProbabilityImage(nighresjava.JArray('float')(
-                                        (vd_data.flatten('F')).astype(float)))
+        vd_data = _volume_data(load_volume(vd_image, log_file=log_file), 'float')
+        cruise.setVeinsAndDuraProbabilityImage(_to_java(vd_data, 'float'))
 
     # execute
+    phase('execute')
     try:
         cruise.execute()
 
@@ -241,24 +239,17 @@ def cruise_cortex_extraction(init_image, wm_image, gm_image, csf_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    cortex_data = np.reshape(np.array(cruise.getCortexMask(),
-                                      dtype=np.int32), dimensions, 'F')
-    gwb_data = np.reshape(np.array(cruise.getWMGMLevelset(),
-                                   dtype=np.float32), dimensions, 'F')
-    cgb_data = np.reshape(np.array(cruise.getGMCSFLevelset(),
-                                   dtype=np.float32), dimensions, 'F')
-    avg_data = np.reshape(np.array(cruise.getCentralLevelset(),
-                                   dtype=np.float32), dimensions, 'F')
-    thick_data = np.reshape(np.array(cruise.getCorticalThickness(),
-                                     dtype=np.float32), dimensions, 'F')
-    pwm_data = np.reshape(np.array(cruise.getCerebralWMprobability(),
-                                   dtype=np.float32), dimensions, 'F')
-    pgm_data = np.reshape(np.array(cruise.getCorticalGMprobability(),
-                                   dtype=np.float32), dimensions, 'F')
-    pcsf_data = np.reshape(np.array(cruise.getSulcalCSFprobability(),
-                                    dtype=np.float32), dimensions, 'F')
+    cortex_data = _from_java(cruise.getCortexMask(), dimensions, np.int32)
+    gwb_data = _from_java(cruise.getWMGMLevelset(), dimensions)
+    cgb_data = _from_java(cruise.getGMCSFLevelset(), dimensions)
+    avg_data = _from_java(cruise.getCentralLevelset(), dimensions)
+    thick_data = _from_java(cruise.getCorticalThickness(), dimensions)
+    pwm_data = _from_java(cruise.getCerebralWMprobability(), dimensions)
+    pgm_data = _from_java(cruise.getCorticalGMprobability(), dimensions)
+    pcsf_data = _from_java(cruise.getSulcalCSFprobability(), dimensions)
 
     # adapt header min, max for each image so that correct max is displayed
     # and create nifiti objects
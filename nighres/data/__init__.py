@@ -1,6 +1,10 @@
-from nighres.data.download_data import download_7T_TRT
-from nighres.data.download_data import download_DTI_2mm
-from nighres.data.download_data import download_DOTS_atlas
-from nighres.data.download_data import download_MASSP_atlas
-from nighres.data.download_data import download_MP2RAGEME_sample
-from nighres.data.download_data import download_AHEAD_template
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'download_7T_TRT': '.download_data',
+    'download_DTI_2mm': '.download_data',
+    'download_DOTS_atlas': '.download_data',
+    'download_MASSP_atlas': '.download_data',
+    'download_MP2RAGEME_sample': '.download_data',
+    'download_AHEAD_template': '.download_data'})
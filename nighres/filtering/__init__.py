@@ -1,6 +1,8 @@
-from nighres.filtering.filter_ridge_structures import filter_ridge_structures
-from nighres.filtering.recursive_ridge_diffusion import recursive_ridge_diffusion
-from nighres.filtering.total_variation_filtering import total_variation_filtering
-from nighres.filtering.multiscale_vessel_filter import multiscale_vessel_filter
-#from nighres.filtering.multiscale_vessel_filter import multiscale_vessel_filter_prior
+from nighres._lazy import lazy_functions
 
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'filter_ridge_structures': '.filter_ridge_structures',
+    'recursive_ridge_diffusion': '.recursive_ridge_diffusion',
+    'total_variation_filtering': '.total_variation_filtering',
+    'multiscale_vessel_filter': '.multiscale_vessel_filter'})
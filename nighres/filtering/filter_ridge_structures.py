@@ -4,9 +4,17 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..tiling import tileable
 from ..utils import _output_dir_4saving, _fname_4saving, \
-    _check_topology_lut_dir, _check_atlas_file, _check_available_memory
+    _check_topology_lut_dir, _check_atlas_file, \
+    _to_java, _from_java, _volume_data
 
+@tileable(images=('input_image',), halo=4)
+@profiled
+@cached
 def filter_ridge_structures(input_image,
                             structure_intensity='bright',
                             output_type='probability',
@@ -63,18 +71,15 @@ def filter_ridge_structures(input_image,
                                        rootfile=input_image,
                                        suffix='rdg-img', ))
         if overwrite is False \
-            and os.path.isfile(ridge_file) :
+            and _is_cached(ridge_file) :
 
             print("skip computation (use existing results)")
             output = {'result': ridge_file}
             return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     filter_ridge = nighresjava.FilterRidgeStructures()
 
@@ -86,7 +91,6 @@ def filter_ridge_structures(input_image,
 
     # load images and set dimensions and resolution
     input_image = load_volume(input_image)
-    data = input_image.get_data()
     affine = input_image.affine
     header = input_image.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -96,12 +100,12 @@ def filter_ridge_structures(input_image,
     filter_ridge.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     filter_ridge.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    data = load_volume(input_image).get_data()
-    filter_ridge.setInputImage(nighresjava.JArray('float')(
-                               (data.flatten('F')).astype(float)))
+    data = _volume_data(input_image, 'float')
+    filter_ridge.setInputImage(_to_java(data, 'float'))
 
 
     # execute
+    phase('execute')
     try:
         filter_ridge.execute()
 
@@ -111,11 +115,10 @@ def filter_ridge_structures(input_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # Collect output
-    ridge_structure_image_data = np.reshape(np.array(
-                                    filter_ridge.getRidgeStructureImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    ridge_structure_image_data = _from_java(filter_ridge.getRidgeStructureImage(), dimensions)
 
     if output_type == 'probability':
         header['cal_min'] = 0.0
@@ -9,10 +9,23 @@ import nibabel as nb
 # nighresjava and nighres functions
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..tiling import tileable
 from ..utils import _output_dir_4saving, _fname_4saving, \
-    _check_topology_lut_dir, _check_atlas_file, _check_available_memory
+    _check_topology_lut_dir, _check_atlas_file, \
+    _to_java, _from_java, _volume_data
 
 
+def _vessel_halo(arguments, resolution):
+    # support of the derivatives at the largest scale (in voxels)
+    return int(np.ceil(3*arguments['scale_step']*arguments['scales'])) + 2
+
+
+@tileable(images=('input_image', 'prior_image'), halo=_vessel_halo)
+@profiled
+@cached
 def multiscale_vessel_filter(input_image,
 			            structure_intensity='bright',
                         filterType = 'RRF',
@@ -148,15 +161,15 @@ def multiscale_vessel_filter(input_image,
                                   suffix='mvf-dir'))
 
         if overwrite is False \
-            and os.path.isfile(vesselImage_file) \
-            and os.path.isfile(filterImage_file) \
-            and os.path.isfile(probaImage_file) \
-            and os.path.isfile(scaleImage_file) \
-            and os.path.isfile(diameterImage_file) \
-            and os.path.isfile(pvImage_file) \
-            and os.path.isfile(lengthImage_file) \
-            and os.path.isfile(labelImage_file) \
-	    and os.path.isfile(directionImage_file) :
+            and _is_cached(vesselImage_file) \
+            and _is_cached(filterImage_file) \
+            and _is_cached(probaImage_file) \
+            and _is_cached(scaleImage_file) \
+            and _is_cached(diameterImage_file) \
+            and _is_cached(pvImage_file) \
+            and _is_cached(lengthImage_file) \
+            and _is_cached(labelImage_file) \
+	    and _is_cached(directionImage_file) :
                 output = {'segmentation': vesselImage_file,
                           'filtered': filterImage_file,
                           'probability': probaImage_file,
@@ -172,11 +185,8 @@ def multiscale_vessel_filter(input_image,
 
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     vessel_filter = nighresjava.MultiscaleVesselFilter()
 
@@ -195,7 +205,6 @@ def multiscale_vessel_filter(input_image,
 
     # load images and set dimensions and resolution
     input_image = load_volume(input_image)
-    data = input_image.get_data()
     affine = input_image.get_affine()
     header = input_image.get_header()
     resolution = [x.item() for x in header.get_zooms()]
@@ -207,16 +216,16 @@ def multiscale_vessel_filter(input_image,
     vessel_filter.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     vessel_filter.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    data = load_volume(input_image).get_data()
-    vessel_filter.setInputImage(nighresjava.JArray('float')(
-                               (data.flatten('F')).astype(float)))
+    data = _volume_data(input_image, 'float')
+    vessel_filter.setInputImage(_to_java(data, 'float'))
 
     if not (prior_image==None):
         prior = load_volume(prior_image)
-        data_prior = prior.get_data()
-        vessel_filter.setPriorImage(nighresjava.JArray('float')((data_prior.flatten('F')).astype(float)))
+        data_prior = _volume_data(prior, 'float')
+        vessel_filter.setPriorImage(_to_java(data_prior, 'float'))
 
     # execute
+    phase('execute')
     try:
         vessel_filter.execute()
 
@@ -226,35 +235,18 @@ def multiscale_vessel_filter(input_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # Collect output
-    vesselImage_data = np.reshape(np.array(
-                                    vessel_filter.getSegmentedVesselImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    filterImage_data = np.reshape(np.array(
-                                    vessel_filter.getFilteredImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    probaImage_data = np.reshape(np.array(
-                                    vessel_filter.getProbabilityImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    scaleImage_data = np.reshape(np.array(
-                                    vessel_filter.getScaleImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    diameterImage_data = np.reshape(np.array(
-                                    vessel_filter.getDiameterImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    pvImage_data = np.reshape(np.array(
-                                    vessel_filter.getPVimage(),
-                                    dtype=np.float32), dimensions, 'F')
-    lengthImage_data = np.reshape(np.array(
-                                    vessel_filter.getLengthImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    labelImage_data = np.reshape(np.array(
-                                    vessel_filter.getLabelImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    directionImage_data = np.reshape(np.array(
-                                    vessel_filter.getDirectionImage(),
-                                    dtype=np.float32), dimensions4d, 'F')
+    vesselImage_data = _from_java(vessel_filter.getSegmentedVesselImage(), dimensions)
+    filterImage_data = _from_java(vessel_filter.getFilteredImage(), dimensions)
+    probaImage_data = _from_java(vessel_filter.getProbabilityImage(), dimensions)
+    scaleImage_data = _from_java(vessel_filter.getScaleImage(), dimensions)
+    diameterImage_data = _from_java(vessel_filter.getDiameterImage(), dimensions)
+    pvImage_data = _from_java(vessel_filter.getPVimage(), dimensions)
+    lengthImage_data = _from_java(vessel_filter.getLengthImage(), dimensions)
+    labelImage_data = _from_java(vessel_filter.getLabelImage(), dimensions)
+    directionImage_data = _from_java(vessel_filter.getDirectionImage(), dimensions4d)
 
 
     # adapt header max for each image so that correct max is displayed
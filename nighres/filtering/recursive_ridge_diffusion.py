@@ -4,11 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
                     _check_topology_lut_dir, _check_atlas_file, \
-                    _check_available_memory
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def recursive_ridge_diffusion(input_image, ridge_intensities, ridge_filter,
                               surface_levelset=None, orientation='undefined',
                               loc_prior=None,
@@ -129,12 +134,12 @@ def recursive_ridge_diffusion(input_image, ridge_intensities, ridge_filter,
                                   suffix='rrd-size'))
 
         if overwrite is False \
-            and os.path.isfile(filter_file) \
-            and os.path.isfile(propagation_file) \
-            and os.path.isfile(scale_file) \
-            and os.path.isfile(ridge_direction_file) \
-            and os.path.isfile(ridge_pv_file) \
-            and os.path.isfile(ridge_size_file) :
+            and _is_cached(filter_file) \
+            and _is_cached(propagation_file) \
+            and _is_cached(scale_file) \
+            and _is_cached(ridge_direction_file) \
+            and _is_cached(ridge_pv_file) \
+            and _is_cached(ridge_size_file) :
 
             print("skip computation (use existing results)")
             output = {'filter': filter_file,
@@ -148,7 +153,7 @@ def recursive_ridge_diffusion(input_image, ridge_intensities, ridge_filter,
 
     # load input image and use it to set dimensions and resolution
     img = load_volume(input_image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -157,11 +162,8 @@ def recursive_ridge_diffusion(input_image, ridge_intensities, ridge_filter,
     if (len(resolution)<3): resolution = [resolution[0], resolution[1], 1.0]
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create extraction instance
     if dimensions[2]==1: rrd = nighresjava.FilterRecursiveRidgeDiffusion2D()
     else: rrd = nighresjava.FilterRecursiveRidgeDiffusion()
@@ -184,27 +186,25 @@ def recursive_ridge_diffusion(input_image, ridge_intensities, ridge_filter,
     rrd.setResolutions(resolution[0], resolution[1], resolution[2])
 
     # input input_image
-    rrd.setInputImage(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+    rrd.setInputImage(_to_java(data, 'float'))
 
     # input surface_levelset : dirty fix for the case where surface image not input
     try:
-        data = load_volume(surface_levelset).get_data()
-        rrd.setSurfaceLevelSet(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(surface_levelset), 'float')
+        rrd.setSurfaceLevelSet(_to_java(data, 'float'))
     except:
         print("no surface image")
 
     # input location prior image : loc_prior is optional
     try:
-        data = load_volume(loc_prior).get_data()
-        rrd.setLocationPrior(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(loc_prior), 'float')
+        rrd.setLocationPrior(_to_java(data, 'float'))
     except:
         print("no location prior image")
 
 
     # execute Extraction
+    phase('execute')
     try:
         rrd.execute()
 
@@ -214,33 +214,23 @@ def recursive_ridge_diffusion(input_image, ridge_intensities, ridge_filter,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    filter_data = np.reshape(np.array(rrd.getFilterResponseImage(),
-                                   dtype=np.float32), dimensions, 'F')
+    filter_data = _from_java(rrd.getFilterResponseImage(), dimensions)
 
-    propagation_data = np.reshape(np.array(rrd.getPropagatedResponseImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    propagation_data = _from_java(rrd.getPropagatedResponseImage(), dimensions)
 
-    scale_data = np.reshape(np.array(rrd.getDetectionScaleImage(),
-                                   dtype=np.int32), dimensions, 'F')
+    scale_data = _from_java(rrd.getDetectionScaleImage(), dimensions, np.int32)
 
     if dimensions[2]==1:
-        ridge_direction_data = np.reshape(np.array(rrd.getRidgeDirectionImage(),
-                                    dtype=np.float32),
-                                    (dimensions[0],dimensions[1],2),
-                                    'F')
+        ridge_direction_data = _from_java(rrd.getRidgeDirectionImage(), (dimensions[0],dimensions[1],2))
     else:
-        ridge_direction_data = np.reshape(np.array(rrd.getRidgeDirectionImage(),
-                                    dtype=np.float32),
-                                    (dimensions[0],dimensions[1],dimensions[2],3),
-                                    'F')
+        ridge_direction_data = _from_java(rrd.getRidgeDirectionImage(), (dimensions[0],dimensions[1],dimensions[2],3))
 
-    ridge_pv_data = np.reshape(np.array(rrd.getRidgePartialVolumeImage(),
-                                   dtype=np.float32), dimensions, 'F')
+    ridge_pv_data = _from_java(rrd.getRidgePartialVolumeImage(), dimensions)
 
-    ridge_size_data = np.reshape(np.array(rrd.getRidgeSizeImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    ridge_size_data = _from_java(rrd.getRidgeSizeImage(), dimensions)
 
 
     # adapt header max for each image so that correct max is displayed
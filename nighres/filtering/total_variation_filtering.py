@@ -4,10 +4,19 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..tiling import tileable
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+# the filter is iterative, tiled results differ slightly near block edges
+@tileable(images=('image', 'mask'), halo=16)
+@profiled
+@cached
 def total_variation_filtering(image, mask=None, lambda_scale=0.05,
                       tau_step=0.125,max_dist=1e-4,max_iter=500,
                       save_data=False, overwrite=False, output_dir=None,
@@ -76,18 +85,15 @@ def total_variation_filtering(image, mask=None, lambda_scale=0.05,
                                    suffix='tv-res'))
 
         if overwrite is False \
-            and os.path.isfile(out_file) and os.path.isfile(res_file) :
+            and _is_cached(out_file) and _is_cached(res_file) :
                 print("skip computation (use existing results)")
                 output = {'filtered': out_file,
                           'residual': res_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     algo = nighresjava.TotalVariationFiltering()
 
@@ -95,7 +101,7 @@ def total_variation_filtering(image, mask=None, lambda_scale=0.05,
 
     # load image and use it to set dimensions and resolution
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -104,13 +110,11 @@ def total_variation_filtering(image, mask=None, lambda_scale=0.05,
     algo.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     algo.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    algo.setImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    algo.setImage(_to_java(data, 'float'))
 
 
     if mask is not None:
-        algo.setMaskImage(idx, nighresjava.JArray('int')(
-                (load_volume(mask).get_data().flatten('F')).astype(int).tolist()))
+        algo.setMaskImage(idx, _to_java(load_volume(mask), 'int'))
 
     # set algorithm parameters
     algo.setLambdaScale(lambda_scale)
@@ -119,6 +123,7 @@ def total_variation_filtering(image, mask=None, lambda_scale=0.05,
     algo.setMaxIter(max_iter)
 
     # execute the algorithm
+    phase('execute')
     try:
         algo.execute()
 
@@ -128,10 +133,10 @@ def total_variation_filtering(image, mask=None, lambda_scale=0.05,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    filtered_data = np.reshape(np.array(algo.getFilteredImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    filtered_data = _from_java(algo.getFilteredImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -140,8 +145,7 @@ def total_variation_filtering(image, mask=None, lambda_scale=0.05,
     out = nb.Nifti1Image(filtered_data, affine, header)
 
     # reshape output to what nibabel likes
-    residual_data = np.reshape(np.array(algo.getResidualImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    residual_data = _from_java(algo.getResidualImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
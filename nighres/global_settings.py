@@ -14,4 +14,72 @@ DEFAULT_MASSP_SPATIAL_LABEL = os.path.join(DEFAULT_MASSP_ATLAS,'massp_17structur
 DEFAULT_MASSP_SKEL_PROBA = os.path.join(DEFAULT_MASSP_ATLAS,'massp_17structures_skeleton_proba.nii.gz')
 DEFAULT_MASSP_SKEL_LABEL = os.path.join(DEFAULT_MASSP_ATLAS,'massp_17structures_skeleton_label.nii.gz')
 
-DEFAULT_AHEAD_TEMPLATE_DIR = os.path.join(ATLAS_DIR, 'ahead-template')
\ No newline at end of file
+DEFAULT_AHEAD_TEMPLATE_DIR = os.path.join(ATLAS_DIR, 'ahead-template')
+
+def _env_flag(name, default=False):
+    # read a boolean switch from the environment (1/true/yes/on)
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# I/O defaults, read from the environment at import time and can be changed
+# at runtime, e.g. nighres.global_settings.LOAD_MMAP = True
+
+# memory-map uncompressed volumes in nighres.io.load_volume
+LOAD_MMAP = _env_flag('NIGHRES_LOAD_MMAP')
+
+# worker threads for gzip (de)compression of volumes, 0 uses all cores
+IO_THREADS = int(os.environ.get('NIGHRES_IO_THREADS', 0))
+
+# write volumes from background threads in nighres.io.save_volume
+SAVE_BACKGROUND = _env_flag('NIGHRES_SAVE_BACKGROUND')
+SAVE_WORKERS = int(os.environ.get('NIGHRES_SAVE_WORKERS', 2))
+
+# compression of volumes written by nighres.io.save_volume: 'none' writes
+# plain .nii files, 'gzip' a regular single-threaded .nii.gz stream and
+# 'bgzf' a .nii.gz made of independent blocks, deflated on IO_THREADS cores
+SAVE_COMPRESSION = os.environ.get('NIGHRES_SAVE_COMPRESSION', 'none')
+SAVE_COMPRESSION_LEVEL = int(os.environ.get('NIGHRES_SAVE_COMPRESSION_LEVEL',
+                                            1))
+
+# memory budget in MB of the volume cache of nighres.io.load_volume,
+# 0 disables caching
+VOLUME_CACHE_MB = float(os.environ.get('NIGHRES_VOLUME_CACHE_MB', 0))
+
+# time log events are buffered and appended to a .jsonl file every
+# TIME_LOG_BUFFER events or TIME_LOG_INTERVAL seconds, set TIME_LOG_SHARDS
+# to write one file per process (e.g. on filesystems without file locks)
+TIME_LOG_BUFFER = int(os.environ.get('NIGHRES_TIME_LOG_BUFFER', 100))
+TIME_LOG_INTERVAL = float(os.environ.get('NIGHRES_TIME_LOG_INTERVAL', 10.0))
+TIME_LOG_SHARDS = _env_flag('NIGHRES_TIME_LOG_SHARDS')
+
+# record the load, to_java, execute, from_java and save phases of every
+# nighres function in the time log (see nighres.profiling), functions
+# without a log_file argument log to PROFILING_LOG
+PROFILING = _env_flag('NIGHRES_PROFILING')
+PROFILING_LOG = os.environ.get('NIGHRES_PROFILING_LOG', 'timelog.json')
+
+# also sample the memory use (Python process RSS and JVM heap) at every phase
+# boundary and log the peaks of each phase
+PROFILING_MEMORY = _env_flag('NIGHRES_PROFILING_MEMORY')
+
+# Java virtual machine started by the first nighres function that needs it
+# (see nighres.jvm.start_jvm): initial and maximum heap as a size ('4g') or
+# a percentage of the available memory ('25%'), divided between the
+# JVM_PROCESSES processes sharing the node, garbage collector ('g1',
+# 'parallel', 'serial', 'z', 'shenandoah', empty for the JVM default),
+# processors used by Java (0 for all) and additional JVM options
+JVM_INITIAL_HEAP = os.environ.get('NIGHRES_JVM_INITIAL_HEAP', '25%')
+JVM_MAX_HEAP = os.environ.get('NIGHRES_JVM_MAX_HEAP', '95%')
+JVM_PROCESSES = int(os.environ.get('NIGHRES_JVM_PROCESSES', 1))
+JVM_GC = os.environ.get('NIGHRES_JVM_GC', '')
+JVM_THREADS = int(os.environ.get('NIGHRES_JVM_THREADS', 0))
+JVM_OPTIONS = os.environ.get('NIGHRES_JVM_OPTIONS', '')
+
+# reuse existing results (when overwrite is False) only if the manifest next
+# to them shows they were computed with the same parameters and inputs (see
+# nighres.cache): 'mtime' identifies input files by size and modification
+# time, 'content' by a hash of their content, 'off' reuses any existing file
+RESULT_CACHE = os.environ.get('NIGHRES_RESULT_CACHE', 'mtime')
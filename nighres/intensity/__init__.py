@@ -1,10 +1,14 @@
-from nighres.intensity.background_estimation import background_estimation
-from nighres.intensity.flash_t2s_fitting import flash_t2s_fitting
-from nighres.intensity.intensity_propagation import intensity_propagation
-from nighres.intensity.lcat_denoising import lcat_denoising
-from nighres.intensity.lcpca_denoising import lcpca_denoising
-from nighres.intensity.mp2rageme_pd_mapping import mp2rageme_pd_mapping
-from nighres.intensity.mp2rage_t1_mapping import mp2rage_t1_mapping
-from nighres.intensity.mp2rage_t1_mapping import mp2rage_t1_from_uni
-from nighres.intensity.phase_unwrapping import phase_unwrapping
-from nighres.intensity.t2s_optimal_combination import t2s_optimal_combination
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'background_estimation': '.background_estimation',
+    'flash_t2s_fitting': '.flash_t2s_fitting',
+    'intensity_propagation': '.intensity_propagation',
+    'lcat_denoising': '.lcat_denoising',
+    'lcpca_denoising': '.lcpca_denoising',
+    'mp2rageme_pd_mapping': '.mp2rageme_pd_mapping',
+    'mp2rage_t1_mapping': '.mp2rage_t1_mapping',
+    'mp2rage_t1_from_uni': '.mp2rage_t1_mapping',
+    'phase_unwrapping': '.phase_unwrapping',
+    't2s_optimal_combination': '.t2s_optimal_combination'})
@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def background_estimation(image, distribution='exponential', ratio=1e-3,
                           skip_zero=True, iterate=True, dilate=0,
                           threshold=0.5,
@@ -79,8 +85,8 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
                                    suffix='bge-mask'))
 
         if overwrite is False \
-            and os.path.isfile(masked_file) and os.path.isfile(proba_file) \
-            and os.path.isfile(mask_file) :
+            and _is_cached(masked_file) and _is_cached(proba_file) \
+            and _is_cached(mask_file) :
                 print("skip computation (use existing results)")
                 output = {'masked': masked_file, 
                           'proba': proba_file, 
@@ -88,11 +94,8 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     bge = nighresjava.IntensityBackgroundEstimator2()
 
@@ -100,7 +103,7 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
     
     # load image and use it to set dimensions and resolution
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -113,8 +116,7 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
         bge.setDimensions(dimensions[0], dimensions[1], 1)
         #bge.setResolutions(resolution[0], resolution[1], 1)
         
-    bge.setInputImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    bge.setInputImage(_to_java(data, 'float'))
     
     # set algorithm parameters
     bge.setBackgroundDistribution(distribution)
@@ -125,6 +127,7 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
     bge.setMaskThreshold(threshold)
     
     # execute the algorithm
+    phase('execute')
     try:
         bge.execute()
 
@@ -134,10 +137,10 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    masked_data = np.reshape(np.array(bge.getMaskedImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    masked_data = _from_java(bge.getMaskedImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -145,8 +148,7 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
     header['cal_max'] = np.nanmax(masked_data)
     masked = nb.Nifti1Image(masked_data, affine, header)
 
-    proba_data = np.reshape(np.array(bge.getProbaImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    proba_data = _from_java(bge.getProbaImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -154,8 +156,7 @@ def background_estimation(image, distribution='exponential', ratio=1e-3,
     header['cal_max'] = np.nanmax(proba_data)
     proba = nb.Nifti1Image(proba_data, affine, header)
 
-    mask_data = np.reshape(np.array(bge.getMask(),
-                                    dtype=np.float32), dimensions, 'F')
+    mask_data = _from_java(bge.getMask(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
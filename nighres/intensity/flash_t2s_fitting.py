@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def flash_t2s_fitting(image_list, te_list, r2s_threshold=None,
                       save_data=False, overwrite=False, output_dir=None,
                       file_name=None):
@@ -77,10 +83,10 @@ def flash_t2s_fitting(image_list, te_list, r2s_threshold=None,
                                    suffix='qt2fit-err'))
 
         if overwrite is False \
-            and os.path.isfile(t2s_file) \
-            and os.path.isfile(r2s_file) \
-            and os.path.isfile(s0_file) \
-            and os.path.isfile(err_file) :
+            and _is_cached(t2s_file) \
+            and _is_cached(r2s_file) \
+            and _is_cached(s0_file) \
+            and _is_cached(err_file) :
                 output = {'t2s': t2s_file,
                           'r2s': r2s_file,
                           's0': s0_file,
@@ -88,11 +94,8 @@ def flash_t2s_fitting(image_list, te_list, r2s_threshold=None,
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     qt2fit = nighresjava.IntensityFlashT2sFitting()
 
@@ -103,12 +106,10 @@ def flash_t2s_fitting(image_list, te_list, r2s_threshold=None,
 
     # load first image and use it to set dimensions and resolution
     img = load_volume(image_list[0])
-    data = img.get_data()
-    #data = data[0:10,0:10,0:10]
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
-    dimensions = data.shape
+    dimensions = img.shape
 
     qt2fit.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     qt2fit.setResolutions(resolution[0], resolution[1], resolution[2])
@@ -117,14 +118,14 @@ def flash_t2s_fitting(image_list, te_list, r2s_threshold=None,
     # important: set image number before adding images
     for idx, image in enumerate(image_list):
         #print('\nloading ('+str(idx)+'): '+image)
-        data = load_volume(image).get_data()
+        data = _volume_data(load_volume(image), 'float')
         #data = data[0:10,0:10,0:10]
-        qt2fit.setEchoImageAt(idx, nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+        qt2fit.setEchoImageAt(idx, _to_java(data, 'float'))
 
         qt2fit.setEchoTimeAt(idx, te_list[idx])
 
     # execute the algorithm
+    phase('execute')
     try:
         if (r2s_threshold is not None):
             if (r2s_threshold==0):
@@ -140,19 +141,16 @@ def flash_t2s_fitting(image_list, te_list, r2s_threshold=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    t2s_data = np.reshape(np.array(qt2fit.getT2sImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    t2s_data = _from_java(qt2fit.getT2sImage(), dimensions)
 
-    r2s_data = np.reshape(np.array(qt2fit.getR2sImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    r2s_data = _from_java(qt2fit.getR2sImage(), dimensions)
 
-    s0_data = np.reshape(np.array(qt2fit.getS0Image(),
-                                    dtype=np.float32), dimensions, 'F')
+    s0_data = _from_java(qt2fit.getS0Image(), dimensions)
 
-    err_data = np.reshape(np.array(qt2fit.getResidualImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    err_data = _from_java(qt2fit.getResidualImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -4,10 +4,23 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..tiling import tileable
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+def _propagation_halo(arguments, resolution):
+    # voxels reached by the propagation
+    return int(np.ceil(arguments['distance_mm']/min(resolution))) + 1
+
+
+@tileable(images=('image', 'mask'), halo=_propagation_halo)
+@profiled
+@cached
 def intensity_propagation(image, mask=None, combine='mean', distance_mm=5.0,
                       target='zero', scaling=1.0,
                       save_data=False, overwrite=False, output_dir=None,
@@ -67,17 +80,14 @@ def intensity_propagation(image, mask=None, combine='mean', distance_mm=5.0,
                                    suffix='ppag-img'))
 
         if overwrite is False \
-            and os.path.isfile(out_file) :
+            and _is_cached(out_file) :
                 print("skip computation (use existing results)")
                 output = {'result': out_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     propag = nighresjava.IntensityPropagate()
 
@@ -85,7 +95,7 @@ def intensity_propagation(image, mask=None, combine='mean', distance_mm=5.0,
     
     # load image and use it to set dimensions and resolution
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -94,13 +104,11 @@ def intensity_propagation(image, mask=None, combine='mean', distance_mm=5.0,
     propag.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     propag.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    propag.setInputImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    propag.setInputImage(_to_java(data, 'float'))
     
     
     if mask is not None:
-        propag.setMaskImage(idx, nighresjava.JArray('int')(
-                (load_volume(mask).get_data().flatten('F')).astype(int).tolist()))
+        propag.setMaskImage(idx, _to_java(load_volume(mask), 'int'))
     
     # set algorithm parameters
     propag.setCombinationMethod(combine)
@@ -109,6 +117,7 @@ def intensity_propagation(image, mask=None, combine='mean', distance_mm=5.0,
     propag.setPropogationScalingFactor(scaling)
     
     # execute the algorithm
+    phase('execute')
     try:
         propag.execute()
 
@@ -118,10 +127,10 @@ def intensity_propagation(image, mask=None, combine='mean', distance_mm=5.0,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    propag_data = np.reshape(np.array(propag.getResultImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    propag_data = _from_java(propag.getResultImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
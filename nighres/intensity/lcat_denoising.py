@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def lcat_denoising(image_list, image_mask, phase_list=None,
                     ngb_size=3, ngb_time=3, stdev_cutoff=1.05,
                       min_dimension=0, max_dimension=-1,
@@ -111,12 +117,12 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
                                    suffix='lcat-res'))
 
         if overwrite is False \
-            and os.path.isfile(dim_file) \
-            and os.path.isfile(err_file) :
+            and _is_cached(dim_file) \
+            and _is_cached(err_file) :
                 # check that the denoised data is the same too
                 missing = False
                 for den_file in den_files:
-                    if not os.path.isfile(den_file):
+                    if not _is_cached(den_file):
                         missing = True
                 if not missing:
                     print("skip computation (use existing results)")
@@ -130,11 +136,8 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
                     return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create lcat instance
     lcat = nighresjava.LocalContrastAndTimeDenoising()
 
@@ -143,12 +146,10 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
 
     # load first image and use it to set dimensions and resolution
     img = load_volume(image_list[0])
-    data = img.get_data()
-    #data = data[0:10,0:10,0:10]
     affine = img.get_affine()
     header = img.get_header()
     resolution = [x.item() for x in header.get_zooms()]
-    dimensions = data.shape
+    dimensions = img.shape
     dims3d = (dimensions[0], dimensions[1], dimensions[2])
 
     lcat.setDimensions(dimensions[0], dimensions[1], dimensions[2], dimensions[3])
@@ -156,25 +157,22 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
 
     # input images
     # important: set image mask before adding images
-    data = load_volume(image_mask).get_data()
-    lcat.setMaskImage(nighresjava.JArray('int')(
-                    (data.flatten('F')).astype(int).tolist()))
+    data = _volume_data(load_volume(image_mask), 'int')
+    lcat.setMaskImage(_to_java(data, 'int'))
 
     # important: set image number before adding images
     for idx, image in enumerate(image_list):
         #print('\nloading ('+str(idx)+'): '+image)
-        data = load_volume(image).get_data()
+        data = _volume_data(load_volume(image), 'float')
         #data = data[0:10,0:10,0:10]
-        lcat.setTimeSerieMagnitudeAt(idx, nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+        lcat.setTimeSerieMagnitudeAt(idx, _to_java(data, 'float'))
 
     if phase_list is not None:
         for idx,image in enumerate(phase_list):
             #print('\nloading ('+str(idx)+'): '+image)
-            data = load_volume(image).get_data()
+            data = _volume_data(load_volume(image), 'float')
             #data = data[0:10,0:10,0:10]
-            lcat.setTimeSeriePhaseAt(idx, nighresjava.JArray('float')(
-                                        (data.flatten('F')).astype(float)))
+            lcat.setTimeSeriePhaseAt(idx, _to_java(data, 'float'))
 
     # set algorithm parameters
     lcat.setPatchSize(ngb_size)
@@ -184,6 +182,7 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
     lcat.setMaximumDimension(max_dimension)
 
     # execute the algorithm
+    phase('execute')
     try:
         lcat.execute()
 
@@ -193,12 +192,12 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
     denoised_list = []
     for idx, image in enumerate(image_list):
-        den_data = np.reshape(np.array(lcat.getDenoisedMagnitudeAt(idx),
-                                   dtype=np.float32), dimensions, 'F')
+        den_data = _from_java(lcat.getDenoisedMagnitudeAt(idx), dimensions)
         header['cal_min'] = np.nanmin(den_data)
         header['cal_max'] = np.nanmax(den_data)
         denoised = nb.Nifti1Image(den_data, affine, header)
@@ -209,8 +208,7 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
 
     if phase_list is not None:
         for idx,image in enumerate(phase_list):
-            den_data = np.reshape(np.array(lcat.getDenoisedPhaseAt(idx),
-                                       dtype=np.float32), dimensions, 'F')
+            den_data = _from_java(lcat.getDenoisedPhaseAt(idx), dimensions)
             header['cal_min'] = np.nanmin(den_data)
             header['cal_max'] = np.nanmax(den_data)
             denoised = nb.Nifti1Image(den_data, affine, header)
@@ -219,11 +217,9 @@ def lcat_denoising(image_list, image_mask, phase_list=None,
             if save_data:
                 save_volume(den_files[len(image_list)+idx], denoised)
 
-    dim_data = np.reshape(np.array(lcat.getLocalDimensionImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    dim_data = _from_java(lcat.getLocalDimensionImage(), dimensions)
 
-    err_data = np.reshape(np.array(lcat.getNoiseFitImage(),
-                                    dtype=np.float32), dims3d, 'F')
+    err_data = _from_java(lcat.getNoiseFitImage(), dims3d)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
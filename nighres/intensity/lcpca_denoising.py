@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def lcpca_denoising(image_list, phase_list=None, 
                     ngb_size=4, stdev_cutoff=1.05,
                     min_dimension=0, max_dimension=-1,
@@ -117,12 +123,12 @@ def lcpca_denoising(image_list, phase_list=None,
                                    suffix='lcpca-res'))
         
         if overwrite is False \
-            and os.path.isfile(dim_file) \
-            and os.path.isfile(err_file) :
+            and _is_cached(dim_file) \
+            and _is_cached(err_file) :
                 # check that the denoised data is the same too
                 missing = False
                 for den_file in den_files:
-                    if not os.path.isfile(den_file):
+                    if not _is_cached(den_file):
                         missing = True
                 if not missing:
                     print("skip computation (use existing results)")
@@ -136,22 +142,17 @@ def lcpca_denoising(image_list, phase_list=None,
                     return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create lcpca instance
     lcpca = nighresjava.LocalComplexPCADenoising()
 
     # load first image and use it to set dimensions and resolution
     img = load_volume(image_list[0])
-    data = img.get_data()
-    #data = data[0:10,0:10,0:10]
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
-    dimensions = data.shape
+    dimensions = img.shape
     dim3D = (dimensions[0],dimensions[1],dimensions[2])
     
     # set lcpca parameters
@@ -176,19 +177,17 @@ def lcpca_denoising(image_list, phase_list=None,
     # important: set image number before adding images
     for idx, image in enumerate(image_list):
             #print('\nloading ('+str(idx)+'): '+image)
-            data = load_volume(image).get_data()
+            data = _volume_data(load_volume(image), 'float')
             #data = data[0:10,0:10,0:10]
-            lcpca.setMagnitudeImageAt(idx, nighresjava.JArray('float')(
-                                        (data.flatten('F')).astype(float)))
+            lcpca.setMagnitudeImageAt(idx, _to_java(data, 'float'))
 
     # input phase, if specified
     if (phase_list!=None):
         for idx, image in enumerate(phase_list):
             #print('\nloading '+image)
-            data = load_volume(image).get_data()
+            data = _volume_data(load_volume(image), 'float')
             #data = data[0:10,0:10,0:10]
-            lcpca.setPhaseImageAt(idx, nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+            lcpca.setPhaseImageAt(idx, _to_java(data, 'float'))
 
     # set algorithm parameters
     lcpca.setPatchSize(ngb_size)
@@ -200,6 +199,7 @@ def lcpca_denoising(image_list, phase_list=None,
     lcpca.setRandomMatrixTheory(use_rmt)
 
     # execute the algorithm
+    phase('execute')
     try:
         lcpca.execute()
 
@@ -209,12 +209,12 @@ def lcpca_denoising(image_list, phase_list=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
     denoised_list = []
     for idx, image in enumerate(image_list):
-        den_data = np.reshape(np.array(lcpca.getDenoisedMagnitudeImageAt(idx),
-                                   dtype=np.float32), dimensions, 'F')
+        den_data = _from_java(lcpca.getDenoisedMagnitudeImageAt(idx), dimensions)
         header['cal_min'] = np.nanmin(den_data)
         header['cal_max'] = np.nanmax(den_data)
         denoised = nb.Nifti1Image(den_data, affine, header)
@@ -225,8 +225,7 @@ def lcpca_denoising(image_list, phase_list=None,
 
     if (phase_list!=None):
         for idx, image in enumerate(phase_list):
-            den_data = np.reshape(np.array(lcpca.getDenoisedPhaseImageAt(idx),
-                                       dtype=np.float32), dimensions, 'F')
+            den_data = _from_java(lcpca.getDenoisedPhaseImageAt(idx), dimensions)
             header['cal_min'] = np.nanmin(den_data)
             header['cal_max'] = np.nanmax(den_data)
             denoised = nb.Nifti1Image(den_data, affine, header)
@@ -235,11 +234,9 @@ def lcpca_denoising(image_list, phase_list=None,
             if save_data:
                 save_volume(den_files[idx+len(image_list)], denoised)
 
-    dim_data = np.reshape(np.array(lcpca.getLocalDimensionImage(),
-                                    dtype=np.float32), dim3D, 'F')
+    dim_data = _from_java(lcpca.getLocalDimensionImage(), dim3D)
 
-    err_data = np.reshape(np.array(lcpca.getNoiseFitImage(),
-                                    dtype=np.float32), dim3D, 'F')
+    err_data = _from_java(lcpca.getNoiseFitImage(), dim3D)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def mp2rage_t1_mapping(first_inversion, second_inversion, 
                       inversion_times, flip_angles, inversion_TR,
                       excitation_TR, N_excitations, efficiency=0.96,
@@ -96,20 +102,17 @@ def mp2rage_t1_mapping(first_inversion, second_inversion,
                                    suffix='qt1map-uni'))
 
         if overwrite is False \
-            and os.path.isfile(t1_file) \
-            and os.path.isfile(r1_file) \
-            and os.path.isfile(uni_file) :
+            and _is_cached(t1_file) \
+            and _is_cached(r1_file) \
+            and _is_cached(uni_file) :
                 output = {'t1': t1_file,
                           'r1': r1_file, 
                           'uni': uni_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     qt1map = nighresjava.IntensityMp2rageT1Fitting()
 
@@ -127,7 +130,7 @@ def mp2rage_t1_mapping(first_inversion, second_inversion,
      
     # load first image and use it to set dimensions and resolution
     img = load_volume(first_inversion[0])
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     #data = data[0:10,0:10,0:10]
     affine = img.affine
     header = img.header
@@ -138,27 +141,23 @@ def mp2rage_t1_mapping(first_inversion, second_inversion,
     qt1map.setResolutions(resolution[0], resolution[1], resolution[2])
 
     # input images
-    qt1map.setFirstInversionMagnitude(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    qt1map.setFirstInversionMagnitude(_to_java(data, 'float'))
     
-    data = load_volume(first_inversion[1]).get_data()
-    qt1map.setFirstInversionPhase(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(first_inversion[1]), 'float')
+    qt1map.setFirstInversionPhase(_to_java(data, 'float'))
     
-    data = load_volume(second_inversion[0]).get_data()
-    qt1map.setSecondInversionMagnitude(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(second_inversion[0]), 'float')
+    qt1map.setSecondInversionMagnitude(_to_java(data, 'float'))
     
-    data = load_volume(second_inversion[1]).get_data()
-    qt1map.setSecondInversionPhase(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(second_inversion[1]), 'float')
+    qt1map.setSecondInversionPhase(_to_java(data, 'float'))
  
     if (correct_B1):
-        data = load_volume(B1_map).get_data()
-        qt1map.setB1mapImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(B1_map), 'float')
+        qt1map.setB1mapImage(_to_java(data, 'float'))
  
     # execute the algorithm
+    phase('execute')
     try:
         qt1map.execute()
 
@@ -168,16 +167,14 @@ def mp2rage_t1_mapping(first_inversion, second_inversion,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    t1_data = np.reshape(np.array(qt1map.getQuantitativeT1mapImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    t1_data = _from_java(qt1map.getQuantitativeT1mapImage(), dimensions)
 
-    r1_data = np.reshape(np.array(qt1map.getQuantitativeR1mapImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    r1_data = _from_java(qt1map.getQuantitativeR1mapImage(), dimensions)
 
-    uni_data = np.reshape(np.array(qt1map.getUniformT1weightedImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    uni_data = _from_java(qt1map.getUniformT1weightedImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -201,6 +198,8 @@ def mp2rage_t1_mapping(first_inversion, second_inversion,
     else:
         return {'t1': t1, 'r1': r1, 'uni': uni}
 
+@profiled
+@cached
 def mp2rage_t1_from_uni(uniform_image, 
                       inversion_times, flip_angles, inversion_TR,
                       excitation_TR, N_excitations, efficiency=0.96,
@@ -281,18 +280,15 @@ def mp2rage_t1_from_uni(uniform_image,
                                    suffix='qt1map-r1'))
 
         if overwrite is False \
-            and os.path.isfile(t1_file) \
-            and os.path.isfile(r1_file) :
+            and _is_cached(t1_file) \
+            and _is_cached(r1_file) :
                 output = {'t1': t1_file,
                           'r1': r1_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     qt1map = nighresjava.IntensityMp2rageT1Fitting()
 
@@ -310,7 +306,7 @@ def mp2rage_t1_from_uni(uniform_image,
      
     # load first image and use it to set dimensions and resolution
     img = load_volume(uniform_image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     #data = data[0:10,0:10,0:10]
     affine = img.affine
     header = img.header
@@ -321,15 +317,14 @@ def mp2rage_t1_from_uni(uniform_image,
     qt1map.setResolutions(resolution[0], resolution[1], resolution[2])
 
     # input images
-    qt1map.setUniformImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    qt1map.setUniformImage(_to_java(data, 'float'))
      
     if (correct_B1):
-        data = load_volume(B1_map).get_data()
-        qt1map.setB1mapImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(B1_map), 'float')
+        qt1map.setB1mapImage(_to_java(data, 'float'))
  
     # execute the algorithm
+    phase('execute')
     try:
         qt1map.execute()
 
@@ -339,13 +334,12 @@ def mp2rage_t1_from_uni(uniform_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    t1_data = np.reshape(np.array(qt1map.getQuantitativeT1mapImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    t1_data = _from_java(qt1map.getQuantitativeT1mapImage(), dimensions)
 
-    r1_data = np.reshape(np.array(qt1map.getQuantitativeR1mapImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    r1_data = _from_java(qt1map.getQuantitativeR1mapImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
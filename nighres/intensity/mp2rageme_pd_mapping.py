@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def mp2rageme_pd_mapping(first_inversion, second_inversion,
                       t1map, r2smap, echo_times,
                       inversion_times, flip_angles, inversion_TR,
@@ -92,16 +98,13 @@ def mp2rageme_pd_mapping(first_inversion, second_inversion,
                                    suffix='qpd-map'))
 
         if overwrite is False \
-            and os.path.isfile(pd_file) :
+            and _is_cached(pd_file) :
                 output = {'pd': pd_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     qpdmap = nighresjava.IntensityMp2ragemePDmapping()
 
@@ -120,7 +123,7 @@ def mp2rageme_pd_mapping(first_inversion, second_inversion,
 
     # load first image and use it to set dimensions and resolution
     img = load_volume(first_inversion[0])
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     #data = data[0:10,0:10,0:10]
     affine = img.affine
     header = img.header
@@ -131,35 +134,29 @@ def mp2rageme_pd_mapping(first_inversion, second_inversion,
     qpdmap.setResolutions(resolution[0], resolution[1], resolution[2])
 
     # input images
-    qpdmap.setFirstInversionMagnitude(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    qpdmap.setFirstInversionMagnitude(_to_java(data, 'float'))
 
-    data = load_volume(first_inversion[1]).get_data()
-    qpdmap.setFirstInversionPhase(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(first_inversion[1]), 'float')
+    qpdmap.setFirstInversionPhase(_to_java(data, 'float'))
 
-    data = load_volume(second_inversion[0]).get_data()
-    qpdmap.setSecondInversionMagnitude(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(second_inversion[0]), 'float')
+    qpdmap.setSecondInversionMagnitude(_to_java(data, 'float'))
 
-    data = load_volume(second_inversion[1]).get_data()
-    qpdmap.setSecondInversionPhase(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(second_inversion[1]), 'float')
+    qpdmap.setSecondInversionPhase(_to_java(data, 'float'))
 
-    data = load_volume(t1map).get_data()
-    qpdmap.setT1mapImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(t1map), 'float')
+    qpdmap.setT1mapImage(_to_java(data, 'float'))
 
-    data = load_volume(r2smap).get_data()
-    qpdmap.setR2smapImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    data = _volume_data(load_volume(r2smap), 'float')
+    qpdmap.setR2smapImage(_to_java(data, 'float'))
 
     if (b1map!=None):
-        data = load_volume(b1map).get_data()
-        qpdmap.setB1mapImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(b1map), 'float')
+        qpdmap.setB1mapImage(_to_java(data, 'float'))
 
     # execute the algorithm
+    phase('execute')
     try:
         qpdmap.execute()
 
@@ -169,10 +166,10 @@ def mp2rageme_pd_mapping(first_inversion, second_inversion,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    pd_data = np.reshape(np.array(qpdmap.getProtonDensityImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    pd_data = _from_java(qpdmap.getProtonDensityImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
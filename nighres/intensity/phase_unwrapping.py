@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def phase_unwrapping(image, mask=None, nquadrants=3,
                       tv_flattening=False, tv_scale=0.5,
                       save_data=False, overwrite=False, output_dir=None,
@@ -72,17 +78,14 @@ def phase_unwrapping(image, mask=None, nquadrants=3,
                                    suffix='unwrap-img'))
 
         if overwrite is False \
-            and os.path.isfile(out_file) :
+            and _is_cached(out_file) :
                 print("skip computation (use existing results)")
                 output = {'result': out_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     unwrap = nighresjava.FastMarchingPhaseUnwrapping()
 
@@ -90,7 +93,7 @@ def phase_unwrapping(image, mask=None, nquadrants=3,
     
     # load image and use it to set dimensions and resolution
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -100,13 +103,13 @@ def phase_unwrapping(image, mask=None, nquadrants=3,
     unwrap.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     unwrap.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    unwrap.setPhaseImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)[0:dimensions[0]*dimensions[1]*dimensions[2]]))
+    unwrap.setPhaseImage(_to_java(
+                data.ravel('F')[0:dimensions[0]*dimensions[1]*dimensions[2]],
+                'float'))
     
     
     if mask is not None:
-        unwrap.setMaskImage(idx, nighresjava.JArray('int')(
-                (load_volume(mask).get_data().flatten('F')).astype(int).tolist()))
+        unwrap.setMaskImage(idx, _to_java(load_volume(mask), 'int'))
     
     # set algorithm parameters
     unwrap.setQuadrantNumber(nquadrants)
@@ -114,6 +117,7 @@ def phase_unwrapping(image, mask=None, nquadrants=3,
     unwrap.setTVScale(tv_scale)
     
     # execute the algorithm
+    phase('execute')
     try:
         unwrap.execute()
 
@@ -123,10 +127,10 @@ def phase_unwrapping(image, mask=None, nquadrants=3,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    unwrap_data = np.reshape(np.array(unwrap.getCorrectedImage(),
-                                    dtype=np.float32), dimensions3D, 'F')
+    unwrap_data = _from_java(unwrap.getCorrectedImage(), dimensions3D)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def t2s_optimal_combination(image_list, te_list, depth=None,
                       save_data=False, overwrite=False, output_dir=None,
                       file_name=None):
@@ -82,11 +88,11 @@ def t2s_optimal_combination(image_list, te_list, depth=None,
                                    suffix='qt2scomb-err'))
 
         if overwrite is False \
-            and os.path.isfile(comb_file) \
-            and os.path.isfile(t2s_file) \
-            and os.path.isfile(r2s_file) \
-            and os.path.isfile(s0_file) \
-            and os.path.isfile(err_file) :
+            and _is_cached(comb_file) \
+            and _is_cached(t2s_file) \
+            and _is_cached(r2s_file) \
+            and _is_cached(s0_file) \
+            and _is_cached(err_file) :
                 output = {'combined': comb_file,
                           't2s': t2s_file,
                           'r2s': r2s_file,
@@ -95,11 +101,8 @@ def t2s_optimal_combination(image_list, te_list, depth=None,
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     qt2scomb = nighresjava.T2sOptimalCombination()
 
@@ -108,12 +111,10 @@ def t2s_optimal_combination(image_list, te_list, depth=None,
 
     # load first image and use it to set dimensions and resolution
     img = load_volume(image_list[0])
-    data = img.get_data()
-    #data = data[0:10,0:10,0:10]
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
-    dimensions = data.shape
+    dimensions = img.shape
     dim3d = (dimensions[0], dimensions[1], dimensions[2])
 
     if len(dimensions)==3:
@@ -126,17 +127,17 @@ def t2s_optimal_combination(image_list, te_list, depth=None,
     # important: set image number before adding images
     for idx, image in enumerate(image_list):
         #print('\nloading ('+str(idx)+'): '+image)
-        data = load_volume(image).get_data()
+        data = _volume_data(load_volume(image), 'float')
         #data = data[0:10,0:10,0:10]
-        qt2scomb.setEchoImageAt(idx, nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+        qt2scomb.setEchoImageAt(idx, _to_java(data, 'float'))
 
         qt2scomb.setEchoTimeAt(idx, te_list[idx])
 
     if depth is not None:
-        qt2scomb.setImageEchoDepth(nighresjava.JArray('int')(depth))
+        qt2scomb.setImageEchoDepth(_to_java(depth, 'int'))
 
     # execute the algorithm
+    phase('execute')
     try:
         qt2scomb.execute()
 
@@ -146,22 +147,18 @@ def t2s_optimal_combination(image_list, te_list, depth=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    comb_data = np.reshape(np.array(qt2scomb.getCombinedImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    comb_data = _from_java(qt2scomb.getCombinedImage(), dimensions)
 
-    t2s_data = np.reshape(np.array(qt2scomb.getT2sImage(),
-                                    dtype=np.float32), dim3d, 'F')
+    t2s_data = _from_java(qt2scomb.getT2sImage(), dim3d)
 
-    r2s_data = np.reshape(np.array(qt2scomb.getR2sImage(),
-                                    dtype=np.float32), dim3d, 'F')
+    r2s_data = _from_java(qt2scomb.getR2sImage(), dim3d)
 
-    s0_data = np.reshape(np.array(qt2scomb.getS0Image(),
-                                    dtype=np.float32), dim3d, 'F')
+    s0_data = _from_java(qt2scomb.getS0Image(), dim3d)
 
-    err_data = np.reshape(np.array(qt2scomb.getResidualImage(),
-                                    dtype=np.float32), dim3d, 'F')
+    err_data = _from_java(qt2scomb.getResidualImage(), dim3d)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
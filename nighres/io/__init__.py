@@ -1,3 +1,8 @@
-from nighres.io.io_volume import load_volume, save_volume, time_log
+from nighres.io.io_volume import load_volume, load_volume_header, \
+                    save_volume, flush_volumes, background_saving
+from nighres.io.io_timelog import time_log, flush_time_log, load_time_log, \
+                    time_log_to_json
+from nighres.io.io_report import time_log_report
+from nighres.io.io_cache import volume_cache_info, clear_volume_cache
 from nighres.io.io_mesh import load_mesh_geometry, save_mesh_geometry, \
                     load_mesh_data, save_mesh_data, load_mesh, save_mesh
@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from nighres import global_settings
+
+
+class _VolumeCache(object):
+    # Least-recently-used cache of loaded volumes, keyed on the absolute path
+    # and validated against the file modification time and size. The budget
+    # (global_settings.VOLUME_CACHE_MB) is read on every call so that it can
+    # be changed at runtime, 0 disables the cache.
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def max_bytes():
+        return int(global_settings.VOLUME_CACHE_MB * 2**20)
+
+    @staticmethod
+    def _stamp(filename):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, filename):
+        # Return a new image sharing the cached data, or None
+        if self.max_bytes() <= 0:
+            return None
+        key = os.path.abspath(filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != self._stamp(key):
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _share_image(entry[1])
+
+    def put(self, filename, image):
+        # Cache an image whose data is held in memory, the data array is made
+        # read-only since it is shared between all callers
+        max_bytes = self.max_bytes()
+        data = image.dataobj
+        if max_bytes <= 0 or type(data) is not np.ndarray \
+                or data.nbytes > max_bytes:
+            return image
+        data.flags.writeable = False
+        key = os.path.abspath(filename)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self._stamp(key), image, data.nbytes)
+            self._bytes += data.nbytes
+            while self._bytes > max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return _share_image(image)
+
+    def invalidate(self, filename):
+        with self._lock:
+            key = os.path.abspath(filename)
+            if key in self._entries:
+                self._drop(key)
+                self.invalidations += 1
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+            self.evictions = self.invalidations = 0
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes()}
+
+
+def _share_image(image):
+    # New image object (with its own header) around the same data array
+    shared = image.__class__(image.dataobj, image.affine, image.header)
+    shared.set_data_dtype(image.get_data_dtype())
+    return shared
+
+
+_volume_cache = _VolumeCache()
+
+
+def volume_cache_info():
+    """
+    Statistics of the in-memory volume cache used by
+    :func:`nighres.io.load_volume`
+
+    The cache is enabled by setting global_settings.VOLUME_CACHE_MB (or the
+    NIGHRES_VOLUME_CACHE_MB environment variable) to a memory budget in MB.
+    Files are cached by path and reloaded when their modification time or
+    size changes; the least recently used files are evicted first. Cached
+    data arrays are shared between callers and therefore read-only.
+
+    Returns
+    ----------
+    dict
+        Counters of cache hits, misses, evictions and invalidations, the
+        number of cached entries and their size in bytes, and the budget
+        in bytes (max_bytes)
+    """
+    return _volume_cache.info()
+
+
+def clear_volume_cache():
+    """
+    Empty the in-memory volume cache of :func:`nighres.io.load_volume` and
+    reset its counters
+    """
+    _volume_cache.clear()
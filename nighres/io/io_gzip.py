@@ -0,0 +1,232 @@
+import io
+import mmap
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from nighres import global_settings
+
+# Intel ISA-L bindings inflate about twice as fast as zlib, use them if present
+try:
+    from isal import isal_zlib as _inflate_lib
+except ImportError:
+    _inflate_lib = zlib
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_GZIP_WBITS = 31
+_FEXTRA = 4
+_STREAM_CHUNK = 1 << 22
+
+# same uncompressed block size as htslib, guarantees that a deflated block
+# still fits the 16 bit BGZF block size field
+_BGZF_BLOCK = 0xff00
+_BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000'
+                          '000000000000')
+
+# output codecs understood by nighres.io.save_volume
+COMPRESSION_CODECS = ('none', 'gzip', 'bgzf')
+
+
+def _io_threads(threads=None):
+    # Number of worker threads for (de)compression, 0 or None means all cores
+    if threads is None:
+        threads = global_settings.IO_THREADS
+    if threads is None or threads < 1:
+        threads = os.cpu_count() or 1
+    return threads
+
+
+def _bgzf_blocks(data):
+    # Return a list of (start, end, uncompressed size) for all gzip members
+    # if every member carries the BGZF block size field ('BC' extra subfield,
+    # as written by bgzip and nighres.io.save_volume), None otherwise
+    blocks = []
+    pos = 0
+    size = len(data)
+    while pos < size:
+        if pos + 18 > size or data[pos:pos+2] != _GZIP_MAGIC \
+                or not data[pos+3] & _FEXTRA:
+            return None
+        xlen = struct.unpack_from('<H', data, pos+10)[0]
+        bsize = None
+        sub = pos + 12
+        while sub + 4 <= pos + 12 + xlen:
+            si1, si2, slen = struct.unpack_from('<BBH', data, sub)
+            if si1 == 66 and si2 == 67 and slen == 2:
+                bsize = struct.unpack_from('<H', data, sub+4)[0] + 1
+            sub += 4 + slen
+        if bsize is None or pos + bsize > size:
+            return None
+        isize = struct.unpack_from('<I', data, pos+bsize-4)[0]
+        blocks.append((pos, pos+bsize, isize))
+        pos += bsize
+    return blocks
+
+
+def _inflate_blocks(data, blocks, threads):
+    # Inflate independent gzip members in parallel, each one straight into
+    # its slot of a single preallocated output buffer (zlib releases the GIL)
+    offsets = [0]
+    for _, _, isize in blocks:
+        offsets.append(offsets[-1] + isize)
+    out = bytearray(offsets[-1])
+
+    def inflate_range(first, last):
+        for b in range(first, last):
+            start, end, isize = blocks[b]
+            out[offsets[b]:offsets[b]+isize] = \
+                zlib.decompress(data[start:end], _GZIP_WBITS)
+
+    # a few contiguous batches per thread keep the scheduling overhead low
+    n_batches = min(len(blocks), 4*threads)
+    bounds = [len(blocks)*n//n_batches for n in range(n_batches+1)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        jobs = [pool.submit(inflate_range, bounds[n], bounds[n+1])
+                for n in range(n_batches)]
+        for job in jobs:
+            job.result()
+    return out
+
+
+def _inflate_stream(data):
+    # Inflate a regular (possibly multi-member) gzip stream sequentially into
+    # a preallocated buffer, sized from the trailing ISIZE field
+    size = len(data)
+    out = bytearray(struct.unpack_from('<I', data, size-4)[0])
+    pos = 0
+    offset = 0
+    pending = b''
+    inflater = _inflate_lib.decompressobj(_GZIP_WBITS)
+    while True:
+        if pending:
+            chunk, pending = pending, b''
+        elif offset < size:
+            chunk = data[offset:offset+_STREAM_CHUNK]
+            offset += len(chunk)
+        else:
+            break
+        piece = inflater.decompress(chunk)
+        end = pos + len(piece)
+        if end > len(out):
+            # ISIZE is only exact for single members below 4 GB
+            out.extend(bytes(max(end - len(out), len(out))))
+        out[pos:end] = piece
+        pos = end
+        if inflater.eof:
+            # start over on the next member, ignoring zero padding
+            pending = inflater.unused_data.lstrip(b'\x00')
+            inflater = _inflate_lib.decompressobj(_GZIP_WBITS)
+    del out[pos:]
+    return out
+
+
+def _gunzip(filename, threads=None):
+    # Decompress a gzip file into a single bytearray. Files made of BGZF
+    # blocks are inflated by several threads, other files are streamed
+    # from a memory map so that reading overlaps with inflating
+    with open(filename, 'rb') as fobj:
+        if os.fstat(fobj.fileno()).st_size == 0:
+            return bytearray()
+        with mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                data.madvise(mmap.MADV_SEQUENTIAL)
+            threads = _io_threads(threads)
+            blocks = _bgzf_blocks(data)
+            if blocks is not None and threads > 1 and len(blocks) > 1:
+                return _inflate_blocks(data, blocks, threads)
+            return _inflate_stream(data)
+
+
+def _bgzf_block(data, level):
+    # Compress one block into a self-contained gzip member with the BGZF
+    # block size field
+    deflater = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = deflater.compress(data) + deflater.flush()
+    header = struct.pack('<BBBBIBBHBBHH', 31, 139, 8, _FEXTRA, 0, 0, 255, 6,
+                         66, 67, 2, len(payload) + 25)
+    trailer = struct.pack('<II', zlib.crc32(data), len(data))
+    return header + payload + trailer
+
+
+class _GzipWriter(io.IOBase):
+    # Write-only file object that compresses everything written to it into
+    # fileobj, either as a single gzip stream ('gzip') or as BGZF blocks
+    # deflated in parallel ('bgzf'). Only supports the sequential access
+    # nibabel needs to write single-file images.
+
+    def __init__(self, fileobj, codec='bgzf', level=1, threads=None):
+        if codec not in ('gzip', 'bgzf'):
+            raise ValueError('Unknown gzip codec {0}'.format(codec))
+        self._raw = fileobj
+        self._codec = codec
+        self._level = level
+        self._pos = 0
+        self._pending = bytearray()
+        self._jobs = deque()
+        self._pool = None
+        self._threads = _io_threads(threads)
+        if codec == 'gzip':
+            self._deflater = zlib.compressobj(level, zlib.DEFLATED,
+                                              _GZIP_WBITS)
+        elif self._threads > 1:
+            self._pool = ThreadPoolExecutor(max_workers=self._threads)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        # only "seeking" to the current position is possible
+        if whence != 0 or offset != self._pos:
+            raise IOError('Cannot seek in a compressed output stream')
+        return self._pos
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        self._pos += len(data)
+        if self._codec == 'gzip':
+            self._raw.write(self._deflater.compress(data))
+            return len(data)
+
+        start = 0
+        if self._pending:
+            start = min(len(data), _BGZF_BLOCK - len(self._pending))
+            self._pending += data[:start]
+            if len(self._pending) == _BGZF_BLOCK:
+                self._queue_block(bytes(self._pending))
+                self._pending = bytearray()
+        while len(data) - start >= _BGZF_BLOCK:
+            self._queue_block(bytes(data[start:start+_BGZF_BLOCK]))
+            start += _BGZF_BLOCK
+        self._pending += data[start:]
+        return len(data)
+
+    def _queue_block(self, block):
+        if self._pool is None:
+            self._raw.write(_bgzf_block(block, self._level))
+            return
+        # keep a bounded number of blocks in flight, written in order
+        self._jobs.append(self._pool.submit(_bgzf_block, block, self._level))
+        while len(self._jobs) > 4*self._threads:
+            self._raw.write(self._jobs.popleft().result())
+
+    def close(self):
+        if getattr(self, '_raw', None) is None:
+            return
+        try:
+            if self._codec == 'gzip':
+                self._raw.write(self._deflater.flush())
+            else:
+                if self._pending:
+                    self._queue_block(bytes(self._pending))
+                while self._jobs:
+                    self._raw.write(self._jobs.popleft().result())
+                self._raw.write(_BGZF_EOF)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._raw = None
+            super(_GzipWriter, self).close()
@@ -1,8 +1,11 @@
 import nibabel as nb
 import numpy as np
+from nighres.profiling import _io_phase
+from nighres.cache import _record_output
 
 # TODO: compare with Nilearn functions and possibly extend
 
+@_io_phase('load')
 def load_mesh(surf_mesh):
     '''
     Load a mesh into a dictionary with entries
@@ -35,7 +38,16 @@ def load_mesh(surf_mesh):
        Python. DOI: 10.3897/rio.3.e12346
     '''
 
-    if surf_mesh.endswith('vtk'):
+    # mesh already in memory, e.g. the result of another nighres function
+    if isinstance(surf_mesh, dict):
+        if 'points' not in surf_mesh or 'faces' not in surf_mesh:
+            raise ValueError('If surf_mesh is given as a dictionary it '
+                             'must contain items with keys "points" and '
+                             '"faces"')
+        return {'points': surf_mesh['points'], 'faces': surf_mesh['faces'],
+                'data': surf_mesh.get('data')}
+
+    elif surf_mesh.endswith('vtk'):
         points, faces, data = _read_vtk(surf_mesh)
         return {'points': points, 'faces': faces, 'data': data}
 
@@ -48,6 +60,7 @@ def load_mesh(surf_mesh):
         return geom
 
 
+@_io_phase('save')
 def save_mesh(filename, surf_dict):
     '''
     Saves surface mesh to file
@@ -85,8 +98,10 @@ def save_mesh(filename, surf_dict):
                            surf_dict['data'])
     else:
         save_mesh_geometry(filename, surf_dict)
+    _record_output(filename)
 
 
+@_io_phase('load')
 def load_mesh_geometry(surf_mesh):
     '''
     Load a mesh geometry into a dictionary with entries
@@ -148,6 +163,7 @@ def load_mesh_geometry(surf_mesh):
     return {'points': points, 'faces': faces}
 
 
+@_io_phase('load')
 def load_mesh_data(surf_data, gii_darray=None):
     '''
     Loads mesh data into a Numpy array
@@ -205,6 +221,7 @@ def load_mesh_data(surf_data, gii_darray=None):
     return data
 
 
+@_io_phase('save')
 def save_mesh_data(filename, surf_data):
     '''
     Saves surface data that is a Numpy array to file
@@ -242,8 +259,10 @@ def save_mesh_data(filename, surf_data):
                              'and ASCII coded vtk and txt')
     else:
         raise ValueError('Filename must be a string')
+    _record_output(filename)
 
 
+@_io_phase('save')
 def save_mesh_geometry(filename, surf_dict):
     '''
     Saves surface mesh geometry to file
@@ -299,6 +318,7 @@ def save_mesh_geometry(filename, surf_dict):
     else:
         raise ValueError('Filename must be a string and surf_dict must be a '
                          'dictionary with keys "points" and "faces"')
+    _record_output(filename)
 
 
 def _read_gifti(file):
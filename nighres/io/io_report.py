@@ -0,0 +1,320 @@
+import argparse
+import csv
+import glob
+import json
+import sys
+import warnings
+from nighres.io.io_timelog import load_time_log
+
+# time log events that read or write volume and mesh files
+_READ_OPS = ('read', 'cached_read', 'read_header')
+_WRITE_OPS = ('write',)
+
+_MODULE_COLUMNS = ('task', 'calls', 'wall', 'compute', 'io', 'read', 'write',
+                   'io_fraction', 'read_mb', 'write_mb', 'read_mbps',
+                   'write_mbps')
+
+
+def _mbps(size, duration):
+    # Throughput in MB/s, None if nothing was timed
+    if duration <= 0:
+        return None
+    return size / 1e6 / duration
+
+
+def _calls(events):
+    # Split the events of one run into calls of the nighres functions:
+    # profiled calls (phase_total) or logged makespans when available,
+    # otherwise one call per function and process spanning its events.
+    # Returns a list of dicts with task, start, end, subtasks and the
+    # file events that happened during the call.
+    calls = []
+    for op in ('phase_total', 'makespan'):
+        calls = [{'task': event['task'], 'host': event['host'],
+                  'pid': event['pid'], 'start': event['start'],
+                  'end': event['end'], 'subtasks': 0.0, 'files': []}
+                 for event in events if event['op'] == op]
+        if calls:
+            break
+
+    unassigned = {}
+    for event in events:
+        if event['op'] == 'phase_subtasks':
+            owner = _find_call(calls, event)
+            if owner is not None:
+                owner['subtasks'] += event['duration']
+        if event['op'] not in _READ_OPS + _WRITE_OPS:
+            continue
+        owner = _find_call(calls, event)
+        if owner is None:
+            key = (event['task'], event['host'], event['pid'])
+            owner = unassigned.setdefault(key, {
+                        'task': event['task'], 'host': event['host'],
+                        'pid': event['pid'], 'start': event['start'],
+                        'end': event['end'], 'subtasks': 0.0, 'files': []})
+            owner['start'] = min(owner['start'], event['start'])
+            owner['end'] = max(owner['end'], event['end'])
+        owner['files'].append(event)
+
+    calls.extend(unassigned.values())
+    calls.sort(key=lambda call: call['start'])
+    return calls
+
+
+def _find_call(calls, event):
+    # Innermost call of the same function and process containing the event
+    found = None
+    for call in calls:
+        if call['task'] == event['task'] and call['pid'] == event['pid'] \
+                and call['host'] == event['host'] \
+                and call['start'] <= event['start'] <= call['end']:
+            if found is None or call['start'] >= found['start']:
+                found = call
+    return found
+
+
+def _critical_path(calls):
+    # Longest chain of calls where each call reads a file written by the
+    # previous one, weighted by the call durations. Calls are in start
+    # order, so that producers always come before their consumers.
+    writers = {}
+    best = []
+    for n, call in enumerate(calls):
+        duration = call['end'] - call['start']
+        length, parent = duration, None
+        for event in call['files']:
+            if event['op'] not in _READ_OPS:
+                continue
+            for m in writers.get(event['filename'], []):
+                if calls[m]['end'] <= event['start'] \
+                        and best[m][0] + duration > length:
+                    length, parent = best[m][0] + duration, m
+        best.append((length, parent))
+        for event in call['files']:
+            if event['op'] in _WRITE_OPS:
+                writers.setdefault(event['filename'], []).append(n)
+
+    if not best:
+        return 0.0, []
+    n = max(range(len(best)), key=lambda m: best[m][0])
+    length = best[n][0]
+    path = []
+    while n is not None:
+        path.append({'task': calls[n]['task'], 'start': calls[n]['start'],
+                     'end': calls[n]['end'],
+                     'duration': calls[n]['end'] - calls[n]['start']})
+        n = best[n][1]
+    return length, path[::-1]
+
+
+def time_log_report(log_files, top=10, json_file=None, csv_file=None):
+    """
+    Analyse time logs recorded by the nighres functions, e.g. to decide
+    whether a pipeline is limited by storage or by computation
+
+    Parameters
+    ----------
+    log_files: str or list of str
+        JSON time logs (as given to the nighres functions, or as
+        glob patterns), each log is treated as a separate run
+    top: int, optional
+        Number of slowest file reads and writes to report (default is 10)
+    json_file: str, optional
+        Write the report as JSON to this file
+    csv_file: str, optional
+        Write the per-module table as CSV to this file, and the slowest files
+        and critical paths next to it (with _files.csv and
+        _critical_path.csv suffixes)
+
+    Returns
+    ----------
+    dict
+        Report with the following entries:
+
+        * modules: per function, the number of calls, wall time, compute
+          and I/O time (in s, compute being the wall time spent outside of
+          file I/O and nested nighres calls), the I/O fraction, the amount
+          of data read and written (MB) and the effective read and write
+          bandwidth (MB/s)
+        * bandwidth: overall read and write volume and bandwidth
+        * slowest_files: the slowest file reads and writes
+        * runs: for each log, its makespan and critical path, i.e. the
+          longest chain of calls each reading a file written by the
+          previous one
+
+    Notes
+    ----------
+    Wall times are taken from the profiling events (see
+    :mod:`nighres.profiling`) or the makespan events when recorded,
+    otherwise from the span of the file events of each function. Cached
+    reads and header reads count as I/O time but not in the bandwidth.
+    Logs in the nested JSON layout of earlier nighres versions are read as
+    well, as one process (see :func:`nighres.io.load_time_log`).
+    """
+    if isinstance(log_files, str):
+        log_files = [log_files]
+    names = []
+    for pattern in log_files:
+        # the events of timelog.json are stored in timelog.jsonl
+        matches = set(glob.glob(pattern))
+        if pattern.endswith('.json'):
+            matches.update(name[:-1] for name in glob.glob(pattern + 'l'))
+        names.extend(sorted(matches) or [pattern])
+
+    modules = {}
+    files = []
+    runs = []
+    for log_file in names:
+        events = load_time_log(log_file)
+        if not events:
+            warnings.warn("No time log events found for {0}".format(log_file))
+        calls = _calls(events)
+        for call in calls:
+            stats = modules.setdefault(call['task'], dict.fromkeys(
+                        ('calls', 'wall', 'subtasks', 'read', 'write',
+                         'read_bytes', 'write_bytes', 'read_disk',
+                         'write_disk'), 0.0))
+            stats['calls'] += 1
+            stats['wall'] += call['end'] - call['start']
+            stats['subtasks'] += call['subtasks']
+            for event in call['files']:
+                kind = 'read' if event['op'] in _READ_OPS else 'write'
+                stats[kind] += event['duration']
+                if event['op'] in ('read', 'write'):
+                    stats[kind+'_bytes'] += event['filesize']
+                    stats[kind+'_disk'] += event['duration']
+                    files.append({'log_file': log_file,
+                                  'task': event['task'], 'op': event['op'],
+                                  'filename': event['filename'],
+                                  'mb': event['filesize'] / 1e6,
+                                  'duration': event['duration'],
+                                  'mbps': _mbps(event['filesize'],
+                                                event['duration'])})
+
+        length, path = _critical_path(calls)
+        makespan = 0.0
+        if events:
+            makespan = max(event['end'] for event in events) \
+                - min(event['start'] for event in events)
+        runs.append({'log_file': log_file, 'calls': len(calls),
+                     'makespan': makespan, 'critical_path_time': length,
+                     'critical_path': path})
+
+    rows = []
+    totals = dict.fromkeys(('read_bytes', 'write_bytes', 'read_disk',
+                            'write_disk'), 0.0)
+    for task in sorted(modules):
+        stats = modules[task]
+        for key in totals:
+            totals[key] += stats[key]
+        io = stats['read'] + stats['write']
+        compute = max(stats['wall'] - stats['subtasks'] - io, 0.0)
+        rows.append({'task': task, 'calls': int(stats['calls']),
+                     'wall': stats['wall'], 'compute': compute, 'io': io,
+                     'read': stats['read'], 'write': stats['write'],
+                     'io_fraction': io / stats['wall']
+                     if stats['wall'] > 0 else None,
+                     'read_mb': stats['read_bytes'] / 1e6,
+                     'write_mb': stats['write_bytes'] / 1e6,
+                     'read_mbps': _mbps(stats['read_bytes'],
+                                        stats['read_disk']),
+                     'write_mbps': _mbps(stats['write_bytes'],
+                                         stats['write_disk'])})
+
+    files.sort(key=lambda event: event['duration'], reverse=True)
+    report = {'modules': rows,
+              'bandwidth': {'read_mb': totals['read_bytes'] / 1e6,
+                            'write_mb': totals['write_bytes'] / 1e6,
+                            'read_mbps': _mbps(totals['read_bytes'],
+                                               totals['read_disk']),
+                            'write_mbps': _mbps(totals['write_bytes'],
+                                                totals['write_disk'])},
+              'slowest_files': files[:top],
+              'runs': runs}
+
+    if json_file is not None:
+        with open(json_file, 'w') as out:
+            json.dump(report, out, indent=2)
+    if csv_file is not None:
+        base = csv_file[:-4] if csv_file.endswith('.csv') else csv_file
+        _write_csv(csv_file, _MODULE_COLUMNS, rows)
+        _write_csv(base + '_files.csv', ('log_file', 'task', 'op', 'filename',
+                   'mb', 'duration', 'mbps'), report['slowest_files'])
+        _write_csv(base + '_critical_path.csv',
+                   ('log_file', 'step', 'task', 'start', 'end', 'duration'),
+                   [dict(step=n, log_file=run['log_file'], **call)
+                    for run in runs
+                    for n, call in enumerate(run['critical_path'])])
+    return report
+
+
+def _write_csv(filename, columns, rows):
+    with open(filename, 'w', newline='') as out:
+        writer = csv.DictWriter(out, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _format(value, fmt='{0:.2f}'):
+    return '-' if value is None else fmt.format(value)
+
+
+def _print_report(report):
+    print('{0:40} {1:>5} {2:>9} {3:>9} {4:>9} {5:>5} {6:>9} {7:>9}'.format(
+          'module', 'calls', 'wall s', 'compute s', 'I/O s', 'I/O %',
+          'read MB/s', 'write MB/s'))
+    for row in report['modules']:
+        print('{0:40} {1:>5} {2:>9.2f} {3:>9.2f} {4:>9.2f} {5:>5} {6:>9} '
+              '{7:>9}'.format(row['task'][:40], row['calls'], row['wall'],
+                              row['compute'], row['io'],
+                              _format(row['io_fraction'] and
+                                      100*row['io_fraction'], '{0:.0f}'),
+                              _format(row['read_mbps'], '{0:.1f}'),
+                              _format(row['write_mbps'], '{0:.1f}')))
+
+    bandwidth = report['bandwidth']
+    print('\nread {0:.1f} MB at {1} MB/s, wrote {2:.1f} MB at {3} MB/s'.format(
+          bandwidth['read_mb'], _format(bandwidth['read_mbps'], '{0:.1f}'),
+          bandwidth['write_mb'], _format(bandwidth['write_mbps'], '{0:.1f}')))
+
+    print('\nslowest files')
+    for event in report['slowest_files']:
+        print('  {0:5} {1:8.2f} s {2:8.1f} MB {3:>8} MB/s  {4}'.format(
+              event['op'], event['duration'], event['mb'],
+              _format(event['mbps'], '{0:.1f}'), event['filename']))
+
+    for run in report['runs']:
+        print('\n{0}: makespan {1:.2f} s, critical path {2:.2f} s'.format(
+              run['log_file'], run['makespan'], run['critical_path_time']))
+        for call in run['critical_path']:
+            print('  {0:40} {1:8.2f} s'.format(call['task'],
+                                               call['duration']))
+
+
+def main(argv=None):
+    """
+    Command line interface of :func:`time_log_report`, e.g.
+    ``nighres-timelog-report run*/timelog.json --csv report.csv``
+    """
+    parser = argparse.ArgumentParser(
+                description='Report the compute and I/O time, bandwidth and '
+                            'critical path of nighres time logs')
+    parser.add_argument('log_files', nargs='+',
+                        help='JSON time logs or glob patterns, one per run')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest files to report')
+    parser.add_argument('--json', dest='json_file', default=None,
+                        help='write the report as JSON')
+    parser.add_argument('--csv', dest='csv_file', default=None,
+                        help='write the report as CSV tables')
+    args = parser.parse_args(argv)
+
+    report = time_log_report(args.log_files, top=args.top,
+                             json_file=args.json_file,
+                             csv_file=args.csv_file)
+    _print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import atexit
+import glob
+import json
+import multiprocessing.util
+import os
+import socket
+import threading
+import time
+from nighres import global_settings
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (e.g. Windows), use one shard file per process
+    fcntl = None
+
+# buffered events per events file, see time_log()
+_buffers = {}
+_last_flush = {}
+_buffer_pid = os.getpid()
+_buffer_lock = threading.Lock()
+
+
+def _events_file(log_file):
+    # Line-delimited events are stored next to the JSON log: timelog.json
+    # is recorded in timelog.jsonl (or one timelog.<host>-<pid>.jsonl shard
+    # per process)
+    base = log_file[:-5] if log_file.endswith('.json') else log_file
+    if global_settings.TIME_LOG_SHARDS or fcntl is None:
+        return '{0}.{1}-{2}.jsonl'.format(base, socket.gethostname(),
+                                          os.getpid())
+    return base + '.jsonl'
+
+
+def time_log(log_file, task_name, op_name, filename, start, end,
+             duration=None, memory=None):
+    """
+    Record a timed event (e.g. a file read or write, or a module makespan)
+
+    Events are buffered in memory and appended to a line-delimited JSON
+    file next to log_file (timelog.jsonl for timelog.json), see
+    :func:`flush_time_log` and :func:`time_log_to_json`.
+
+    Parameters
+    ----------
+    log_file: str
+        JSON time log the event belongs to, no event is recorded if None
+    task_name: str
+        Name of the task, usually the calling function
+    op_name: str
+        Type of event, e.g. 'read', 'write' or 'makespan'
+    filename: str
+        File read or written by the event, if any
+    start: float
+        Start time of the event, in seconds since the epoch
+    end: float
+        End time of the event, in seconds since the epoch
+    duration: float, optional
+        Duration of the event, if it is not end - start (e.g. for profiling
+        phases that were entered several times)
+    memory: dict, optional
+        Memory use measured during the event, in bytes (e.g. peak resident
+        set size and JVM heap of a profiling phase)
+    """
+    global _buffer_pid
+
+    if log_file is None:
+        return
+
+    if filename is not None and filename != "" and os.path.isfile(filename):
+        filesize = os.stat(filename).st_size
+    else:
+        filesize = 0
+    event = {"task": task_name,
+             "op": op_name,
+             "filename": filename,
+             "filesize": filesize,
+             "start": start,
+             "end": end,
+             "duration": end-start if duration is None else duration,
+             "host": socket.gethostname(),
+             "pid": os.getpid()}
+    if memory is not None:
+        event["memory"] = memory
+
+    events_file = _events_file(log_file)
+    with _buffer_lock:
+        if _buffer_pid != os.getpid():
+            # forked child: the inherited events belong to the parent
+            _buffers.clear()
+            _last_flush.clear()
+            _buffer_pid = os.getpid()
+        buffer = _buffers.setdefault(events_file, [])
+        buffer.append(event)
+        last = _last_flush.setdefault(events_file, time.time())
+        if len(buffer) < global_settings.TIME_LOG_BUFFER \
+                and time.time() - last < global_settings.TIME_LOG_INTERVAL:
+            return
+        _flush_events(events_file)
+
+
+def _flush_events(events_file):
+    # Append the buffered events in one write, under an exclusive lock of
+    # the file when several processes share it. Caller holds _buffer_lock.
+    buffer = _buffers.pop(events_file, [])
+    _last_flush[events_file] = time.time()
+    if not buffer:
+        return
+    lines = ''.join(json.dumps(event) + '\n' for event in buffer)
+    with open(events_file, 'a') as logfile:
+        if fcntl is not None:
+            fcntl.flock(logfile, fcntl.LOCK_EX)
+        try:
+            logfile.write(lines)
+            logfile.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(logfile, fcntl.LOCK_UN)
+
+
+def flush_time_log():
+    """
+    Write all buffered time log events to disk
+
+    This happens automatically every global_settings.TIME_LOG_BUFFER events
+    or TIME_LOG_INTERVAL seconds, and when the interpreter exits.
+    """
+    with _buffer_lock:
+        if _buffer_pid != os.getpid():
+            return
+        for events_file in list(_buffers):
+            _flush_events(events_file)
+
+
+def _register_exit_flush(*args):
+    # multiprocessing children skip atexit handlers but run finalizers
+    multiprocessing.util.Finalize(None, flush_time_log, exitpriority=10)
+
+
+atexit.register(flush_time_log)
+multiprocessing.util.register_after_fork(flush_time_log, _register_exit_flush)
+
+
+def load_time_log(log_file="timelog.json"):
+    """
+    Load all events recorded for a time log, from every process
+
+    Parameters
+    ----------
+    log_file: str
+        JSON time log name, as given to the nighres functions (default is
+        timelog.json)
+
+    Returns
+    ----------
+    list
+        Events as dictionaries with keys task, op, filename, filesize,
+        start, end, duration, host and pid (and memory for profiling
+        phases), sorted by start time
+
+    Notes
+    ----------
+    When no line-delimited events are found, a log_file in the nested
+    layout of earlier nighres versions (see :func:`time_log_to_json`) is
+    read instead, with unknown host and pid.
+    """
+    flush_time_log()
+    base = log_file[:-5] if log_file.endswith('.json') else log_file
+    events = []
+    for events_file in [base + '.jsonl'] + sorted(glob.glob(base+'.*.jsonl')):
+        if not os.path.isfile(events_file):
+            continue
+        with open(events_file) as logfile:
+            for line in logfile:
+                line = line.strip()
+                if line:
+                    events.append(json.loads(line))
+    if not events and log_file.endswith('.json') \
+            and os.path.isfile(log_file):
+        events = _nested_events(log_file)
+    events.sort(key=lambda event: event['start'])
+    return events
+
+
+def _nested_events(log_file):
+    # Events of a time log in the nested {task: {op: [...]}} layout, which
+    # does not record the host and process of the events
+    with open(log_file) as logfile:
+        try:
+            log = json.load(logfile)
+        except ValueError:
+            return []
+    if not isinstance(log, dict):
+        return []
+    events = []
+    for task, ops in log.items():
+        if not isinstance(ops, dict):
+            return []
+        for op, entries in ops.items():
+            if not isinstance(entries, list):
+                return []
+            for entry in entries:
+                event = {"task": task, "op": op, "filename": None,
+                         "filesize": 0, "host": None, "pid": None}
+                event.update(entry)
+                event.setdefault("duration", event['end'] - event['start'])
+                events.append(event)
+    return events
+
+
+def time_log_to_json(log_file="timelog.json"):
+    """
+    Write the recorded events of a time log to log_file in the nested JSON
+    layout of earlier nighres versions:
+    ``{task: {op: [{filename, filesize, start, end, duration}, ...]}}``
+
+    Parameters
+    ----------
+    log_file: str
+        JSON time log name, as given to the nighres functions (default is
+        timelog.json)
+
+    Returns
+    ----------
+    dict
+        The nested time log
+    """
+    log = {}
+    for event in load_time_log(log_file):
+        entry = {"filename": event['filename'],
+                 "filesize": event['filesize'],
+                 "start": event['start'],
+                 "end": event['end'],
+                 "duration": event['duration']}
+        if 'memory' in event:
+            entry["memory"] = event['memory']
+        log.setdefault(event['task'], {}).setdefault(event['op'],
+                                                     []).append(entry)
+
+    with open(log_file, "w") as logfile:
+        json.dump(log, logfile)
+    return log
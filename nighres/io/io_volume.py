@@ -2,13 +2,27 @@ import nibabel as nb
 import numpy as np
 import time
 import inspect
-import json
 import os
+import struct
+import threading
+import atexit
 from io import BytesIO
-from gzip import GzipFile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from nighres import global_settings
+from nighres.io.io_gzip import _gunzip, _GzipWriter, COMPRESSION_CODECS
+from nighres.io.io_cache import _volume_cache
+from nighres.io.io_timelog import time_log
+from nighres.profiling import _record_io, _task_log
+from nighres.cache import _output_call, _record_output
 
+# background writer state, see save_volume(background=True)
+_save_pool = None
+_pending_saves = {}
+_save_lock = threading.Lock()
 
-def load_volume(volume, log_file="timelog.json"):
+
+def load_volume(volume, log_file="timelog.json", mmap=None):
     """
     Load volumetric data into a
     `Nibabel SpatialImage <http://nipy.org/nibabel/reference/nibabel.spatialimages.html#nibabel.spatialimages.SpatialImage>`_
@@ -18,6 +32,11 @@ def load_volume(volume, log_file="timelog.json"):
     volume: niimg
         Volumetric data to be loaded, can be a path to a file that nibabel can
         load, or a Nibabel SpatialImage
+    mmap: bool, optional
+        Memory-map uncompressed files from disk instead of reading them into
+        memory. Only the header is parsed when loading, voxel data is read
+        when (and where) it is accessed. Compressed files are always read
+        into memory (default is global_settings.LOAD_MMAP)
 
     Returns
     ----------
@@ -25,6 +44,17 @@ def load_volume(volume, log_file="timelog.json"):
 
     Notes
     ----------
+    When global_settings.VOLUME_CACHE_MB is set, files are kept in an
+    in-memory cache and repeated loads of an unchanged file return its
+    (read-only) data without reading it again, see
+    :func:`volume_cache_info`.
+
+    Without memory-mapping, NIfTI files are read (and .gz files inflated)
+    into a single preallocated buffer that the data array points into.
+    Compressed files made of independent BGZF blocks, as written by bgzip,
+    are inflated on global_settings.IO_THREADS cores; regular gzip streams
+    are inflated on a single core.
+
     Originally created as part of Laminar Python [1]_ .
 
     References
@@ -38,19 +68,40 @@ def load_volume(volume, log_file="timelog.json"):
     # python 2 version if isinstance(volume, basestring):
 
 
+    if mmap is None:
+        mmap = global_settings.LOAD_MMAP
+    log_file = _task_log(log_file)
+
     if isinstance(volume, str):
+        # the file may still be in the background write queue
+        _wait_for_save(volume)
+
         start = time.time()
+        image = _volume_cache.get(volume)
+        if image is not None:
+            end = time.time()
+            caller_function = str(inspect.stack()[1].function)
+            time_log(log_file, caller_function, "cached_read", volume,
+                     start, end)
+            _record_io('load', start, end)
+            return image
+
         # importing nifti files
-        # image = nb.load(volume) # disable lazy-load
-        # Read from file instead
-        with open(volume, "rb") as in_file:
-            # fh = nb.FileHolder(fileobj=GzipFile(fileobj=BytesIO(in_file.read())))
-            fh = nb.FileHolder(fileobj=BytesIO(in_file.read()))     # read uncompressed file
-            image = nb.Nifti1Image.from_file_map({"header": fh, "image": fh})
+        if mmap and not volume.endswith('.gz'):
+            # lazy-load, the data array is a view on the mapped file
+            image = nb.load(volume, mmap=True)
+        else:
+            # Read from file instead
+            image = _read_nifti(volume)
+            if image is None:
+                # not a single-file NIfTI, leave it to nibabel
+                image = nb.load(volume)
+            image = _volume_cache.put(volume, image)
         end = time.time()
 
         caller_function = str(inspect.stack()[1].function)
         time_log(log_file, caller_function, "read", volume, start, end)
+        _record_io('load', start, end)
     # if volume is already a nibabel object
     elif isinstance(volume, nb.spatialimages.SpatialImage):
         image = volume
@@ -62,7 +113,101 @@ def load_volume(volume, log_file="timelog.json"):
     return image
 
 
-def save_volume(filename, volume, dtype='float32', overwrite_file=True, log_file="timelog.json"):
+def load_volume_header(volume, log_file="timelog.json"):
+    """
+    Load only the header of volumetric data, without reading the voxel data
+
+    Parameters
+    ----------
+    volume: niimg
+        Volumetric data whose header is to be loaded, can be a path to a file
+        that nibabel can load, or a Nibabel SpatialImage
+
+    Returns
+    ----------
+    header: Nibabel header
+        Image header, giving the data shape (``get_data_shape()``), voxel
+        sizes (``get_zooms()``) and affine (``get_best_affine()``). It is a
+        copy that can be modified and used to create new images.
+
+    Notes
+    ----------
+    For compressed files, only the beginning of the file is decompressed.
+    """
+
+    log_file = _task_log(log_file)
+    if isinstance(volume, str):
+        _wait_for_save(volume)
+
+        start = time.time()
+        # nibabel only parses the header until the data is accessed
+        header = nb.load(volume).header.copy()
+        end = time.time()
+
+        caller_function = str(inspect.stack()[1].function)
+        time_log(log_file, caller_function, "read_header", volume, start, end)
+        _record_io('load', start, end)
+    elif isinstance(volume, nb.spatialimages.SpatialImage):
+        # new image around the same data to get a header in sync with the
+        # current affine without touching the input
+        header = volume.__class__(volume.dataobj, volume.affine,
+                                  volume.header).header
+    else:
+        raise ValueError('Input volume must be a either a path to a file in a '
+                         'format that Nibabel can load, or a nibabel'
+                         'SpatialImage.')
+
+    return header
+
+
+def _read_nifti(filename):
+    # Read a NIfTI file, inflating it if needed, into one preallocated buffer
+    # and build the image around it without copying the voxel data again
+    if filename.endswith('.gz'):
+        buf = _gunzip(filename)
+    else:
+        buf = bytearray(os.path.getsize(filename))
+        with open(filename, 'rb') as in_file:
+            in_file.readinto(buf)
+    return _nifti_from_buffer(buf)
+
+
+def _nifti_from_buffer(buf):
+    # Wrap the contents of a single-file NIfTI-1/2 image held in buf,
+    # returns None if buf does not contain one
+    for header_class, image_class, vox_offset_fmt, vox_offset_pos in \
+            ((nb.Nifti1Header, nb.Nifti1Image, 'f', 108),
+             (nb.Nifti2Header, nb.Nifti2Image, 'q', 168)):
+        for endian in '<>':
+            if len(buf) >= header_class.sizeof_hdr and \
+                    struct.unpack_from(endian+'i', buf)[0] \
+                    == header_class.sizeof_hdr:
+                break
+        else:
+            continue
+        vox_offset = int(struct.unpack_from(endian+vox_offset_fmt, buf,
+                                            vox_offset_pos)[0])
+        header_size = max(vox_offset, header_class.sizeof_hdr)
+        header = header_class.from_fileobj(BytesIO(buf[:header_size]))
+        if header['magic'] not in (b'n+1', b'n+2'):
+            # header of a .hdr/.img pair
+            return None
+
+        dtype = header.get_data_dtype()
+        data = np.ndarray(header.get_data_shape(), dtype=dtype, buffer=buf,
+                          offset=int(header.get_data_offset()), order='F')
+        slope, inter = header.get_slope_inter()
+        data = nb.volumeutils.apply_read_scaling(data, slope, inter)
+        image = image_class(data, header.get_best_affine(), header)
+        image.set_data_dtype(dtype)
+        return image
+
+    return None
+
+
+def save_volume(filename, volume, dtype='float32', overwrite_file=True,
+                log_file="timelog.json", background=None, compression=None,
+                compression_level=None):
     """
     Save volumetric data that is a
     `Nibabel SpatialImage <http://nipy.org/nibabel/reference/nibabel.spatialimages.html#nibabel.spatialimages.SpatialImage>`_
@@ -79,6 +224,26 @@ def save_volume(filename, volume, dtype='float32', overwrite_file=True, log_file
         Datatype in which volumetric data should be stored (default is float32)
     overwrite_file: bool, optional
         Overwrite existing files (default is True)
+    background: bool, optional
+        Queue the write on a background thread and return immediately. The
+        volume must not be modified until it is written, use
+        :func:`flush_volumes` to wait for pending writes and raise their
+        errors (default is global_settings.SAVE_BACKGROUND)
+    compression: {'none', 'gzip', 'bgzf'}, optional
+        Compression of NIfTI files: 'none' writes plain .nii files, 'gzip' a
+        regular .nii.gz file and 'bgzf' a .nii.gz file made of independent
+        blocks that are compressed (and read back by :func:`load_volume`) on
+        global_settings.IO_THREADS cores. The .gz extension of filename is
+        added or removed accordingly (default is
+        global_settings.SAVE_COMPRESSION)
+    compression_level: int, optional
+        Compression level between 1 (fastest) and 9 (smallest) (default is
+        global_settings.SAVE_COMPRESSION_LEVEL)
+
+    Returns
+    ----------
+    str
+        Name of the file the volume is written to
 
     Notes
     ----------
@@ -90,54 +255,159 @@ def save_volume(filename, volume, dtype='float32', overwrite_file=True, log_file
        depth-resolved analysis of high-resolution brain imaging data in
        Python. DOI: 10.3897/rio.3.e12346
     """  # noqa
-    import os
+    if compression is None:
+        compression = global_settings.SAVE_COMPRESSION
+    if compression_level is None:
+        compression_level = global_settings.SAVE_COMPRESSION_LEVEL
+    if compression not in COMPRESSION_CODECS:
+        raise ValueError('compression must be one of {0}, not {1}'.format(
+                         ', '.join(COMPRESSION_CODECS), compression))
 
-    if filename.endswith(".gz"):
-        filename = filename[0:len(filename) - 3]
+    filename = _volume_filename(filename, compression)
 
-    start = time.time()
+    if background is None:
+        background = global_settings.SAVE_BACKGROUND
+    log_file = _task_log(log_file)
+
+    caller_function = str(inspect.stack()[1].function)
     if dtype is not None:
         volume.set_data_dtype(dtype)
+    # the nighres call the output belongs to, for the result cache manifest
+    call = _output_call()
+
+    if background:
+        _submit_save(filename, volume, overwrite_file, log_file,
+                     caller_function, compression, compression_level, call)
+    else:
+        _write_volume(filename, volume, overwrite_file, log_file,
+                      caller_function, compression, compression_level, call)
+
+    return filename
+
+
+def _volume_filename(filename, compression=None):
+    # Add or remove the .gz extension of NIfTI file names depending on the
+    # output compression
+    if compression is None:
+        compression = global_settings.SAVE_COMPRESSION
+    if compression == 'none' and filename.endswith(".gz"):
+        filename = filename[0:len(filename) - 3]
+    elif compression != 'none' and filename.endswith(".nii"):
+        filename = filename + ".gz"
+    return filename
+
+
+def _write_volume(filename, volume, overwrite_file, log_file,
+                  caller_function, compression, compression_level,
+                  call=None):
+    # Write the volume to disk and log the time it took
+    _volume_cache.invalidate(filename)
+    start = time.time()
     if os.path.isfile(filename) and overwrite_file is False:
         print("\nThis file exists and overwrite_file was set to False, "
               "file not saved.")
     else:
         try:
-            volume.to_filename(filename)
+            if compression != 'none' and filename.endswith(".gz") \
+                    and isinstance(volume, nb.Nifti1Image):
+                # stream through our own compressor instead of nibabel's
+                with open(filename, 'wb') as out_file, \
+                        _GzipWriter(out_file, compression,
+                                    compression_level) as gz_file:
+                    volume.to_file_map(
+                                {'image': nb.FileHolder(fileobj=gz_file)})
+                volume.file_map = volume.filespec_to_file_map(filename)
+            else:
+                volume.to_filename(filename)
             print("\nSaving {0}".format(filename))
+            _record_output(filename, call)
         except AttributeError:
             print('\nInput volume must be a Nibabel SpatialImage.')
 
     end = time.time()
-    caller_function = str(inspect.stack()[1].function)
     time_log(log_file, caller_function, "write", filename, start, end)
+    _record_io('save', start, end)
 
 
-def time_log(log_file, task_name, op_name, filename, start, end):
-    # Create log file if not exists
-    if not os.path.exists(log_file):
-        with open(log_file, 'w+') as logfile:
-            logfile.write("{}")
+def _submit_save(filename, volume, overwrite_file, log_file,
+                 caller_function, compression, compression_level, call):
+    # Queue a write on the background pool, after any pending write of the
+    # same file so that the last call wins
+    global _save_pool
 
-    # Save time log to json object
-    with open(log_file, "r") as logfile:
-        log = json.load(logfile)
+    key = os.path.abspath(filename)
+    _wait_for_save(key)
+    with _save_lock:
+        if _save_pool is None:
+            _save_pool = ThreadPoolExecutor(
+                            max_workers=global_settings.SAVE_WORKERS,
+                            thread_name_prefix='nighres-save')
+        future = _save_pool.submit(_write_volume, filename, volume,
+                                   overwrite_file, log_file, caller_function,
+                                   compression, compression_level, call)
+        _pending_saves[key] = future
 
-    if task_name not in log:
-        log[task_name] = {}
+    # forget successful writes right away so the volume can be released,
+    # failed ones are kept until flush_volumes() reports them
+    def _release(done):
+        if done.exception() is None:
+            with _save_lock:
+                if _pending_saves.get(key) is done:
+                    del _pending_saves[key]
+    future.add_done_callback(_release)
 
-    if op_name not in log[task_name]:
-        log[task_name][op_name] = []
 
-    if (filename is not None) and (filename is not "") and (os.stat(filename) is not None):
-        filesize = os.stat(filename).st_size
-    else:
-        filesize = 0
-    log[task_name][op_name].append({"filename": filename,
-                                    "filesize": filesize,
-                                    "start": start,
-                                    "end": end,
-                                    "duration": end-start})
-
-    with open(log_file, "w") as logfile:
-        json.dump(log, logfile)
+def _wait_for_save(filename):
+    # Block until a pending background write of filename has completed
+    with _save_lock:
+        future = _pending_saves.get(os.path.abspath(filename))
+    if future is not None:
+        future.result()
+
+
+def flush_volumes():
+    """
+    Wait for all volumes queued with ``save_volume(..., background=True)``
+    to be written
+
+    Raises
+    ----------
+    Exception
+        The error of the first failed write, if any. Errors of further
+        failed writes are printed.
+    """
+    with _save_lock:
+        futures = list(_pending_saves.values())
+        _pending_saves.clear()
+
+    errors = [error for error in (future.exception() for future in futures)
+              if error is not None]
+    for error in errors[1:]:
+        print('\nBackground save failed: {0}'.format(error))
+    if errors:
+        raise errors[0]
+
+
+@contextmanager
+def background_saving():
+    """
+    Context manager that saves volumes in the background within its block
+    and waits for all of them to be written when leaving it
+
+    Examples
+    ----------
+    >>> with nighres.io.background_saving():  # doctest: +SKIP
+    ...     nighres.brain.mgdm_segmentation(..., save_data=True)
+    ...     nighres.brain.extract_brain_region(..., save_data=True)
+    """
+    previous = global_settings.SAVE_BACKGROUND
+    global_settings.SAVE_BACKGROUND = True
+    try:
+        yield
+    finally:
+        global_settings.SAVE_BACKGROUND = previous
+        flush_volumes()
+
+
+# make sure queued writes are reported before the interpreter exits
+atexit.register(flush_volumes)
@@ -0,0 +1,268 @@
+import re
+import sys
+import threading
+import warnings
+import psutil
+from nighres import global_settings
+
+# JVM options selecting each garbage collector of global_settings.JVM_GC
+_GC_OPTIONS = {'g1': '-XX:+UseG1GC', 'parallel': '-XX:+UseParallelGC',
+               'serial': '-XX:+UseSerialGC', 'z': '-XX:+UseZGC',
+               'shenandoah': '-XX:+UseShenandoahGC'}
+
+_SIZE_UNITS = {'': 1, 'k': 2**10, 'm': 2**20, 'g': 2**30, 't': 2**40}
+
+# settings the JVM of this process was started with, None if it was not
+# started by start_jvm()
+_config = None
+_lock = threading.Lock()
+
+# attachment of each thread attached by _attach_thread()
+_local = threading.local()
+
+
+def _nighresjava():
+    # nighresjava, imported on first use so that importing nighres does not
+    # load it, None if it is not installed
+    try:
+        import nighresjava
+    except ImportError:
+        return None
+    return nighresjava
+
+
+def _heap_bytes(value, processes, available):
+    # Heap size in bytes from a size ('4g', '512m', bytes) or a percentage
+    # of the available memory ('25%'), which is shared between the given
+    # number of processes
+    text = str(value).strip().lower()
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*%$', text)
+    if match:
+        return int(float(match.group(1)) / 100.0 * available / processes)
+    match = re.match(r'^(\d+)\s*([kmgt]?)b?$', text)
+    if match:
+        return int(match.group(1)) * _SIZE_UNITS[match.group(2)]
+    raise ValueError("Invalid JVM heap size {0}, use a size such as '4g' or "
+                     "'512m', or a percentage of the available memory such "
+                     "as '50%'".format(value))
+
+
+def _jvm_settings(initial_heap=None, max_heap=None, gc=None, threads=None,
+                  options=None, processes=None):
+    # Resolve the JVM settings, taking unset arguments from global_settings
+    if initial_heap is None:
+        initial_heap = global_settings.JVM_INITIAL_HEAP
+    if max_heap is None:
+        max_heap = global_settings.JVM_MAX_HEAP
+    if gc is None:
+        gc = global_settings.JVM_GC
+    if threads is None:
+        threads = global_settings.JVM_THREADS
+    if options is None:
+        options = global_settings.JVM_OPTIONS
+    if processes is None:
+        processes = global_settings.JVM_PROCESSES
+    processes = max(int(processes), 1)
+
+    available = psutil.virtual_memory().available
+    max_bytes = _heap_bytes(max_heap, processes, available)
+    # the JVM refuses to start with an initial heap above the maximum
+    initial_bytes = min(_heap_bytes(initial_heap, processes, available),
+                        max_bytes)
+
+    vmargs = []
+    if gc:
+        if gc.lower() not in _GC_OPTIONS:
+            raise ValueError("Unknown JVM garbage collector {0}, use one of "
+                             "{1}".format(gc, ', '.join(sorted(_GC_OPTIONS))))
+        vmargs.append(_GC_OPTIONS[gc.lower()])
+    threads = int(threads)
+    if threads > 0:
+        # processors seen by the Java code and the garbage collector
+        vmargs.append('-XX:ActiveProcessorCount={0}'.format(threads))
+        vmargs.append('-XX:ParallelGCThreads={0}'.format(threads))
+    if isinstance(options, str):
+        options = options.split()
+    vmargs.extend(options)
+
+    return {'initial_heap': initial_bytes, 'max_heap': max_bytes,
+            'gc': gc or None, 'threads': threads or None,
+            'processes': processes, 'vmargs': vmargs}
+
+
+def start_jvm(initial_heap=None, max_heap=None, gc=None, threads=None,
+              options=None, processes=None):
+    """
+    Start the Java virtual machine running the nighresjava modules, if it
+    is not already running, and attach the calling thread to it
+
+    The nighres functions call this before using Java, so that the JVM only
+    starts with the first of them and that they can be called from any
+    Python thread (see :func:`detach_thread`). Call it explicitly to start
+    the JVM with other settings than those of global_settings. A JVM cannot
+    be restarted or resized: settings given once it runs are ignored with a
+    warning.
+
+    Parameters
+    ----------
+    initial_heap: str, optional
+        Initial heap, as a size ('4g', '512m') or a percentage of the memory
+        available when the JVM starts ('25%'), default is
+        global_settings.JVM_INITIAL_HEAP
+    max_heap: str, optional
+        Maximum heap, in the same units, default is
+        global_settings.JVM_MAX_HEAP
+    gc: str, optional
+        Garbage collector: 'g1', 'parallel', 'serial', 'z' or 'shenandoah',
+        default is global_settings.JVM_GC (the JVM default if empty)
+    threads: int, optional
+        Processors used by the Java code and garbage collector, default is
+        global_settings.JVM_THREADS (all processors if 0)
+    options: str or list of str, optional
+        Additional JVM options, default is global_settings.JVM_OPTIONS
+    processes: int, optional
+        Number of processes sharing the node, each of which gets its share
+        of the percentages of available memory, default is
+        global_settings.JVM_PROCESSES
+
+    Returns
+    ----------
+    JCCEnv
+        The JVM environment of nighresjava
+
+    Notes
+    ----------
+    Percentages are evaluated against the memory available when the JVM
+    starts. When several nighres processes share a node, set
+    global_settings.JVM_PROCESSES (or NIGHRES_JVM_PROCESSES) to their number,
+    or give each an explicit maximum heap, so that their heaps add up to
+    the available memory rather than each claiming most of it.
+    """
+    global _config
+
+    nighresjava = _nighresjava()
+    if nighresjava is None:
+        raise ImportError("nighresjava is not installed, see the nighres "
+                          "installation instructions")
+
+    requested = (initial_heap, max_heap, gc, threads, options, processes)
+    with _lock:
+        env = nighresjava.getVMEnv()
+        if env is None:
+            config = _jvm_settings(*requested)
+            kwargs = {'initialheap': str(config['initial_heap']),
+                      'maxheap': str(config['max_heap'])}
+            if config['vmargs']:
+                kwargs['vmargs'] = ','.join(config['vmargs'])
+            try:
+                # also attaches the calling thread
+                env = nighresjava.initVM(**kwargs)
+                _config = config
+                return env
+            except ValueError:
+                # started concurrently outside of start_jvm()
+                env = nighresjava.getVMEnv()
+
+    if any(value is not None for value in requested):
+        warnings.warn("The JVM is already running, its settings can only be "
+                      "changed in a new process", RuntimeWarning)
+    _attach_thread(env)
+    return env
+
+
+class _Attachment(object):
+    # Held in the thread-local storage of an attached thread, which is
+    # cleared by the thread itself when it ends: detaching then releases
+    # its Java thread object
+
+    def __init__(self, env):
+        self.env = env
+        self.ident = threading.get_ident()
+
+    def __del__(self):
+        if threading.get_ident() == self.ident:
+            try:
+                self.env.detachCurrentThread()
+            except Exception:
+                pass
+
+
+def _attach_thread(env):
+    # JCC requires every thread calling Java to be attached to the JVM. Worker
+    # threads are attached as daemons, so that they never keep the JVM from
+    # shutting down, and detached automatically when they end.
+    if env.isCurrentThreadAttached():
+        return
+    env.attachCurrentThread(threading.current_thread().name, True)
+    _local.attachment = _Attachment(env)
+
+
+def detach_thread():
+    """
+    Detach the calling thread from the Java virtual machine
+
+    Threads are attached by the nighres functions when they first use Java
+    and detached when they end, so this is only needed for long-lived
+    threads that stop using nighres. It has no effect on threads that were
+    not attached by nighres (e.g. the thread that started the JVM).
+    """
+    attachment = getattr(_local, 'attachment', None)
+    if attachment is not None:
+        # detaching when the attachment is dropped
+        del _local.attachment
+        del attachment
+
+
+def _jvm_heap():
+    # Used, committed and maximum heap of the running JVM in bytes, or None
+    # when the JVM is not started (or not reachable from this thread)
+    nighresjava = sys.modules.get('nighresjava')
+    runtime_class = getattr(nighresjava, 'Runtime', None)
+    env = nighresjava.getVMEnv() if runtime_class is not None else None
+    if env is None or not env.isCurrentThreadAttached():
+        return None
+    try:
+        runtime = runtime_class.getRuntime()
+        committed = runtime.totalMemory()
+        return committed - runtime.freeMemory(), committed, \
+            runtime.maxMemory()
+    except Exception:
+        return None
+
+
+def jvm_config():
+    """
+    Settings of the Java virtual machine used by the nighres functions
+
+    Returns
+    ----------
+    dict
+        Configuration with the following entries:
+
+        * running: whether the JVM is started
+        * started_by_nighres: whether it was started by :func:`start_jvm`,
+          otherwise the settings are those it would be started with
+        * initial_heap, max_heap: heap sizes in bytes
+        * gc, threads: garbage collector and processor count, None for the
+          JVM defaults
+        * processes: processes assumed to share the node memory
+        * vmargs: JVM options
+        * heap_used, heap_committed, heap_max: current heap of the running
+          JVM in bytes, when the nighresjava build exposes it
+    """
+    # the JVM cannot run if nighresjava was never imported
+    nighresjava = sys.modules.get('nighresjava')
+    running = nighresjava is not None and nighresjava.getVMEnv() is not None
+    if _config is not None:
+        config = dict(_config)
+    else:
+        config = _jvm_settings()
+    config['vmargs'] = list(config['vmargs'])
+    config['running'] = running
+    config['started_by_nighres'] = _config is not None
+
+    heap = _jvm_heap() if running else None
+    if heap is not None:
+        config['heap_used'], config['heap_committed'], \
+            config['heap_max'] = heap
+    return config
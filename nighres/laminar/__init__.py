@@ -1,6 +1,10 @@
-from nighres.laminar.volumetric_layering import volumetric_layering
-from nighres.laminar.profile_sampling import profile_sampling
-from nighres.laminar.profile_averaging import profile_averaging
-from nighres.laminar.profile_meshing import profile_meshing
-from nighres.laminar.laminar_iterative_smoothing import laminar_iterative_smoothing
-from nighres.laminar.laminar_regional_approximation import laminar_regional_approximation
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'volumetric_layering': '.volumetric_layering',
+    'profile_sampling': '.profile_sampling',
+    'profile_averaging': '.profile_averaging',
+    'profile_meshing': '.profile_meshing',
+    'laminar_iterative_smoothing': '.laminar_iterative_smoothing',
+    'laminar_regional_approximation': '.laminar_regional_approximation'})
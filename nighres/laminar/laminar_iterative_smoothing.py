@@ -3,9 +3,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
-from ..utils import _output_dir_4saving, _fname_4saving, _check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving, \
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def laminar_iterative_smoothing(profile_surface_image, intensity_image, fwhm_mm,
                      roi_mask_image=None,
                      save_data=False, overwrite=False, output_dir=None,
@@ -60,44 +66,39 @@ def laminar_iterative_smoothing(profile_surface_image, intensity_image, fwhm_mm,
                                       rootfile=intensity_image,
                                       suffix='lis-smooth'))
         if overwrite is False \
-            and os.path.isfile(smoothed_file) :
+            and _is_cached(smoothed_file) :
 
             print("skip computation (use existing results)")
             output = {"result": smoothed_file}
             return output
 
     # start VM if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initate class
     smoother = nighresjava.LaminarIterativeSmoothing()
 
     # load the data
     surface_img = load_volume(profile_surface_image)
-    surface_data = surface_img.get_data()
+    surface_data = _volume_data(surface_img, 'float')
     layers = surface_data.shape[3]-1
 
     intensity_img = load_volume(intensity_image)
-    intensity_data = intensity_img.get_data()
+    intensity_data = _volume_data(intensity_img, 'float')
     hdr = intensity_img.header
     aff = intensity_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = intensity_data.shape
 
     if (roi_mask_image!=None) :
-        roi_mask_data = load_volume(data_image).get_data()
+        roi_mask_data = _volume_data(load_volume(data_image), 'int')
     else :
         roi_mask_data = None
 
     # pass inputs
-    smoother.setIntensityImage(nighresjava.JArray('float')(
-                                  (intensity_data.flatten('F')).astype(float)))
-    smoother.setProfileSurfaceImage(nighresjava.JArray('float')(
-                                   (surface_data.flatten('F')).astype(float)))
+    smoother.setIntensityImage(_to_java(intensity_data, 'float'))
+    smoother.setProfileSurfaceImage(_to_java(surface_data, 'float'))
     smoother.setResolutions(resolution[0], resolution[1], resolution[2])
     smoother.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     smoother.setLayers(layers)
@@ -107,11 +108,11 @@ def laminar_iterative_smoothing(profile_surface_image, intensity_image, fwhm_mm,
         smoother.set4thDimension(1)
 
     if (roi_mask_data!=None):
-        smoother.setROIMask(nighresjava.JArray('int')(
-                                  (roi_mask_data.flatten('F')).astype(int).tolist()))
+        smoother.setROIMask(_to_java(roi_mask_data, 'int'))
     smoother.setFWHMmm(float(fwhm_mm))
 
     # execute class
+    phase('execute')
     try:
         smoother.execute()
 
@@ -121,11 +122,10 @@ def laminar_iterative_smoothing(profile_surface_image, intensity_image, fwhm_mm,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collecting outputs
-    smoothed_data = np.reshape(np.array(
-                                smoother.getSmoothedIntensityImage(),
-                                dtype=np.float32), dimensions, 'F')
+    smoothed_data = _from_java(smoother.getSmoothedIntensityImage(), dimensions)
 
     hdr['cal_max'] = np.nanmax(smoothed_data)
     smoothed = nb.Nifti1Image(smoothed_data, aff, hdr)
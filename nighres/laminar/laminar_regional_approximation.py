@@ -4,9 +4,15 @@ import numpy
 import nibabel
 import nighresjava
 from ..io import load_volume, save_volume
-from ..utils import _output_dir_4saving, _fname_4saving, _check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached, _record_output
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving, \
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def laminar_regional_approximation(profile_surface_image, intensity_image, roi_image,
                      save_data=False, overwrite=False, output_dir=None,
                      file_name=None):
@@ -72,6 +78,14 @@ def laminar_regional_approximation(profile_surface_image, intensity_image, roi_i
                         _fname_4saving(module=__name__,file_name=file_name,
                                       rootfile=intensity_image,
                                       suffix='lra-p25',ext='txt'))
+        sample_file = os.path.join(output_dir,
+                        _fname_4saving(module=__name__,file_name=file_name,
+                                      rootfile=intensity_image,
+                                      suffix='lra-best',ext='txt'))
+        iqr_file = os.path.join(output_dir,
+                        _fname_4saving(module=__name__,file_name=file_name,
+                                      rootfile=intensity_image,
+                                      suffix='lra-iqr',ext='txt'))
         median_file = os.path.join(output_dir,
                         _fname_4saving(module=__name__,file_name=file_name,
                                       rootfile=intensity_image,
@@ -81,8 +95,8 @@ def laminar_regional_approximation(profile_surface_image, intensity_image, roi_i
                                       rootfile=intensity_image,
                                       suffix='lpa-p75',ext='txt'))
         if overwrite is False \
-            and os.path.isfile(weight_file) and os.path.isfile(sample_file) \
-            and os.path.isfile(median_file) and os.path.isfile(iqr_file) :
+            and _is_cached(weight_file) and _is_cached(sample_file) \
+            and _is_cached(median_file) and _is_cached(iqr_file) :
 
             print("skip computation (use existing results)")
             output = {'weights': weight_file,
@@ -92,39 +106,34 @@ def laminar_regional_approximation(profile_surface_image, intensity_image, roi_i
             return output
 
     # start VM if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initate class
     sampler = nighresjava.LaminarProfileAveraging()
 
     # load the data
     surface_img = load_volume(profile_surface_image)
-    surface_data = surface_img.get_data()
+    surface_data = _volume_data(surface_img, 'float')
     hdr = surface_img.header
     aff = surface_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = surface_data.shape
 
-    intensity_data = load_volume(intensity_image).get_data()
+    intensity_data = _volume_data(load_volume(intensity_image), 'float')
 
-    roi_data = load_volume(roi_image).get_data()
+    roi_data = _volume_data(load_volume(roi_image), 'int')
 
     # pass inputs
-    sampler.setIntensityImage(nighresjava.JArray('float')(
-                                  (intensity_data.flatten('F')).astype(float)))
-    sampler.setProfileSurfaceImage(nighresjava.JArray('float')(
-                                   (surface_data.flatten('F')).astype(float)))
-    sampler.setRoiMask(nighresjava.JArray('int')(
-                                   (roi_data.flatten('F')).astype(int).tolist()))
+    sampler.setIntensityImage(_to_java(intensity_data, 'float'))
+    sampler.setProfileSurfaceImage(_to_java(surface_data, 'float'))
+    sampler.setRoiMask(_to_java(roi_data, 'int'))
     sampler.setResolutions(resolution[0], resolution[1], resolution[2])
     sampler.setDimensions(dimensions[0], dimensions[1],
                           dimensions[2], dimensions[3])
 
     # execute class
+    phase('execute')
     try:
         sampler.execute()
 
@@ -134,15 +143,14 @@ def laminar_regional_approximation(profile_surface_image, intensity_image, roi_i
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collecting outputs
-    weight_data = numpy.reshape(numpy.array(
-                                sampler.getProfileWeights(),
-                                dtype=numpy.float32), (dimensions[0],dimensions[1],dimensions[2]), 'F')
+    weight_data = _from_java(sampler.getProfileWeights(), (dimensions[0],dimensions[1],dimensions[2]))
 
-    sample = numpy.array(sampler.getSampleProfile(), dtype=numpy.float32)
-    median = numpy.array(sampler.getMedianProfile(), dtype=numpy.float32)
-    iqr = numpy.array(sampler.getIqrProfile(), dtype=numpy.float32)
+    sample = _from_java(sampler.getSampleProfile())
+    median = _from_java(sampler.getMedianProfile())
+    iqr = _from_java(sampler.getIqrProfile())
 
     hdr['cal_max'] = numpy.nanmax(weight_data)
     weights = nibabel.Nifti1Image(weight_data, aff, hdr)
@@ -150,8 +158,11 @@ def laminar_regional_approximation(profile_surface_image, intensity_image, roi_i
     if save_data:
         save_volume(weight_file, weights)
         numpy.savetxt(sample_file, sample)
+        _record_output(sample_file)
         numpy.savetxt(median_file, median)
+        _record_output(median_file)
         numpy.savetxt(iqr_file, iqr)
+        _record_output(iqr_file)
         return {'weights': weight_file}
     else:
         return {'weights': weights}
@@ -3,10 +3,17 @@ import sys
 import numpy as np
 import nibabel as nb
 import nighresjava
-from ..io import load_volume, save_volume, load_mesh_geometry, save_mesh, save_mesh_geometry
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..io import load_volume, load_volume_header, save_volume, \
+                load_mesh_geometry, save_mesh, save_mesh_geometry
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def profile_meshing(profile_surface_image, starting_surface_mesh, 
                             save_data=False, overwrite=False, output_dir=None,
                             file_name=None):
@@ -53,7 +60,7 @@ def profile_meshing(profile_surface_image, starting_surface_mesh,
     print("\nProfile meshing")
 
     # check number of layers
-    nlayers = load_volume(profile_surface_image).header.get_data_shape()[3]
+    nlayers = load_volume_header(profile_surface_image).get_data_shape()[3]
 
     # make sure that saving related parameters are correct
     if save_data:
@@ -69,7 +76,7 @@ def profile_meshing(profile_surface_image, starting_surface_mesh,
         if overwrite is False :
             missing = False
             for n in range(nlayers):
-                if not os.path.isfile(mesh_files[n]):
+                if not _is_cached(mesh_files[n]):
                     missing = True
 
             if not missing:
@@ -78,39 +85,34 @@ def profile_meshing(profile_surface_image, starting_surface_mesh,
                 return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.LaminarProfileMeshing()
 
     # load the data
     surface_img = load_volume(profile_surface_image)
-    surface_data = surface_img.get_data()
+    surface_data = _volume_data(surface_img, 'float')
     hdr = surface_img.header
     aff = surface_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = surface_data.shape
 
-    algorithm.setProfileSurfaceImage(nighresjava.JArray('float')(
-                                   (surface_data.flatten('F')).astype(float)))
+    algorithm.setProfileSurfaceImage(_to_java(surface_data, 'float'))
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
     algorithm.setDimensions(dimensions[0], dimensions[1],
                           dimensions[2], dimensions[3])
 
     orig_mesh = load_mesh_geometry(starting_surface_mesh)
 
-    algorithm.setInputSurfacePoints(nighresjava.JArray('float')(
-                            (orig_mesh['points'].flatten('C')).astype(float)))
-    algorithm.setInputSurfaceTriangles(nighresjava.JArray('int')(
-                            (orig_mesh['faces'].flatten('C')).astype(int).tolist()))
+    algorithm.setInputSurfacePoints(_to_java(orig_mesh['points'], 'float', order='C'))
+    algorithm.setInputSurfaceTriangles(_to_java(orig_mesh['faces'], 'int', order='C'))
 
     algorithm.setSurfaceConvention("voxels")
 
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -120,6 +122,7 @@ def profile_meshing(profile_surface_image, starting_surface_mesh,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
     npt = int(orig_mesh['points'].shape[0])
@@ -128,10 +131,8 @@ def profile_meshing(profile_surface_image, starting_surface_mesh,
     meshes = []
     lines = np.zeros((nlayers,npt,3))
     for n in range(nlayers):
-        points = np.reshape(np.array(algorithm.getSampledSurfacePoints(n),
-                               dtype=np.float32), (npt,3), 'C')
-        faces = np.reshape(np.array(algorithm.getSampledSurfaceTriangles(n),
-                               dtype=np.int32), (nfc,3), 'C')
+        points = _from_java(algorithm.getSampledSurfacePoints(n), (npt,3), order='C')
+        faces = _from_java(algorithm.getSampledSurfaceTriangles(n), (nfc,3), np.int32, order='C')
         # create the mesh dictionary
         meshes.append({"points": points, "faces": faces})
 
@@ -4,9 +4,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
-from ..utils import _output_dir_4saving, _fname_4saving, _check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving, \
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def profile_sampling(profile_surface_image, intensity_image,
                      save_data=False, overwrite=False, output_dir=None,
                      file_name=None):
@@ -55,42 +61,38 @@ def profile_sampling(profile_surface_image, intensity_image,
                                       rootfile=intensity_image,
                                       suffix='lps-data'))
         if overwrite is False \
-            and os.path.isfile(profile_file) :
+            and _is_cached(profile_file) :
 
             print("skip computation (use existing results)")
             output = {'result': profile_file}
             return output
 
     # start VM if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initate class
     sampler = nighresjava.LaminarProfileSampling()
 
     # load the data
     surface_img = load_volume(profile_surface_image)
-    surface_data = surface_img.get_data()
+    surface_data = _volume_data(surface_img, 'float')
     hdr = surface_img.header
     aff = surface_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = surface_data.shape
 
-    intensity_data = load_volume(intensity_image).get_data()
+    intensity_data = _volume_data(load_volume(intensity_image), 'float')
 
     # pass inputs
-    sampler.setIntensityImage(nighresjava.JArray('float')(
-                                  (intensity_data.flatten('F')).astype(float)))
-    sampler.setProfileSurfaceImage(nighresjava.JArray('float')(
-                                   (surface_data.flatten('F')).astype(float)))
+    sampler.setIntensityImage(_to_java(intensity_data, 'float'))
+    sampler.setProfileSurfaceImage(_to_java(surface_data, 'float'))
     sampler.setResolutions(resolution[0], resolution[1], resolution[2])
     sampler.setDimensions(dimensions[0], dimensions[1],
                           dimensions[2], dimensions[3])
 
     # execute class
+    phase('execute')
     try:
         sampler.execute()
 
@@ -100,11 +102,10 @@ def profile_sampling(profile_surface_image, intensity_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collecting outputs
-    profile_data = np.reshape(np.array(
-                                sampler.getProfileMappedIntensityImage(),
-                                dtype=np.float32), dimensions, 'F')
+    profile_data = _from_java(sampler.getProfileMappedIntensityImage(), dimensions)
 
     hdr['cal_max'] = np.nanmax(profile_data)
     profiles = nb.Nifti1Image(profile_data, aff, hdr)
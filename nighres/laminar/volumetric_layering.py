@@ -4,10 +4,16 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def volumetric_layering(inner_levelset, outer_levelset,
                         n_layers=4, topology_lut_dir=None,
                         method="volume-preserving", layer_dir="outward",
@@ -95,9 +101,9 @@ def volumetric_layering(inner_levelset, outer_levelset,
                                        rootfile=inner_levelset,
                                        suffix='layering-boundaries'))
         if overwrite is False \
-            and os.path.isfile(depth_file) \
-            and os.path.isfile(layer_file) \
-            and os.path.isfile(boundary_file) :
+            and _is_cached(depth_file) \
+            and _is_cached(layer_file) \
+            and _is_cached(boundary_file) :
 
             print("skip computation (use existing results)")
             output = {'depth': depth_file,
@@ -106,32 +112,27 @@ def volumetric_layering(inner_levelset, outer_levelset,
             return output
 
     # start virutal machine if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initate class
     lamination = nighresjava.LaminarVolumetricLayering()
 
     # load the data
     inner_img = load_volume(inner_levelset)
-    inner_data = inner_img.get_data()
+    inner_data = _volume_data(inner_img, 'float')
     hdr = inner_img.header
     aff = inner_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = inner_data.shape
 
-    outer_data = load_volume(outer_levelset).get_data()
+    outer_data = _volume_data(load_volume(outer_levelset), 'float')
 
     # set parameters from input images
     lamination.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     lamination.setResolutions(resolution[0], resolution[1], resolution[2])
-    lamination.setInnerDistanceImage(nighresjava.JArray('float')(
-                                    (inner_data.flatten('F')).astype(float)))
-    lamination.setOuterDistanceImage(nighresjava.JArray('float')(
-                                    (outer_data.flatten('F')).astype(float)))
+    lamination.setInnerDistanceImage(_to_java(inner_data, 'float'))
+    lamination.setOuterDistanceImage(_to_java(outer_data, 'float'))
     lamination.setNumberOfLayers(n_layers)
     lamination.setTopologyLUTdirectory(topology_lut_dir)
 
@@ -141,6 +142,7 @@ def volumetric_layering(inner_levelset, outer_levelset,
     lamination.setCurvatureApproximationScale(curv_scale)
 
     # execute class
+    phase('execute')
     try:
         lamination.execute()
 
@@ -150,23 +152,19 @@ def volumetric_layering(inner_levelset, outer_levelset,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect data
-    depth_data = np.reshape(np.array(lamination.getContinuousDepthMeasurement(),
-                                    dtype=np.float32), dimensions, 'F')
+    depth_data = _from_java(lamination.getContinuousDepthMeasurement(), dimensions)
     hdr['cal_max'] = np.nanmax(depth_data)
     depth = nb.Nifti1Image(depth_data, aff, hdr)
 
-    layer_data = np.reshape(np.array(lamination.getDiscreteSampledLayers(),
-                                     dtype=np.int32), dimensions, 'F')
+    layer_data = _from_java(lamination.getDiscreteSampledLayers(), dimensions, np.int32)
     hdr['cal_max'] = np.nanmax(layer_data)
     layers = nb.Nifti1Image(layer_data, aff, hdr)
 
     boundary_len = lamination.getLayerBoundarySurfacesLength()
-    boundary_data = np.reshape(np.array(lamination.getLayerBoundarySurfaces(),
-                               dtype=np.float32), (dimensions[0],
-                               dimensions[1], dimensions[2], boundary_len),
-                               'F')
+    boundary_data = _from_java(lamination.getLayerBoundarySurfaces(), (dimensions[0], dimensions[1], dimensions[2], boundary_len))
     hdr['cal_min'] = np.nanmin(boundary_data)
     hdr['cal_max'] = np.nanmax(boundary_data)
     boundaries = nb.Nifti1Image(boundary_data, aff, hdr)
@@ -1,2 +1,6 @@
-from nighres.microscopy.mgdm_cells import mgdm_cells
-from nighres.microscopy.stack_intensity_regularisation import stack_intensity_regularisation
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'mgdm_cells': '.mgdm_cells',
+    'stack_intensity_regularisation': '.stack_intensity_regularisation'})
@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def mgdm_cells(contrast_image1, contrast_type1,
                       contrast_image2=None, contrast_type2=None,
                       contrast_image3=None, contrast_type3=None,
@@ -129,8 +135,8 @@ def mgdm_cells(contrast_image1, contrast_type1,
                                    rootfile=contrast_image1,
                                    suffix='mgdmc-dist'))
         if overwrite is False \
-            and os.path.isfile(seg_file) \
-            and os.path.isfile(dist_file) :
+            and _is_cached(seg_file) \
+            and _is_cached(dist_file) :
 
             print("skip computation (use existing results)")
             output = {'segmentation': seg_file,
@@ -139,11 +145,8 @@ def mgdm_cells(contrast_image1, contrast_type1,
 
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create mgdm instance
     mgdm = nighresjava.SegmentationCellMgdm()
 
@@ -160,7 +163,7 @@ def mgdm_cells(contrast_image1, contrast_type1,
 
     # load contrast image 1 and use it to set dimensions and resolution
     img = load_volume(contrast_image1)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -170,24 +173,22 @@ def mgdm_cells(contrast_image1, contrast_type1,
     mgdm.setResolutions(resolution[0], resolution[1], resolution[2])
 
     # input image 1
-    mgdm.setContrastImage1(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+    mgdm.setContrastImage1(_to_java(data, 'float'))
     mgdm.setContrastType1(contrast_type1)
 
     # if further contrast are specified, input them
     if contrast_image2 is not None:
-        data = load_volume(contrast_image2).get_data()
-        mgdm.setContrastImage2(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(contrast_image2), 'float')
+        mgdm.setContrastImage2(_to_java(data, 'float'))
         mgdm.setContrastType2(contrast_type2)
 
         if contrast_image3 is not None:
-            data = load_volume(contrast_image3).get_data()
-            mgdm.setContrastImage3(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(contrast_image3), 'float')
+            mgdm.setContrastImage3(_to_java(data, 'float'))
             mgdm.setContrastType3(contrast_type3)
 
     # execute MGDM
+    phase('execute')
     try:
         mgdm.execute()
 
@@ -197,13 +198,12 @@ def mgdm_cells(contrast_image1, contrast_type1,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    seg_data = np.reshape(np.array(mgdm.getSegmentedImage(),
-                                   dtype=np.int32), dimensions, 'F')
+    seg_data = _from_java(mgdm.getSegmentedImage(), dimensions, np.int32)
 
-    dist_data = np.reshape(np.array(mgdm.getLevelsetBoundaryImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    dist_data = _from_java(mgdm.getLevelsetBoundaryImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def stack_intensity_regularisation(image, ratio=50,
                             save_data=False, overwrite=False, output_dir=None,
                             file_name=None):
@@ -57,17 +63,14 @@ def stack_intensity_regularisation(image, ratio=50,
                                    suffix='sir-img'))
 
         if overwrite is False \
-            and os.path.isfile(regularised_file) :
+            and _is_cached(regularised_file) :
                 print("skip computation (use existing results)")
                 output = {'result': regularised_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     sir = nighresjava.StackIntensityRegularisation()
 
@@ -75,7 +78,7 @@ def stack_intensity_regularisation(image, ratio=50,
     
     # load image and use it to set dimensions and resolution
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -83,13 +86,13 @@ def stack_intensity_regularisation(image, ratio=50,
 
     sir.setDimensions(dimensions[0], dimensions[1], dimensions[2])
        
-    sir.setInputImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    sir.setInputImage(_to_java(data, 'float'))
     
     # set algorithm parameters
     sir.setVariationRatio(float(ratio))
     
     # execute the algorithm
+    phase('execute')
     try:
         sir.execute()
 
@@ -99,10 +102,10 @@ def stack_intensity_regularisation(image, ratio=50,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    regularised_data = np.reshape(np.array(sir.getRegularisedImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    regularised_data = _from_java(sir.getRegularisedImage(), dimensions)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
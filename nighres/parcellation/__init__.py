@@ -1,2 +1,6 @@
-from nighres.parcellation.massp import massp
-from nighres.parcellation.massp import massp_atlasing
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'massp': '.massp',
+    'massp_atlasing': '.massp'})
@@ -4,8 +4,12 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 from nighres.global_settings import DEFAULT_MASSP_ATLAS, DEFAULT_MASSP_HIST, \
                     DEFAULT_MASSP_SPATIAL_PROBA, DEFAULT_MASSP_SPATIAL_LABEL, \
                     DEFAULT_MASSP_SKEL_PROBA, DEFAULT_MASSP_SKEL_LABEL
@@ -22,6 +26,8 @@ def massp_17structures_label(name):
     return labels_17structures.index(name)
  
  
+@profiled
+@cached
 def massp(target_images, structures=31,
                       shape_atlas_probas=None, shape_atlas_labels=None, 
                       intensity_atlas_hist=None,
@@ -100,8 +106,8 @@ def massp(target_images, structures=31,
                                    suffix='massp-label'))
 
         if overwrite is False \
-            and os.path.isfile(proba_file) \
-            and os.path.isfile(label_file):
+            and _is_cached(proba_file) \
+            and _is_cached(label_file):
             
             print("skip computation (use existing results)")
             output = {'max_proba': proba_file, 
@@ -111,11 +117,8 @@ def massp(target_images, structures=31,
     contrasts = len(target_images)
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     massp = nighresjava.ConditionalShapeSegmentation()
 
@@ -127,7 +130,7 @@ def massp(target_images, structures=31,
     # load target image for parameters
     print("load: "+str(target_images[0]))
     img = load_volume(target_images[0])
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     trg_affine = img.get_affine()
     trg_header = img.get_header()
     trg_resolution = [x.item() for x in trg_header.get_zooms()]
@@ -137,15 +140,13 @@ def massp(target_images, structures=31,
     massp.setTargetResolutions(trg_resolution[0], trg_resolution[1], trg_resolution[2])
 
     # target image 1
-    massp.setTargetImageAt(0, nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+    massp.setTargetImageAt(0, _to_java(data, 'float'))
     
     # if further contrast are specified, input them
     for contrast in range(1,contrasts):    
         print("load: "+str(target_images[contrast]))
-        data = load_volume(target_images[contrast]).get_data()
-        massp.setTargetImageAt(contrast, nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(target_images[contrast]), 'float')
+        massp.setTargetImageAt(contrast, _to_java(data, 'float'))
 
     # if not specified, check if standard atlases are available or download them
     if ( (intensity_atlas_hist is None) or (shape_atlas_probas is None) or (shape_atlas_labels is None)
@@ -163,15 +164,14 @@ def massp(target_images, structures=31,
 
     # load the shape and intensity atlases
     print("load: "+str(intensity_atlas_hist))
-    hist = load_volume(intensity_atlas_hist).get_data()
-    massp.setConditionalHistogram(nighresjava.JArray('float')(
-                                        (hist.flatten('F')).astype(float)))
+    hist = _volume_data(load_volume(intensity_atlas_hist), 'float')
+    massp.setConditionalHistogram(_to_java(hist, 'float'))
 
     print("load: "+str(shape_atlas_probas))
     
     # load a first image for dim, res
     img = load_volume(shape_atlas_probas)
-    pdata = img.get_data()
+    pdata = _volume_data(img, 'float')
     header = img.get_header()
     affine = img.get_affine()
     resolution = [x.item() for x in header.get_zooms()]
@@ -181,32 +181,28 @@ def massp(target_images, structures=31,
     massp.setAtlasResolutions(resolution[0], resolution[1], resolution[2])
 
     print("load: "+str(shape_atlas_labels))
-    ldata = load_volume(shape_atlas_labels).get_data()
+    ldata = _volume_data(load_volume(shape_atlas_labels), 'int')
     
     if map_to_target is not None:
         print("map atlas to subject")
         print("load: "+str(map_to_target))
-        mdata =  load_volume(map_to_target).get_data()
-        massp.setMappingToTarget(nighresjava.JArray('float')(
-                                            (mdata.flatten('F')).astype(float)))
+        mdata = _volume_data(load_volume(map_to_target), 'float')
+        massp.setMappingToTarget(_to_java(mdata, 'float'))
         
-    massp.setShapeAtlasProbasAndLabels(nighresjava.JArray('float')(
-                                (pdata.flatten('F')).astype(float)),
-                                nighresjava.JArray('int')(
-                                (ldata.flatten('F')).astype(int).tolist()))
+    massp.setShapeAtlasProbasAndLabels(_to_java(pdata, 'float'),
+                                _to_java(ldata, 'int'))
 
     print("load: "+str(skeleton_atlas_probas))
-    pdata = load_volume(skeleton_atlas_probas).get_data()
+    pdata = _volume_data(load_volume(skeleton_atlas_probas), 'float')
     
     print("load: "+str(skeleton_atlas_labels))
-    ldata = load_volume(skeleton_atlas_labels).get_data()
+    ldata = _volume_data(load_volume(skeleton_atlas_labels), 'int')
 
-    massp.setSkeletonAtlasProbasAndLabels(nighresjava.JArray('float')(
-                                (pdata.flatten('F')).astype(float)),
-                                nighresjava.JArray('int')(
-                                (ldata.flatten('F')).astype(int).tolist()))
+    massp.setSkeletonAtlasProbasAndLabels(_to_java(pdata, 'float'),
+                                _to_java(ldata, 'int'))
 
     # execute
+    phase('execute')
     try:
         massp.estimateTarget()
         massp.fastSimilarityDiffusion(4)
@@ -222,15 +218,14 @@ def massp(target_images, structures=31,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
     dims3Dtrg = (trg_dimensions[0],trg_dimensions[1],trg_dimensions[2])
 
-    proba_data = np.reshape(np.array(massp.getFinalProba(),
-                                    dtype=np.float32), dims3Dtrg, 'F')
+    proba_data = _from_java(massp.getFinalProba(), dims3Dtrg)
 
-    label_data = np.reshape(np.array(massp.getFinalLabel(),
-                                    dtype=np.int32), dims3Dtrg, 'F')
+    label_data = _from_java(massp.getFinalLabel(), dims3Dtrg, np.int32)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -251,6 +246,8 @@ def massp(target_images, structures=31,
         return output
 
 
+@profiled
+@cached
 def massp_atlasing(subjects, structures, contrasts, 
                       levelset_images=None, skeleton_images=None, 
                       contrast_images=None, 
@@ -334,11 +331,11 @@ def massp_atlasing(subjects, structures, contrasts,
 
         
         if overwrite is False \
-            and os.path.isfile(spatial_proba_file) \
-            and os.path.isfile(spatial_label_file) \
-            and os.path.isfile(condhist_file) \
-            and os.path.isfile(skeleton_proba_file) \
-            and os.path.isfile(skeleton_label_file):
+            and _is_cached(spatial_proba_file) \
+            and _is_cached(spatial_label_file) \
+            and _is_cached(condhist_file) \
+            and _is_cached(skeleton_proba_file) \
+            and _is_cached(skeleton_label_file):
             
             print("skip computation (use existing results)")
             output = {'max_spatial_proba': spatial_proba_file, 
@@ -351,11 +348,8 @@ def massp_atlasing(subjects, structures, contrasts,
 
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     massp = nighresjava.ConditionalShapeSegmentation()
 
@@ -366,11 +360,10 @@ def massp_atlasing(subjects, structures, contrasts,
     # load target image for parameters
     # load a first image for dim, res
     img = load_volume(contrast_images[0][0])
-    data = img.get_data()
     header = img.get_header()
     affine = img.get_affine()
     trg_resolution = [x.item() for x in header.get_zooms()]
-    trg_dimensions = data.shape
+    trg_dimensions = img.shape
     
     massp.setTargetDimensions(trg_dimensions[0], trg_dimensions[1], trg_dimensions[2])
     massp.setTargetResolutions(trg_resolution[0], trg_resolution[1], trg_resolution[2])
@@ -385,16 +378,15 @@ def massp_atlasing(subjects, structures, contrasts,
     for sub in range(subjects):
         for struct in range(structures):
             print("load: "+str(levelset_images[sub][struct]))
-            data = load_volume(levelset_images[sub][struct]).get_data()
-            massp.setLevelsetImageAt(sub, struct, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(levelset_images[sub][struct]), 'float')
+            massp.setLevelsetImageAt(sub, struct, _to_java(data, 'float'))
         for contrast in range(contrasts):
             print("load: "+str(contrast_images[sub][contrast]))
-            data = load_volume(contrast_images[sub][contrast]).get_data()
-            massp.setContrastImageAt(sub, contrast, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(contrast_images[sub][contrast]), 'float')
+            massp.setContrastImageAt(sub, contrast, _to_java(data, 'float'))
     # execute first step
     scale = 1.0
+    phase('execute')
     try:
         scale = massp.computeAtlasPriors()
  
@@ -404,6 +396,7 @@ def massp_atlasing(subjects, structures, contrasts,
         print(sys.exc_info()[0])
         raise
         return
+    phase('to_java')
 
     # clean up and go to second step
     levelset_images = None
@@ -412,10 +405,10 @@ def massp_atlasing(subjects, structures, contrasts,
     for sub in range(subjects):
         for struct in range(structures):
             print("load: "+str(skeleton_images[sub][struct]))
-            data = load_volume(skeleton_images[sub][struct]).get_data()
-            massp.setSkeletonImageAt(sub, struct, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(skeleton_images[sub][struct]), 'float')
+            massp.setSkeletonImageAt(sub, struct, _to_java(data, 'float'))
                 
+    phase('execute')
     try:
         massp.computeSkeletonPriors(scale)
  
@@ -425,6 +418,7 @@ def massp_atlasing(subjects, structures, contrasts,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     skeleton_images = None
 
@@ -436,20 +430,15 @@ def massp_atlasing(subjects, structures, contrasts,
     intens_dims = (structures+1,structures+1,contrasts)
     intens_hist_dims = ((structures+1)*(structures+1),massp.getNumberOfBins()+6,contrasts)
 
-    spatial_proba_data = np.reshape(np.array(massp.getBestSpatialProbabilityMaps(dimensions[3]),
-                                   dtype=np.float32), dimensions, 'F')
+    spatial_proba_data = _from_java(massp.getBestSpatialProbabilityMaps(dimensions[3]), dimensions)
 
-    spatial_label_data = np.reshape(np.array(massp.getBestSpatialProbabilityLabels(dimensions[3]),
-                                    dtype=np.int32), dimensions, 'F')    
+    spatial_label_data = _from_java(massp.getBestSpatialProbabilityLabels(dimensions[3]), dimensions, np.int32)    
 
-    intens_hist_data = np.reshape(np.array(massp.getConditionalHistogram(),
-                                       dtype=np.float32), intens_hist_dims, 'F')
+    intens_hist_data = _from_java(massp.getConditionalHistogram(), intens_hist_dims)
 
-    skeleton_proba_data = np.reshape(np.array(massp.getBestSkeletonProbabilityMaps(dimskel[3]),
-                                   dtype=np.float32), dimskel, 'F')
+    skeleton_proba_data = _from_java(massp.getBestSkeletonProbabilityMaps(dimskel[3]), dimskel)
 
-    skeleton_label_data = np.reshape(np.array(massp.getBestSkeletonProbabilityLabels(dimskel[3]),
-                                    dtype=np.int32), dimskel, 'F')    
+    skeleton_label_data = _from_java(massp.getBestSkeletonProbabilityLabels(dimskel[3]), dimskel, np.int32)    
 
 
     # adapt header max for each image so that correct max is displayed
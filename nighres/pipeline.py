@@ -0,0 +1,266 @@
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from nighres.io import load_volume, load_mesh
+from nighres.io.io_timelog import time_log
+
+# extensions of the volume and mesh files saved by nighres functions
+_VOLUME_EXTENSIONS = ('.nii', '.nii.gz', '.mgz', '.mnc')
+_MESH_EXTENSIONS = ('.vtk', '.gii', '.obj', '.ply')
+
+
+class _Output(object):
+    # Reference to one output of a node, resolved when the node has run
+
+    def __init__(self, node, key):
+        self.node = node
+        self.key = key
+
+    def __repr__(self):
+        return '{0}[{1!r}]'.format(self.node.name, self.key)
+
+
+class Node(object):
+    """
+    Step of a :class:`Pipeline`, as returned by :meth:`Pipeline.add`
+
+    Indexing a node with the name of one of its outputs (e.g.
+    ``cruise['gwb']``) gives a reference to pass as input to later nodes;
+    the node itself stands for its whole output dictionary.
+    """
+
+    def __init__(self, name, func, kwargs, save):
+        self.name = name
+        self.func = func
+        self.kwargs = kwargs
+        self.save = save
+        self.inputs = _dependencies(kwargs)
+
+    def __getitem__(self, key):
+        return _Output(self, key)
+
+    def __repr__(self):
+        return 'Node({0}, {1})'.format(self.name, self.func.__name__)
+
+
+def _dependencies(value):
+    # Nodes referenced by an argument value, also within lists and dicts
+    if isinstance(value, _Output):
+        return [value.node]
+    if isinstance(value, Node):
+        return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        nodes = []
+        for item in value:
+            for node in _dependencies(item):
+                if node not in nodes:
+                    nodes.append(node)
+        return nodes
+    return []
+
+
+def _resolve(value, results):
+    # Replace the node references of an argument value by the outputs
+    if isinstance(value, _Output):
+        return results[value.node.name][value.key]
+    if isinstance(value, Node):
+        return results[value.name]
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_resolve(item, results) for item in value)
+    return value
+
+
+def _in_memory(value):
+    # Output of a node with save=True, where saved images and meshes are
+    # given as file names, with these loaded back as images and meshes (other
+    # files, e.g. tables, stay file names)
+    if isinstance(value, dict):
+        return {key: _in_memory(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_in_memory(item) for item in value]
+    if isinstance(value, str):
+        # load_volume waits for the volume if it is saved in the background
+        if value.endswith(_VOLUME_EXTENSIONS):
+            return load_volume(value)
+        if value.endswith(_MESH_EXTENSIONS):
+            return load_mesh(value)
+    return value
+
+
+class Pipeline(object):
+    """
+    Chain nighres functions, passing outputs to inputs in memory
+
+    Each function of the pipeline is added as a node with :meth:`add`, its
+    inputs can be outputs of earlier nodes. When the pipeline runs, the
+    outputs are passed on as in-memory images and meshes rather than through
+    files: only the outputs of nodes added with save=True are written to
+    disk, as a side effect, and these nodes still pass on and return images
+    and meshes. Nodes whose inputs are ready run concurrently in threads sharing
+    the JVM (see :ref:`jvm`), and the time spent in each node is recorded.
+
+    Parameters
+    ----------
+    output_dir: str, optional
+        Directory of the saved outputs, for nodes that do not set their
+        own output_dir (default is the current working directory)
+    workers: int, optional
+        Maximum number of nodes running at the same time (default is the
+        number of cores)
+    log_file: str, optional
+        Time log recording a 'node' event for each node run (default is
+        None, timings are only available from :meth:`timings`)
+
+    Examples
+    ----------
+    >>> pipeline = nighres.pipeline.Pipeline(output_dir='out')
+    >>> cortex = pipeline.add('cortex', nighres.brain.extract_brain_region,
+    ...                       segmentation=seg, levelset_boundary=dist,
+    ...                       maximum_membership=mems, maximum_label=lbls,
+    ...                       extracted_region='left_cerebrum')
+    >>> cruise = pipeline.add('cruise',
+    ...                       nighres.cortex.cruise_cortex_extraction,
+    ...                       save=True, init_image=cortex['inside_mask'],
+    ...                       wm_image=cortex['inside_proba'],
+    ...                       gm_image=cortex['region_proba'],
+    ...                       csf_image=cortex['background_proba'])
+    >>> results = pipeline.run()  # doctest: +SKIP
+    """
+
+    def __init__(self, output_dir=None, workers=None, log_file=None):
+        self.output_dir = output_dir if output_dir else os.getcwd()
+        self.workers = workers or os.cpu_count() or 1
+        self.log_file = log_file
+        self.nodes = []
+        self._timings = {}
+        self._makespan = None
+
+    def add(self, name, func, save=False, **kwargs):
+        """
+        Add a node calling a nighres function
+
+        Parameters
+        ----------
+        name: str
+            Unique name of the node
+        func: function
+            Function to call, e.g. nighres.cortex.cruise_cortex_extraction
+        save: bool, optional
+            Save the outputs of the node to disk (default is False). The
+            save_data argument of func is set accordingly, and output_dir
+            defaults to that of the pipeline. The saved outputs are still
+            passed on, and returned, as images and meshes
+        **kwargs
+            Arguments of func, where outputs of earlier nodes are given as
+            ``node['output']`` (or ``node`` for the whole output dictionary)
+
+        Returns
+        ----------
+        Node
+            The new node
+        """
+        if any(node.name == name for node in self.nodes):
+            raise ValueError("A node named {0} is already in the "
+                             "pipeline".format(name))
+        if not callable(func):
+            raise ValueError("func must be a function, got {0}".format(func))
+        node = Node(name, func, dict(kwargs), save)
+        for dependency in node.inputs:
+            if dependency not in self.nodes:
+                raise ValueError("Node {0} uses the outputs of {1}, which is "
+                                 "not part of this pipeline".format(
+                                     name, dependency.name))
+
+        params = inspect.signature(func).parameters
+        if 'save_data' in params:
+            node.kwargs['save_data'] = save
+            if save and 'output_dir' in params \
+                    and node.kwargs.get('output_dir') is None:
+                node.kwargs['output_dir'] = self.output_dir
+        elif save:
+            raise ValueError("{0} cannot save its outputs, it has no "
+                             "save_data argument".format(func.__name__))
+        self.nodes.append(node)
+        return node
+
+    def run(self):
+        """
+        Run all nodes of the pipeline, each as soon as its inputs are ready
+
+        Returns
+        ----------
+        dict
+            Outputs of each node, by node name
+
+        Notes
+        ----------
+        If a node fails, no further nodes are started and its error is
+        raised once the running nodes have finished.
+        """
+        results = {}
+        self._timings = {}
+        pending = list(self.nodes)
+        running = {}
+        error = None
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or running:
+                if error is None:
+                    for node in [node for node in pending
+                                 if all(dependency.name in results
+                                        for dependency in node.inputs)]:
+                        pending.remove(node)
+                        kwargs = _resolve(node.kwargs, results)
+                        running[pool.submit(self._run_node, node,
+                                            kwargs)] = node
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        results[node.name] = future.result()
+                    except Exception as exc:
+                        if error is None:
+                            error = exc
+        self._makespan = time.time() - start
+        if error is not None:
+            raise error
+        return results
+
+    def _run_node(self, node, kwargs):
+        print("\nPipeline: running {0}".format(node.name))
+        start = time.time()
+        try:
+            result = node.func(**kwargs)
+            if node.save:
+                # functions saving their outputs return the file names
+                result = _in_memory(result)
+            return result
+        finally:
+            end = time.time()
+            self._timings[node.name] = {
+                'start': start, 'end': end, 'duration': end - start,
+                'thread': threading.current_thread().name}
+            time_log(self.log_file, node.name, 'node', None, start, end)
+
+    def timings(self):
+        """
+        Time spent in each node during the last :meth:`run`
+
+        Returns
+        ----------
+        dict
+            Timings with the following entries:
+
+            * nodes (dict): For each node name, the start, end and duration
+              (in s) of the node and the thread it ran in
+            * makespan (float): Duration of the whole run (in s)
+        """
+        return {'nodes': dict(self._timings), 'makespan': self._makespan}
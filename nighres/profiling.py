@@ -0,0 +1,254 @@
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import psutil
+from nighres import global_settings
+from nighres.io.io_timelog import time_log, flush_time_log
+from nighres.jvm import _jvm_heap
+
+try:
+    import resource
+except ImportError:
+    # no peak RSS on Windows
+    resource = None
+
+# stack of the profiled calls running in each thread
+_local = threading.local()
+
+
+class _Profile(object):
+    # Phase timings of one profiled call. Loading and saving data, and nested
+    # profiled calls, are accounted in their own phases ('load', 'save' and
+    # 'subtasks') and excluded from the phase during which they happen.
+
+    def __init__(self, task_name, log_file, memory=False):
+        self.task_name = task_name
+        self.log_file = log_file
+        self.start = time.time()
+        self.phase = 'python'
+        self.phase_start = self.start
+        self.excluded = 0.0
+        self.io_depth = 0
+        # phase name -> [first start, last end, exclusive duration]
+        self.phases = {}
+        # phase name -> peak memory use sampled at the phase boundaries
+        self.memory = None
+        if memory:
+            self.memory = {}
+            self.sample(self.phase)
+
+    def add(self, name, start, end, duration):
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [start, end, duration]
+        else:
+            entry[1] = end
+            entry[2] += duration
+
+    def sample(self, *names):
+        # Record a memory sample as the end of (or start of) the given phases
+        if self.memory is None:
+            return
+        sample = _memory_sample()
+        for name in names:
+            peaks = self.memory.setdefault(name, {})
+            for key, value in sample.items():
+                peaks[key] = max(peaks.get(key, 0), value)
+
+    def switch(self, name, now):
+        self.add(self.phase, self.phase_start, now,
+                 now - self.phase_start - self.excluded)
+        self.sample(self.phase, name)
+        self.phase = name
+        self.phase_start = now
+        self.excluded = 0.0
+
+    def exclude(self, name, start, end):
+        self.add(name, start, end, end - start)
+        self.sample(name, self.phase)
+        self.excluded += end - start
+
+    def log(self, end):
+        self.switch(None, end)
+        memory = self.memory or {}
+        for name, (start, last, duration) in self.phases.items():
+            time_log(self.log_file, self.task_name, 'phase_'+name, None,
+                     start, last, duration=duration, memory=memory.get(name))
+        total = None
+        if self.memory is not None:
+            total = {}
+            for peaks in self.memory.values():
+                for key, value in peaks.items():
+                    total[key] = max(total.get(key, 0), value)
+        time_log(self.log_file, self.task_name, 'phase_total', None,
+                 self.start, end, memory=total)
+
+
+def _memory_sample():
+    # Current memory use of the process in bytes: resident set size (which
+    # includes the in-process JVM), its high-water mark and the JVM heap
+    sample = {'rss': psutil.Process(os.getpid()).memory_info().rss}
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        sample['rss_peak'] = peak if sys.platform == 'darwin' else peak*1024
+    heap = _jvm_heap()
+    if heap is not None:
+        sample['jvm_used'], sample['jvm_committed'], sample['jvm_max'] = heap
+    return sample
+
+
+def _current():
+    # Innermost profiled call of this thread, or None
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+def profiled(func):
+    """
+    Decorator recording the phases of a nighres function in the time log
+    when global_settings.PROFILING is set
+
+    Each call starts in the 'python' phase (checks, JVM start and any
+    computation done in Python), the function switches phases with
+    :func:`phase`. Time spent in :func:`nighres.io.load_volume`,
+    :func:`nighres.io.save_volume` and the mesh I/O functions is accounted in
+    the 'load' and 'save' phases, wherever it happens. When the call returns,
+    one 'phase_<name>' event per phase and a 'phase_total' event are logged
+    to the log_file of the function (or to global_settings.PROFILING_LOG for
+    functions without one). The duration of a phase event is the time spent
+    in that phase, its start and end are those of the first and last time
+    the phase was entered and left.
+
+    With global_settings.PROFILING_MEMORY, the memory use of the process is
+    also sampled at every phase boundary and the peaks of each phase are
+    added to its event as 'memory': resident set size ('rss') and its
+    high-water mark since the process started ('rss_peak'), and the used,
+    committed and maximum JVM heap ('jvm_used', 'jvm_committed',
+    'jvm_max'), all in bytes. The JVM runs inside the Python process, so
+    its committed heap is part of the resident set size.
+    """
+    params = list(inspect.signature(func).parameters.values())
+    names = [param.name for param in params]
+    if 'log_file' in names:
+        log_position = names.index('log_file')
+        log_default = params[log_position].default
+    else:
+        log_position = None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not global_settings.PROFILING:
+            return func(*args, **kwargs)
+
+        if log_position is None:
+            log_file = global_settings.PROFILING_LOG
+        elif len(args) > log_position:
+            log_file = args[log_position]
+        else:
+            log_file = kwargs.get('log_file', log_default)
+
+        stack = _local.__dict__.setdefault('stack', [])
+        profile = _Profile(func.__name__, log_file,
+                           memory=global_settings.PROFILING_MEMORY)
+        stack.append(profile)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = time.time()
+            stack.pop()
+            profile.log(end)
+            if stack:
+                stack[-1].exclude('subtasks', profile.start, end)
+
+    return wrapper
+
+
+def phase(name):
+    """
+    Switch the running profiled function to a new phase
+
+    Used by the nighres modules to mark their 'to_java' (input conversion),
+    'execute' (Java computation) and 'from_java' (output retrieval) phases.
+    Does nothing outside of a profiled call.
+
+    Parameters
+    ----------
+    name: str
+        Name of the phase
+    """
+    profile = _current()
+    if profile is not None:
+        profile.switch(name, time.time())
+
+
+def _task_log(log_file):
+    # Time log for the file events of the I/O functions: those logging to
+    # the default timelog.json within a profiled call go to its log instead
+    profile = _current()
+    if profile is not None and log_file == 'timelog.json':
+        return profile.log_file
+    return log_file
+
+
+def _record_io(name, start, end):
+    # Account a load or save (timed by the I/O functions) to the running
+    # profiled call, if any
+    profile = _current()
+    if profile is not None and profile.io_depth == 0:
+        profile.exclude(name, start, end)
+
+
+def _io_phase(name):
+    # Decorator accounting the time of an I/O function to the 'load' or
+    # 'save' phase, ignoring nested I/O calls
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current()
+            if profile is None:
+                return func(*args, **kwargs)
+            start = time.time()
+            profile.io_depth += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.io_depth -= 1
+                _record_io(name, start, time.time())
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiling(log_file=None):
+    """
+    Context manager that profiles all nighres functions called within its
+    block and writes the time log when leaving it
+
+    Parameters
+    ----------
+    log_file: str, optional
+        Time log of the functions that do not take a log_file argument
+        (default is global_settings.PROFILING_LOG)
+
+    Examples
+    ----------
+    >>> with nighres.profiling.profiling():  # doctest: +SKIP
+    ...     nighres.brain.mp2rage_skullstripping(...)
+    >>> nighres.io.load_time_log('timelog.json')  # doctest: +SKIP
+    """
+    previous = (global_settings.PROFILING, global_settings.PROFILING_LOG)
+    global_settings.PROFILING = True
+    if log_file is not None:
+        global_settings.PROFILING_LOG = log_file
+    try:
+        yield
+    finally:
+        global_settings.PROFILING, global_settings.PROFILING_LOG = previous
+        flush_time_log()
@@ -1,8 +1,12 @@
-from nighres.registration.apply_coordinate_mappings import apply_coordinate_mappings
-from nighres.registration.apply_coordinate_mappings import apply_coordinate_mappings_2d
-from nighres.registration.embedded_antsreg import embedded_antsreg
-from nighres.registration.embedded_antsreg import embedded_antsreg_2d
-from nighres.registration.embedded_antsreg import embedded_antsreg_multi
-from nighres.registration.embedded_antsreg import embedded_antsreg_2d_multi
-from nighres.registration.generate_coordinate_mapping import generate_coordinate_mapping
-from nighres.registration.simple_align import simple_align
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'apply_coordinate_mappings': '.apply_coordinate_mappings',
+    'apply_coordinate_mappings_2d': '.apply_coordinate_mappings',
+    'embedded_antsreg': '.embedded_antsreg',
+    'embedded_antsreg_2d': '.embedded_antsreg',
+    'embedded_antsreg_multi': '.embedded_antsreg',
+    'embedded_antsreg_2d_multi': '.embedded_antsreg',
+    'generate_coordinate_mapping': '.generate_coordinate_mapping',
+    'simple_align': '.simple_align'})
@@ -4,10 +4,16 @@ import nibabel as nb
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def apply_coordinate_mappings(image, mapping1,
                         mapping2=None, mapping3=None, mapping4=None,
                         interpolation="nearest", padding="closest",
@@ -68,25 +74,22 @@ def apply_coordinate_mappings(image, mapping1,
                                     rootfile=image,
                                     suffix='def-img'))
         if overwrite is False \
-            and os.path.isfile(deformed_file) :
+            and _is_cached(deformed_file) :
 
             print("skip computation (use existing results)")
             output = {'result': deformed_file}
             return output
 
     # start virutal machine if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initate class
     applydef = nighresjava.RegistrationApplyDeformations()
 
     # load the data
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     hdr = img.header
     aff = img.affine
     imgres = [x.item() for x in hdr.get_zooms()]
@@ -99,52 +102,47 @@ def apply_coordinate_mappings(image, mapping1,
         applydef.setImageDimensions(imgdim[0], imgdim[1], imgdim[2])
     applydef.setImageResolutions(imgres[0], imgres[1], imgres[2])
 
-    applydef.setImageToDeform(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    applydef.setImageToDeform(_to_java(data, 'float'))
 
     def1 = load_volume(mapping1)
-    def1data = def1.get_data()
+    def1data = _volume_data(def1, 'float')
     aff = def1.affine
     hdr = def1.header
     trgdim = def1data.shape
-    applydef.setDeformationMapping1(nighresjava.JArray('float')(
-                                    (def1data.flatten('F')).astype(float)))
+    applydef.setDeformationMapping1(_to_java(def1data, 'float'))
     applydef.setDeformation1Dimensions(def1data.shape[0],
                                         def1data.shape[1],def1data.shape[2])
     applydef.setDeformationType1("mapping(voxels)")
 
     if not (mapping2==None):
         def2 = load_volume(mapping2)
-        def2data = def2.get_data()
+        def2data = _volume_data(def2, 'float')
         aff = def2.affine
         hdr = def2.header
         trgdim = def2data.shape
-        applydef.setDeformationMapping2(nighresjava.JArray('float')(
-                                        (def2data.flatten('F')).astype(float)))
+        applydef.setDeformationMapping2(_to_java(def2data, 'float'))
         applydef.setDeformation2Dimensions(def2data.shape[0],
                                         def2data.shape[1],def2data.shape[2])
         applydef.setDeformationType2("mapping(voxels)")
 
         if not (mapping3==None):
             def3 = load_volume(mapping3)
-            def3data = def3.get_data()
+            def3data = _volume_data(def3, 'float')
             aff = def3.affine
             hdr = def3.header
             trgdim = def3data.shape
-            applydef.setDeformationMapping3(nighresjava.JArray('float')(
-                                            (def3data.flatten('F')).astype(float)))
+            applydef.setDeformationMapping3(_to_java(def3data, 'float'))
             applydef.setDeformation3Dimensions(def3data.shape[0],
                                             def3data.shape[1],def3data.shape[2])
             applydef.setDeformationType3("mapping(voxels)")
 
             if not (mapping4==None):
                 def4 = load_volume(mapping4)
-                def4data = def4.get_data()
+                def4data = _volume_data(def4, 'float')
                 aff = def4.affine
                 hdr = def4.header
                 trgdim = def4data.shape
-                applydef.setDeformationMapping4(nighresjava.JArray('float')(
-                                        (def4data.flatten('F')).astype(float)))
+                applydef.setDeformationMapping4(_to_java(def4data, 'float'))
                 applydef.setDeformation4Dimensions(def4data.shape[0],
                                             def4data.shape[1],def4data.shape[2])
                 applydef.setDeformationType4("mapping(voxels)")
@@ -153,6 +151,7 @@ def apply_coordinate_mappings(image, mapping1,
     applydef.setImagePadding(padding)
 
     # execute class
+    phase('execute')
     try:
         applydef.execute()
 
@@ -162,15 +161,14 @@ def apply_coordinate_mappings(image, mapping1,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect data
     if len(imgdim)==4:
         trgdim = [trgdim[0],trgdim[1],trgdim[2],imgdim[3]]
     else:
         trgdim = [trgdim[0],trgdim[1],trgdim[2]]
-    deformed_data = np.reshape(np.array(
-                                applydef.getDeformedImage(),
-                                dtype=np.float32), trgdim, 'F')
+    deformed_data = _from_java(applydef.getDeformedImage(), trgdim)
     hdr['cal_min'] = np.nanmin(deformed_data)
     hdr['cal_max'] = np.nanmax(deformed_data)
     deformed = nb.Nifti1Image(deformed_data, aff, hdr)
@@ -181,6 +179,8 @@ def apply_coordinate_mappings(image, mapping1,
     else:
         return {'result': deformed}
 
+@profiled
+@cached
 def apply_coordinate_mappings_2d(image, mapping1,
                         mapping2=None, mapping3=None, mapping4=None,
                         interpolation="nearest", padding="closest",
@@ -240,25 +240,22 @@ def apply_coordinate_mappings_2d(image, mapping1,
                                     rootfile=image,
                                     suffix='def-img'))
         if overwrite is False \
-            and os.path.isfile(deformed_file) :
+            and _is_cached(deformed_file) :
 
             print("skip computation (use existing results)")
             output = {'result': load_volume(deformed_file)}
             return output
 
     # start virutal machine if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initate class
     applydef = nighresjava.RegistrationApplyDeformations2D()
 
     # load the data
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     hdr = img.header
     aff = img.affine
     imgres = [x.item() for x in hdr.get_zooms()]
@@ -271,52 +268,47 @@ def apply_coordinate_mappings_2d(image, mapping1,
         applydef.setImageDimensions(imgdim[0], imgdim[1])
     applydef.setImageResolutions(imgres[0], imgres[1])
 
-    applydef.setImageToDeform(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+    applydef.setImageToDeform(_to_java(data, 'float'))
 
     def1 = load_volume(mapping1)
-    def1data = def1.get_data()
+    def1data = _volume_data(def1, 'float')
     aff = def1.affine
     hdr = def1.header
     trgdim = def1data.shape
-    applydef.setDeformationMapping1(nighresjava.JArray('float')(
-                                    (def1data.flatten('F')).astype(float)))
+    applydef.setDeformationMapping1(_to_java(def1data, 'float'))
     applydef.setDeformation1Dimensions(def1data.shape[0],
                                         def1data.shape[1])
     applydef.setDeformationType1("mapping(voxels)")
 
     if not (mapping2==None):
         def2 = load_volume(mapping2)
-        def2data = def2.get_data()
+        def2data = _volume_data(def2, 'float')
         aff = def2.affine
         hdr = def2.header
         trgdim = def2data.shape
-        applydef.setDeformationMapping2(nighresjava.JArray('float')(
-                                        (def2data.flatten('F')).astype(float)))
+        applydef.setDeformationMapping2(_to_java(def2data, 'float'))
         applydef.setDeformation2Dimensions(def2data.shape[0],
                                         def2data.shape[1])
         applydef.setDeformationType2("mapping(voxels)")
 
         if not (mapping3==None):
             def3 = load_volume(mapping3)
-            def3data = def3.get_data()
+            def3data = _volume_data(def3, 'float')
             aff = def3.affine
             hdr = def3.header
             trgdim = def3data.shape
-            applydef.setDeformationMapping3(nighresjava.JArray('float')(
-                                            (def3data.flatten('F')).astype(float)))
+            applydef.setDeformationMapping3(_to_java(def3data, 'float'))
             applydef.setDeformation3Dimensions(def3data.shape[0],
                                             def3data.shape[1])
             applydef.setDeformationType3("mapping(voxels)")
 
             if not (mapping4==None):
                 def4 = load_volume(mapping4)
-                def4data = def4.get_data()
+                def4data = _volume_data(def4, 'float')
                 aff = def4.affine
                 hdr = def4.header
                 trgdim = def4data.shape
-                applydef.setDeformationMapping4(nighresjava.JArray('float')(
-                                        (def4data.flatten('F')).astype(float)))
+                applydef.setDeformationMapping4(_to_java(def4data, 'float'))
                 applydef.setDeformation4Dimensions(def4data.shape[0],
                                             def4data.shape[1])
                 applydef.setDeformationType4("mapping(voxels)")
@@ -325,6 +317,7 @@ def apply_coordinate_mappings_2d(image, mapping1,
     applydef.setImagePadding(padding)
 
     # execute class
+    phase('execute')
     try:
         applydef.execute()
 
@@ -334,15 +327,14 @@ def apply_coordinate_mappings_2d(image, mapping1,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect data
     if len(imgdim)==3:
         trgdim = [trgdim[0],trgdim[1],imgdim[2]]
     else:
         trgdim = [trgdim[0],trgdim[1]]
-    deformed_data = np.reshape(np.array(
-                                applydef.getDeformedImage(),
-                                dtype=np.float32), trgdim, 'F')
+    deformed_data = _from_java(applydef.getDeformedImage(), trgdim)
     hdr['cal_min'] = np.nanmin(deformed_data)
     hdr['cal_max'] = np.nanmax(deformed_data)
     deformed = nb.Nifti1Image(deformed_data, aff, hdr)
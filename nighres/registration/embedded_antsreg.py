@@ -12,6 +12,8 @@ import nibabel as nb
 # nighresjava and nighres functions
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled
+from ..cache import cached, _is_cached
 from ..utils import _output_dir_4saving, _fname_4saving, \
                     _check_topology_lut_dir
 
@@ -21,6 +23,7 @@ Y=1
 Z=2
 T=3
 
+@profiled
 def embedded_antsreg(source_image, target_image,
                     run_rigid=False,
                     rigid_iterations=1000,
@@ -131,6 +134,8 @@ def embedded_antsreg(source_image, target_image,
 					save_data, overwrite, output_dir, file_name)
 
 
+@profiled
+@cached
 def embedded_antsreg_2d(source_image, target_image,
                     run_rigid=False,
                     rigid_iterations=1000,
@@ -258,9 +263,9 @@ def embedded_antsreg_2d(source_image, target_image,
                                suffix='ants-invmap'))
     if save_data:
         if overwrite is False \
-            and os.path.isfile(transformed_source_file) \
-            and os.path.isfile(mapping_file) \
-            and os.path.isfile(inverse_mapping_file) :
+            and _is_cached(transformed_source_file) \
+            and _is_cached(mapping_file) \
+            and _is_cached(inverse_mapping_file) :
 
             print("skip computation (use existing results)")
             output = {'transformed_source': transformed_source_file,
@@ -737,6 +742,8 @@ def embedded_antsreg_2d(source_image, target_image,
 
         return output
 
+@profiled
+@cached
 def embedded_antsreg_2d_multi(source_images, target_images,
                     run_rigid=False,
                     rigid_iterations=1000,
@@ -871,12 +878,12 @@ def embedded_antsreg_2d_multi(source_images, target_images,
                                suffix='ants-invmap'))
     if save_data:
         if overwrite is False \
-            and os.path.isfile(mapping_file) \
-            and os.path.isfile(inverse_mapping_file) :
+            and _is_cached(mapping_file) \
+            and _is_cached(inverse_mapping_file) :
 
             missing = False
             for trans_file in transformed_source_files:
-                if not os.path.isfile(trans_file):
+                if not _is_cached(trans_file):
                     missing = True
 
             if not missing:
@@ -1428,6 +1435,8 @@ def embedded_antsreg_2d_multi(source_images, target_images,
 
         return output
 
+@profiled
+@cached
 def embedded_antsreg_multi(source_images, target_images,
                     run_rigid=True,
                     rigid_iterations=1000,
@@ -1560,12 +1569,12 @@ def embedded_antsreg_multi(source_images, target_images,
                                suffix='ants-invmap'))
     if save_data:
         if overwrite is False \
-            and os.path.isfile(mapping_file) \
-            and os.path.isfile(inverse_mapping_file) :
+            and _is_cached(mapping_file) \
+            and _is_cached(inverse_mapping_file) :
 
             missing = False
             for trans_file in transformed_source_files:
-                if not os.path.isfile(trans_file):
+                if not _is_cached(trans_file):
                     missing = True
 
             if not missing:
@@ -8,7 +8,9 @@ import nibabel
 
 # nighresjava and nighres functions
 import nighresjava
-from ..io import load_volume, save_volume
+from ..io import load_volume_header, save_volume
+from ..profiling import profiled
+from ..cache import cached, _is_cached
 from ..utils import _output_dir_4saving, _fname_4saving, \
                     _check_topology_lut_dir
 
@@ -18,6 +20,8 @@ Y=1
 Z=2
 T=3
 
+@profiled
+@cached
 def generate_coordinate_mapping(reference_image, 
                     source_image=None,
                     transform_matrix=None,
@@ -75,7 +79,7 @@ def generate_coordinate_mapping(reference_image,
                                    suffix='coord-map'))
 
         if overwrite is False \
-            and os.path.isfile(mapping_file) :
+            and _is_cached(mapping_file) :
             
             print("skip computation (use existing results)")
             output = {'result': mapping_file}
@@ -83,24 +87,23 @@ def generate_coordinate_mapping(reference_image,
 
 
     # load and get dimensions and resolution from input images
-    reference = load_volume(reference_image)
-    ref_affine = reference.affine
-    ref_header = reference.header
-    nx = reference.header.get_data_shape()[X]
-    ny = reference.header.get_data_shape()[Y]
-    nz = reference.header.get_data_shape()[Z]
-    rtx = reference.header.get_zooms()[X]
-    rty = reference.header.get_zooms()[Y]
-    rtz = reference.header.get_zooms()[Z]
+    ref_header = load_volume_header(reference_image)
+    ref_affine = ref_header.get_best_affine()
+    nx = ref_header.get_data_shape()[X]
+    ny = ref_header.get_data_shape()[Y]
+    nz = ref_header.get_data_shape()[Z]
+    rtx = ref_header.get_zooms()[X]
+    rty = ref_header.get_zooms()[Y]
+    rtz = ref_header.get_zooms()[Z]
 
     rsx = rtx
     rsy = rty
     rsz = rtz
     if source_image is not None:
-        source = load_volume(source_image)
-        rsx = source.header.get_zooms()[X]
-        rsy = source.header.get_zooms()[Y]
-        rsz = source.header.get_zooms()[Z]
+        src_header = load_volume_header(source_image)
+        rsx = src_header.get_zooms()[X]
+        rsy = src_header.get_zooms()[Y]
+        rsz = src_header.get_zooms()[Z]
 
     if transform_matrix is not None:
         with open(transform_matrix, 'r+') as f:
@@ -9,6 +9,8 @@ import nibabel as nb
 # nighresjava and nighres functions
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled
+from ..cache import cached, _is_cached
 from ..utils import _output_dir_4saving, _fname_4saving, \
                     _check_topology_lut_dir
 
@@ -18,6 +20,8 @@ Y=1
 Z=2
 T=3
 
+@profiled
+@cached
 def simple_align(source_image, target_image,
                     copy_header=False,
                     align_center=False, 
@@ -86,7 +90,7 @@ def simple_align(source_image, target_image,
                                    suffix='al-img'))
 
         if overwrite is False \
-            and os.path.isfile(result_file) :
+            and _is_cached(result_file) :
             
             print("skip computation (use existing results)")
             output = {'result': result_file}
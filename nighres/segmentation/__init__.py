@@ -1,4 +1,8 @@
-from nighres.segmentation.conditional_shape import conditional_shape
-from nighres.segmentation.conditional_shape import conditional_shape_atlasing
-from nighres.segmentation.conditional_shape import conditional_shape_updating
-from nighres.segmentation.fuzzy_cmeans import fuzzy_cmeans
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'conditional_shape': '.conditional_shape',
+    'conditional_shape_atlasing': '.conditional_shape',
+    'conditional_shape_updating': '.conditional_shape',
+    'fuzzy_cmeans': '.fuzzy_cmeans'})
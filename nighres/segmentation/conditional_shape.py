@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def conditional_shape(target_images, structures, contrasts, background=1,
                       shape_atlas_probas=None, shape_atlas_labels=None, 
                       intensity_atlas_hist=None,
@@ -120,13 +126,13 @@ def conditional_shape(target_images, structures, contrasts, background=1,
                                    rootfile=target_images[0],
                                    suffix='cspmax-ngb'))
         if overwrite is False \
-            and os.path.isfile(spatial_proba_file) \
-            and os.path.isfile(spatial_label_file) \
-            and os.path.isfile(combined_proba_file) \
-            and os.path.isfile(combined_label_file) \
-            and os.path.isfile(proba_file) \
-            and os.path.isfile(label_file) \
-            and os.path.isfile(neighbor_file):
+            and _is_cached(spatial_proba_file) \
+            and _is_cached(spatial_label_file) \
+            and _is_cached(combined_proba_file) \
+            and _is_cached(combined_label_file) \
+            and _is_cached(proba_file) \
+            and _is_cached(label_file) \
+            and _is_cached(neighbor_file):
             
             print("skip computation (use existing results)")
             output = {'max_spatial_proba': spatial_proba_file, 
@@ -140,11 +146,8 @@ def conditional_shape(target_images, structures, contrasts, background=1,
 
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     cspmax = nighresjava.ConditionalShapeSegmentation()
 
@@ -156,7 +159,7 @@ def conditional_shape(target_images, structures, contrasts, background=1,
     # load target image for parameters
     print("load: "+str(target_images[0]))
     img = load_volume(target_images[0])
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     trg_affine = img.get_affine()
     trg_header = img.get_header()
     trg_resolution = [x.item() for x in trg_header.get_zooms()]
@@ -166,27 +169,24 @@ def conditional_shape(target_images, structures, contrasts, background=1,
     cspmax.setTargetResolutions(trg_resolution[0], trg_resolution[1], trg_resolution[2])
 
     # target image 1
-    cspmax.setTargetImageAt(0, nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+    cspmax.setTargetImageAt(0, _to_java(data, 'float'))
     
     # if further contrast are specified, input them
     for contrast in range(1,contrasts):    
         print("load: "+str(target_images[contrast]))
-        data = load_volume(target_images[contrast]).get_data()
-        cspmax.setTargetImageAt(contrast, nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(target_images[contrast]), 'float')
+        cspmax.setTargetImageAt(contrast, _to_java(data, 'float'))
 
     # load the shape and intensity atlases
     print("load: "+str(os.path.join(output_dir,intensity_atlas_hist)))
-    hist = load_volume(os.path.join(output_dir,intensity_atlas_hist)).get_data()
-    cspmax.setConditionalHistogram(nighresjava.JArray('float')(
-                                        (hist.flatten('F')).astype(float)))
+    hist = _volume_data(load_volume(os.path.join(output_dir,intensity_atlas_hist)), 'float')
+    cspmax.setConditionalHistogram(_to_java(hist, 'float'))
 
     print("load: "+str(os.path.join(output_dir,shape_atlas_probas)))
     
     # load a first image for dim, res
     img = load_volume(os.path.join(output_dir,shape_atlas_probas))
-    pdata = img.get_data()
+    pdata = _volume_data(img, 'float')
     header = img.get_header()
     affine = img.get_affine()
     resolution = [x.item() for x in header.get_zooms()]
@@ -196,32 +196,28 @@ def conditional_shape(target_images, structures, contrasts, background=1,
     cspmax.setAtlasResolutions(resolution[0], resolution[1], resolution[2])
 
     print("load: "+str(os.path.join(output_dir,shape_atlas_labels)))
-    ldata = load_volume(os.path.join(output_dir,shape_atlas_labels)).get_data()
+    ldata = _volume_data(load_volume(os.path.join(output_dir,shape_atlas_labels)), 'int')
     
     if map_to_target is not None:
         print("map atlas to subject")
         print("load: "+str(map_to_target))
-        mdata =  load_volume(map_to_target).get_data()
-        cspmax.setMappingToTarget(nighresjava.JArray('float')(
-                                            (mdata.flatten('F')).astype(float)))
+        mdata = _volume_data(load_volume(map_to_target), 'float')
+        cspmax.setMappingToTarget(_to_java(mdata, 'float'))
         
-    cspmax.setShapeAtlasProbasAndLabels(nighresjava.JArray('float')(
-                                (pdata.flatten('F')).astype(float)),
-                                nighresjava.JArray('int')(
-                                (ldata.flatten('F')).astype(int).tolist()))
+    cspmax.setShapeAtlasProbasAndLabels(_to_java(pdata, 'float'),
+                                _to_java(ldata, 'int'))
 
     print("load: "+str(os.path.join(output_dir,skeleton_atlas_probas)))
-    pdata = load_volume(os.path.join(output_dir,skeleton_atlas_probas)).get_data()
+    pdata = _volume_data(load_volume(os.path.join(output_dir,skeleton_atlas_probas)), 'float')
     
     print("load: "+str(os.path.join(output_dir,skeleton_atlas_labels)))
-    ldata = load_volume(os.path.join(output_dir,skeleton_atlas_labels)).get_data()
+    ldata = _volume_data(load_volume(os.path.join(output_dir,skeleton_atlas_labels)), 'int')
 
-    cspmax.setSkeletonAtlasProbasAndLabels(nighresjava.JArray('float')(
-                                (pdata.flatten('F')).astype(float)),
-                                nighresjava.JArray('int')(
-                                (ldata.flatten('F')).astype(int).tolist()))
+    cspmax.setSkeletonAtlasProbasAndLabels(_to_java(pdata, 'float'),
+                                _to_java(ldata, 'int'))
 
     # execute
+    phase('execute')
     try:
         cspmax.estimateTarget()
         #cspmax.strictSimilarityDiffusion(ngb_size)
@@ -253,6 +249,7 @@ def conditional_shape(target_images, structures, contrasts, background=1,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
     dimensions = (dimensions[0],dimensions[1],dimensions[2],cspmax.getBestDimension())
@@ -268,11 +265,9 @@ def conditional_shape(target_images, structures, contrasts, background=1,
 
     intens_hist_dims = ((structures+background)*(structures+background),cspmax.getNumberOfBins()+6,contrasts)
 
-    spatial_proba_data = np.reshape(np.array(cspmax.getBestSpatialProbabilityMaps(1),
-                                   dtype=np.float32), dims3Dtrg, 'F')
+    spatial_proba_data = _from_java(cspmax.getBestSpatialProbabilityMaps(1), dims3Dtrg)
 
-    spatial_label_data = np.reshape(np.array(cspmax.getBestSpatialProbabilityLabels(1),
-                                    dtype=np.int32), dims3Dtrg, 'F')    
+    spatial_label_data = _from_java(cspmax.getBestSpatialProbabilityLabels(1), dims3Dtrg, np.int32)    
 
 #    combined_proba_data = np.reshape(np.array(cspmax.getBestProbabilityMaps(1),
 #                                   dtype=np.float32), dims3Dtrg, 'F')
@@ -280,20 +275,15 @@ def conditional_shape(target_images, structures, contrasts, background=1,
 #    combined_label_data = np.reshape(np.array(cspmax.getBestProbabilityLabels(1),
 #                                    dtype=np.int32), dims3Dtrg, 'F')
 
-    combined_proba_data = np.reshape(np.array(cspmax.getJointProbabilityMaps(4),
-                                   dtype=np.float32), dims_extra, 'F')
+    combined_proba_data = _from_java(cspmax.getJointProbabilityMaps(4), dims_extra)
 
-    combined_label_data = np.reshape(np.array(cspmax.getJointProbabilityLabels(4),
-                                    dtype=np.int32), dims_extra, 'F')
+    combined_label_data = _from_java(cspmax.getJointProbabilityLabels(4), dims_extra, np.int32)
 
-    proba_data = np.reshape(np.array(cspmax.getFinalProba(),
-                                    dtype=np.float32), dims3Dtrg, 'F')
+    proba_data = _from_java(cspmax.getFinalProba(), dims3Dtrg)
 
-    label_data = np.reshape(np.array(cspmax.getFinalLabel(),
-                                    dtype=np.int32), dims3Dtrg, 'F')
+    label_data = _from_java(cspmax.getFinalLabel(), dims3Dtrg, np.int32)
 
-    neighbor_data = np.reshape(np.array(cspmax.getNeighborhoodMaps(ngb_size),
-                                        dtype=np.float32), dims_ngb, 'F')
+    neighbor_data = _from_java(cspmax.getNeighborhoodMaps(ngb_size), dims_ngb)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
@@ -339,6 +329,8 @@ def conditional_shape(target_images, structures, contrasts, background=1,
         return output
 
 
+@profiled
+@cached
 def conditional_shape_atlasing(subjects, structures, contrasts, 
                       levelset_images=None, skeleton_images=None, 
                       contrast_images=None, background=1,
@@ -424,11 +416,11 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
 
         
         if overwrite is False \
-            and os.path.isfile(spatial_proba_file) \
-            and os.path.isfile(spatial_label_file) \
-            and os.path.isfile(condhist_file) \
-            and os.path.isfile(skeleton_proba_file) \
-            and os.path.isfile(skeleton_label_file):
+            and _is_cached(spatial_proba_file) \
+            and _is_cached(spatial_label_file) \
+            and _is_cached(condhist_file) \
+            and _is_cached(skeleton_proba_file) \
+            and _is_cached(skeleton_label_file):
             
             print("skip computation (use existing results)")
             output = {'max_spatial_proba': spatial_proba_file, 
@@ -441,11 +433,8 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
 
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     cspmax = nighresjava.ConditionalShapeSegmentation()
 
@@ -456,11 +445,10 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
     # load target image for parameters
     # load a first image for dim, res
     img = load_volume(contrast_images[0][0])
-    data = img.get_data()
     header = img.get_header()
     affine = img.get_affine()
     trg_resolution = [x.item() for x in header.get_zooms()]
-    trg_dimensions = data.shape
+    trg_dimensions = img.shape
     
     cspmax.setTargetDimensions(trg_dimensions[0], trg_dimensions[1], trg_dimensions[2])
     cspmax.setTargetResolutions(trg_resolution[0], trg_resolution[1], trg_resolution[2])
@@ -475,16 +463,15 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
     for sub in range(subjects):
         for struct in range(structures):
             print("load: "+str(levelset_images[sub][struct]))
-            data = load_volume(levelset_images[sub][struct]).get_data()
-            cspmax.setLevelsetImageAt(sub, struct, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(levelset_images[sub][struct]), 'float')
+            cspmax.setLevelsetImageAt(sub, struct, _to_java(data, 'float'))
         for contrast in range(contrasts):
             print("load: "+str(contrast_images[sub][contrast]))
-            data = load_volume(contrast_images[sub][contrast]).get_data()
-            cspmax.setContrastImageAt(sub, contrast, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(contrast_images[sub][contrast]), 'float')
+            cspmax.setContrastImageAt(sub, contrast, _to_java(data, 'float'))
     # execute first step
     scale = 1.0
+    phase('execute')
     try:
         scale = cspmax.computeAtlasPriors()
  
@@ -494,6 +481,7 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
         print(sys.exc_info()[0])
         raise
         return
+    phase('to_java')
 
     # clean up and go to second step
     levelset_images = None
@@ -502,10 +490,10 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
     for sub in range(subjects):
         for struct in range(structures):
             print("load: "+str(skeleton_images[sub][struct]))
-            data = load_volume(skeleton_images[sub][struct]).get_data()
-            cspmax.setSkeletonImageAt(sub, struct, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(skeleton_images[sub][struct]), 'float')
+            cspmax.setSkeletonImageAt(sub, struct, _to_java(data, 'float'))
                 
+    phase('execute')
     try:
         cspmax.computeSkeletonPriors(scale)
  
@@ -515,6 +503,7 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     skeleton_images = None
 
@@ -526,20 +515,15 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
     intens_dims = (structures+background,structures+background,contrasts)
     intens_hist_dims = ((structures+background)*(structures+background),cspmax.getNumberOfBins()+6,contrasts)
 
-    spatial_proba_data = np.reshape(np.array(cspmax.getBestSpatialProbabilityMaps(dimensions[3]),
-                                   dtype=np.float32), dimensions, 'F')
+    spatial_proba_data = _from_java(cspmax.getBestSpatialProbabilityMaps(dimensions[3]), dimensions)
 
-    spatial_label_data = np.reshape(np.array(cspmax.getBestSpatialProbabilityLabels(dimensions[3]),
-                                    dtype=np.int32), dimensions, 'F')    
+    spatial_label_data = _from_java(cspmax.getBestSpatialProbabilityLabels(dimensions[3]), dimensions, np.int32)    
 
-    intens_hist_data = np.reshape(np.array(cspmax.getConditionalHistogram(),
-                                       dtype=np.float32), intens_hist_dims, 'F')
+    intens_hist_data = _from_java(cspmax.getConditionalHistogram(), intens_hist_dims)
 
-    skeleton_proba_data = np.reshape(np.array(cspmax.getBestSkeletonProbabilityMaps(dimskel[3]),
-                                   dtype=np.float32), dimskel, 'F')
+    skeleton_proba_data = _from_java(cspmax.getBestSkeletonProbabilityMaps(dimskel[3]), dimskel)
 
-    skeleton_label_data = np.reshape(np.array(cspmax.getBestSkeletonProbabilityLabels(dimskel[3]),
-                                    dtype=np.int32), dimskel, 'F')    
+    skeleton_label_data = _from_java(cspmax.getBestSkeletonProbabilityLabels(dimskel[3]), dimskel, np.int32)    
 
 
     # adapt header max for each image so that correct max is displayed
@@ -578,6 +562,8 @@ def conditional_shape_atlasing(subjects, structures, contrasts,
                  'max_skeleton_label': skeleton_label}
         return output
 
+@profiled
+@cached
 def conditional_shape_updating(subjects, structures, contrasts, 
                       levelset_images=None, skeleton_images=None, 
                       contrast_images=None, 
@@ -679,11 +665,11 @@ def conditional_shape_updating(subjects, structures, contrasts,
 
         
         if overwrite is False \
-            and os.path.isfile(spatial_proba_file) \
-            and os.path.isfile(spatial_label_file) \
-            and os.path.isfile(condhist_file) \
-            and os.path.isfile(skeleton_proba_file) \
-            and os.path.isfile(skeleton_label_file):
+            and _is_cached(spatial_proba_file) \
+            and _is_cached(spatial_label_file) \
+            and _is_cached(condhist_file) \
+            and _is_cached(skeleton_proba_file) \
+            and _is_cached(skeleton_label_file):
             
             print("skip computation (use existing results)")
             output = {'max_spatial_proba': spatial_proba_file, 
@@ -696,11 +682,8 @@ def conditional_shape_updating(subjects, structures, contrasts,
 
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     cspmax = nighresjava.ConditionalShapeSegmentation()
 
@@ -711,11 +694,10 @@ def conditional_shape_updating(subjects, structures, contrasts,
     # load target image for parameters
     # load a first image for dim, res
     img = load_volume(contrast_images[0][0])
-    data = img.get_data()
     header = img.get_header()
     affine = img.get_affine()
     trg_resolution = [x.item() for x in header.get_zooms()]
-    trg_dimensions = data.shape
+    trg_dimensions = img.shape
     
     cspmax.setTargetDimensions(trg_dimensions[0], trg_dimensions[1], trg_dimensions[2])
     cspmax.setTargetResolutions(trg_resolution[0], trg_resolution[1], trg_resolution[2])
@@ -728,45 +710,39 @@ def conditional_shape_updating(subjects, structures, contrasts,
     
     # load the shape and intensity atlases
     print("load: "+str(os.path.join(output_dir,intensity_atlas_hist)))
-    hist = load_volume(os.path.join(output_dir,intensity_atlas_hist)).get_data()
-    cspmax.setConditionalHistogram(nighresjava.JArray('float')(
-                                        (hist.flatten('F')).astype(float)))
+    hist = _volume_data(load_volume(os.path.join(output_dir,intensity_atlas_hist)), 'float')
+    cspmax.setConditionalHistogram(_to_java(hist, 'float'))
 
     print("load: "+str(os.path.join(output_dir,shape_atlas_probas)))
-    pdata = load_volume(os.path.join(output_dir,shape_atlas_probas)).get_data()
+    pdata = _volume_data(load_volume(os.path.join(output_dir,shape_atlas_probas)), 'float')
     print("load: "+str(os.path.join(output_dir,shape_atlas_labels)))
-    ldata = load_volume(os.path.join(output_dir,shape_atlas_labels)).get_data()
+    ldata = _volume_data(load_volume(os.path.join(output_dir,shape_atlas_labels)), 'int')
     
-    cspmax.setShapeAtlasProbasAndLabels(nighresjava.JArray('float')(
-                                (pdata.flatten('F')).astype(float)),
-                                nighresjava.JArray('int')(
-                                (ldata.flatten('F')).astype(int).tolist()))
+    cspmax.setShapeAtlasProbasAndLabels(_to_java(pdata, 'float'),
+                                _to_java(ldata, 'int'))
 
     print("load: "+str(os.path.join(output_dir,skeleton_atlas_probas)))
-    pdata = load_volume(os.path.join(output_dir,skeleton_atlas_probas)).get_data()
+    pdata = _volume_data(load_volume(os.path.join(output_dir,skeleton_atlas_probas)), 'float')
     
     print("load: "+str(os.path.join(output_dir,skeleton_atlas_labels)))
-    ldata = load_volume(os.path.join(output_dir,skeleton_atlas_labels)).get_data()
+    ldata = _volume_data(load_volume(os.path.join(output_dir,skeleton_atlas_labels)), 'int')
 
-    cspmax.setSkeletonAtlasProbasAndLabels(nighresjava.JArray('float')(
-                                (pdata.flatten('F')).astype(float)),
-                                nighresjava.JArray('int')(
-                                (ldata.flatten('F')).astype(int).tolist()))
+    cspmax.setSkeletonAtlasProbasAndLabels(_to_java(pdata, 'float'),
+                                _to_java(ldata, 'int'))
 
     # load the atlas structures and contrasts, if needed
     for sub in range(subjects):
         for struct in range(structures):
             print("load: "+str(levelset_images[sub][struct]))
-            data = load_volume(levelset_images[sub][struct]).get_data()
-            cspmax.setLevelsetImageAt(sub, struct, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(levelset_images[sub][struct]), 'float')
+            cspmax.setLevelsetImageAt(sub, struct, _to_java(data, 'float'))
         for contrast in range(contrasts):
             print("load: "+str(contrast_images[sub][contrast]))
-            data = load_volume(contrast_images[sub][contrast]).get_data()
-            cspmax.setContrastImageAt(sub, contrast, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(contrast_images[sub][contrast]), 'float')
+            cspmax.setContrastImageAt(sub, contrast, _to_java(data, 'float'))
     # execute first step
     scale = 1.0
+    phase('execute')
     try:
         scale = cspmax.updateAtlasPriors(atlas_weight, update_weight)
  
@@ -776,6 +752,7 @@ def conditional_shape_updating(subjects, structures, contrasts,
         print(sys.exc_info()[0])
         raise
         return
+    phase('to_java')
 
     # clean up and go to second step
     levelset_images = None
@@ -784,10 +761,10 @@ def conditional_shape_updating(subjects, structures, contrasts,
     for sub in range(subjects):
         for struct in range(structures):
             print("load: "+str(skeleton_images[sub][struct]))
-            data = load_volume(skeleton_images[sub][struct]).get_data()
-            cspmax.setSkeletonImageAt(sub, struct, nighresjava.JArray('float')(
-                                                (data.flatten('F')).astype(float)))
+            data = _volume_data(load_volume(skeleton_images[sub][struct]), 'float')
+            cspmax.setSkeletonImageAt(sub, struct, _to_java(data, 'float'))
                 
+    phase('execute')
     try:
         cspmax.updateSkeletonPriors(scale, atlas_weight, update_weight)
  
@@ -797,6 +774,7 @@ def conditional_shape_updating(subjects, structures, contrasts,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     skeleton_images = None
 
@@ -808,20 +786,15 @@ def conditional_shape_updating(subjects, structures, contrasts,
     intens_dims = (structures+1,structures+1,contrasts)
     intens_hist_dims = ((structures+1)*(structures+1),cspmax.getNumberOfBins()+6,contrasts)
 
-    spatial_proba_data = np.reshape(np.array(cspmax.getBestSpatialProbabilityMaps(dimensions[3]),
-                                   dtype=np.float32), dimensions, 'F')
+    spatial_proba_data = _from_java(cspmax.getBestSpatialProbabilityMaps(dimensions[3]), dimensions)
 
-    spatial_label_data = np.reshape(np.array(cspmax.getBestSpatialProbabilityLabels(dimensions[3]),
-                                    dtype=np.int32), dimensions, 'F')    
+    spatial_label_data = _from_java(cspmax.getBestSpatialProbabilityLabels(dimensions[3]), dimensions, np.int32)    
 
-    intens_hist_data = np.reshape(np.array(cspmax.getConditionalHistogram(),
-                                       dtype=np.float32), intens_hist_dims, 'F')
+    intens_hist_data = _from_java(cspmax.getConditionalHistogram(), intens_hist_dims)
 
-    skeleton_proba_data = np.reshape(np.array(cspmax.getBestSkeletonProbabilityMaps(dimskel[3]),
-                                   dtype=np.float32), dimskel, 'F')
+    skeleton_proba_data = _from_java(cspmax.getBestSkeletonProbabilityMaps(dimskel[3]), dimskel)
 
-    skeleton_label_data = np.reshape(np.array(cspmax.getBestSkeletonProbabilityLabels(dimskel[3]),
-                                    dtype=np.int32), dimskel, 'F')    
+    skeleton_label_data = _from_java(cspmax.getBestSkeletonProbabilityLabels(dimskel[3]), dimskel, np.int32)    
 
 
     # adapt header max for each image so that correct max is displayed
@@ -4,10 +4,16 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def fuzzy_cmeans(image, clusters=3, max_iterations=50, max_difference=0.01, 
                     smoothing=0.1, fuzziness=2.0, mask_zero=True,
                     save_data=False, overwrite=False, output_dir=None,
@@ -76,11 +82,11 @@ def fuzzy_cmeans(image, clusters=3, max_iterations=50, max_difference=0.01,
                                    rootfile=image,
                                    suffix='rfcm-class'))
         if overwrite is False \
-            and os.path.isfile(classification_file):
+            and _is_cached(classification_file):
             
             missing = False
             for mem_file in mem_files:
-                if not os.path.isfile(mem_file):
+                if not _is_cached(mem_file):
                     missing = True
             if not missing:        
                 print("skip computation (use existing results)")
@@ -90,11 +96,8 @@ def fuzzy_cmeans(image, clusters=3, max_iterations=50, max_difference=0.01,
 
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create instance
     rfcm = nighresjava.FuzzyCmeans()
 
@@ -108,7 +111,7 @@ def fuzzy_cmeans(image, clusters=3, max_iterations=50, max_difference=0.01,
     # load target image for parameters
     print("load: "+str(image))
     img = load_volume(image)
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     affine = img.get_affine()
     header = img.get_header()
     resolution = [x.item() for x in header.get_zooms()]
@@ -121,10 +124,10 @@ def fuzzy_cmeans(image, clusters=3, max_iterations=50, max_difference=0.01,
     else: rfcm.setResolutions(resolution[0], resolution[1], resolution[1])
 
     # image
-    rfcm.setImage(nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+    rfcm.setImage(_to_java(data, 'float'))
     
     # execute
+    phase('execute')
     try:
         if mask_zero: rfcm.initZeroMaskImage()
         else: rfcm.initBasicMaskImage()
@@ -136,18 +139,17 @@ def fuzzy_cmeans(image, clusters=3, max_iterations=50, max_difference=0.01,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
-    classification_data = np.reshape(np.array(rfcm.getClassification(),
-                                   dtype=np.int32), dimensions, 'F')
+    classification_data = _from_java(rfcm.getClassification(), dimensions, np.int32)
 
     header['cal_max'] = np.nanmax(classification_data)
     classification = nb.Nifti1Image(classification_data, affine, header)
 
     memberships = []
     for c in range(clusters):
-        mem_data = np.reshape(np.array(rfcm.getMembership(c),
-                                    dtype=np.float32), dimensions, 'F')    
+        mem_data = _from_java(rfcm.getMembership(c), dimensions)    
         header['cal_max'] = np.nanmax(mem_data)
         membership = nb.Nifti1Image(mem_data, affine, header)
         memberships.append(membership)
@@ -1,5 +1,9 @@
-from nighres.shape.levelset_fusion import levelset_fusion
-from nighres.shape.topology_correction import topology_correction
-from nighres.shape.simple_skeleton import simple_skeleton
-from nighres.shape.levelset_thickness import levelset_thickness
-from nighres.shape.intrinsic_coordinates import intrinsic_coordinates
\ No newline at end of file
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'levelset_fusion': '.levelset_fusion',
+    'topology_correction': '.topology_correction',
+    'simple_skeleton': '.simple_skeleton',
+    'levelset_thickness': '.levelset_thickness',
+    'intrinsic_coordinates': '.intrinsic_coordinates'})
@@ -9,10 +9,16 @@ import nibabel as nb
 # nighresjava and nighres functions
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-    _check_topology_lut_dir, _check_atlas_file, _check_available_memory
+    _check_topology_lut_dir, _check_atlas_file, \
+    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def intrinsic_coordinates(label_image,
                    system_type='centroid_pca',
                    som_size=10,
@@ -71,18 +77,15 @@ def intrinsic_coordinates(label_image,
                                   suffix='ics-img'))    
 
         if overwrite is False \
-            and os.path.isfile(coord_file) \
-            and os.path.isfile(img_file) :
+            and _is_cached(coord_file) \
+            and _is_cached(img_file) :
                 output = {'coordinates': coord_file,
                           'image': img_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     algorithm = nighresjava.IntrinsicCoordinates()
 
@@ -92,7 +95,6 @@ def intrinsic_coordinates(label_image,
 
     # load images and set dimensions and resolution
     label_image = load_volume(label_image)
-    data = label_image.get_data()
     affine = label_image.get_affine()
     header = label_image.get_header()
     resolution = [x.item() for x in header.get_zooms()]
@@ -103,11 +105,11 @@ def intrinsic_coordinates(label_image,
     algorithm.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    data = load_volume(label_image).get_data()
-    algorithm.setLabelImage(nighresjava.JArray('int')(
-                               (data.flatten('F')).astype(int).tolist()))
+    data = _volume_data(label_image, 'int')
+    algorithm.setLabelImage(_to_java(data, 'int'))
 
     # execute
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -117,14 +119,11 @@ def intrinsic_coordinates(label_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # Collect output
-    coord_data = np.reshape(np.array(
-                                    algorithm.getCoordinateImage(),
-                                    dtype=np.float32), dimensions4, 'F')
-    img_data = np.reshape(np.array(
-                                    algorithm.getTransformedImage(),
-                                    dtype=np.int32), dimensions, 'F')
+    coord_data = _from_java(algorithm.getCoordinateImage(), dimensions4)
+    img_data = _from_java(algorithm.getTransformedImage(), dimensions, np.int32)
 
     # adapt header max for each image so that correct max is displayed
     # and create nifiti objects
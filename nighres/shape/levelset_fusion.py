@@ -4,10 +4,16 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def levelset_fusion(levelset_images,
                     correct_topology=True, topology_lut_dir=None,
                     save_data=False, overwrite=False, output_dir=None,
@@ -66,18 +72,15 @@ def levelset_fusion(levelset_images,
                                        suffix='lsf-avg'))
         print('output file: '+levelset_file)
         if overwrite is False \
-            and os.path.isfile(levelset_file) :
+            and _is_cached(levelset_file) :
 
             print("skip computation (use existing results)")
             output = {'result': levelset_file}
             return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.ShapeLevelsetFusion()
@@ -89,7 +92,7 @@ def levelset_fusion(levelset_images,
     hdr = img.header
     aff = img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
-    dimensions = img.get_data().shape
+    dimensions = img.shape
 
     algorithm.setNumberOfImages(nsubjects)
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
@@ -98,14 +101,14 @@ def levelset_fusion(levelset_images,
     levelset_data = [];
     for idx in range(len(levelset_images)):
         img = load_volume(levelset_images[idx])
-        data = img.get_data()
-        algorithm.setLevelsetImageAt(idx, nighresjava.JArray('float')(
-                                            (data.flatten('F')).astype(float)))
+        data = _volume_data(img, 'float')
+        algorithm.setLevelsetImageAt(idx, _to_java(data, 'float'))
 
     algorithm.setCorrectSkeletonTopology(correct_topology)
     algorithm.setTopologyLUTdirectory(topology_lut_dir)
 
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -115,10 +118,10 @@ def levelset_fusion(levelset_images,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
-    levelset_data = np.reshape(np.array(algorithm.getLevelsetAverage(),
-                               dtype=np.float32), dimensions, 'F')
+    levelset_data = _from_java(algorithm.getLevelsetAverage(), dimensions)
 
     hdr['cal_min'] = np.nanmin(levelset_data)
     hdr['cal_max'] = np.nanmax(levelset_data)
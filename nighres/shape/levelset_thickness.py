@@ -9,10 +9,16 @@ import nibabel as nb
 # nighresjava and nighres functions
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-    _check_topology_lut_dir, _check_atlas_file, _check_available_memory
+    _check_topology_lut_dir, _check_atlas_file, \
+    _to_java, _from_java
 
 
+@profiled
+@cached
 def levelset_thickness(input_image,
                     shape_image_type='signed_distance',
                    save_data=False,
@@ -75,20 +81,17 @@ def levelset_thickness(input_image,
                                   suffix='lth-dist'))
 
         if overwrite is False \
-            and os.path.isfile(thickness_file) \
-            and os.path.isfile(axis_file) \
-            and os.path.isfile(dist_file) :
+            and _is_cached(thickness_file) \
+            and _is_cached(axis_file) \
+            and _is_cached(dist_file) :
                 output = {'thickness': thickness_file,
                           'axis':axis_file,
                           'dist':dist_file}
                 return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     algorithm = nighresjava.LevelsetThickness()
 
@@ -98,7 +101,6 @@ def levelset_thickness(input_image,
 
     # load images and set dimensions and resolution
     input_image = load_volume(input_image)
-    data = input_image.get_data()
     affine = input_image.get_affine()
     header = input_image.get_header()
     resolution = [x.item() for x in header.get_zooms()]
@@ -108,15 +110,13 @@ def levelset_thickness(input_image,
     algorithm.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    data = load_volume(input_image).get_data()
     if (shape_image_type == 'parcellation'):
-        algorithm.setLabelImage(nighresjava.JArray('int')(
-                               (data.flatten('F')).astype(int).tolist()))
+        algorithm.setLabelImage(_to_java(input_image, 'int'))
     else:
-        algorithm.setShapeImage(nighresjava.JArray('float')(
-                               (data.flatten('F')).astype(float)))
+        algorithm.setShapeImage(_to_java(input_image, 'float'))
 
     # execute
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -126,18 +126,13 @@ def levelset_thickness(input_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # Collect output
-    axis_data = np.reshape(np.array(
-                                    algorithm.getMedialAxisImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    dist_data = np.reshape(np.array(
-                                    algorithm.getMedialDistanceImage(),
-                                    dtype=np.float32), dimensions, 'F')
-
-    thickness_data = np.reshape(np.array(
-                                    algorithm.geThicknessImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    axis_data = _from_java(algorithm.getMedialAxisImage(), dimensions)
+    dist_data = _from_java(algorithm.getMedialDistanceImage(), dimensions)
+
+    thickness_data = _from_java(algorithm.geThicknessImage(), dimensions)
 
 
     # adapt header max for each image so that correct max is displayed
@@ -9,10 +9,16 @@ import nibabel as nb
 # nighresjava and nighres functions
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-    _check_topology_lut_dir, _check_atlas_file, _check_available_memory
+    _check_topology_lut_dir, _check_atlas_file, \
+    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def simple_skeleton(input_image,
 		   shape_image_type = 'signed_distance',
                    boundary_threshold = 0.0,
@@ -82,8 +88,8 @@ def simple_skeleton(input_image,
                                   suffix='ssk-skel'))
 
         if overwrite is False \
-            and os.path.isfile(MedialSurface_file) \
-            and os.path.isfile(Medial_Curve_file) :
+            and _is_cached(MedialSurface_file) \
+            and _is_cached(Medial_Curve_file) :
 
             print("skip computation (use existing results)")
             output = {'medial': MedialSurface_file,
@@ -91,11 +97,8 @@ def simple_skeleton(input_image,
             return output
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     skeleton = nighresjava.ShapeSimpleSkeleton()
 
@@ -108,7 +111,6 @@ def simple_skeleton(input_image,
 
     # load images and set dimensions and resolution
     input_image = load_volume(input_image)
-    data = input_image.get_data()
     affine = input_image.get_affine()
     header = input_image.get_header()
     resolution = [x.item() for x in header.get_zooms()]
@@ -118,11 +120,11 @@ def simple_skeleton(input_image,
     skeleton.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     skeleton.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    data = load_volume(input_image).get_data()
-    skeleton.setShapeImage(nighresjava.JArray('float')(
-                               (data.flatten('F')).astype(float)))
+    data = _volume_data(input_image, 'float')
+    skeleton.setShapeImage(_to_java(data, 'float'))
 
     # execute
+    phase('execute')
     try:
         skeleton.execute()
 
@@ -132,14 +134,11 @@ def simple_skeleton(input_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # Collect output
-    medialImage_data = np.reshape(np.array(
-                                    skeleton.getMedialSurfaceImage(),
-                                    dtype=np.int8), dimensions, 'F')
-    skelImage_data = np.reshape(np.array(
-                                    skeleton.getMedialCurveImage(),
-                                    dtype=np.int8), dimensions, 'F')
+    medialImage_data = _from_java(skeleton.getMedialSurfaceImage(), dimensions, np.int8)
+    skelImage_data = _from_java(skeleton.getMedialCurveImage(), dimensions, np.int8)
 
 
     # adapt header max for each image so that correct max is displayed
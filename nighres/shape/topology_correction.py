@@ -4,10 +4,16 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
+@cached
 def topology_correction(image, shape_type,
                     connectivity='wcs', propagation='object->background',
                     minimum_distance=0.00001, topology_lut_dir=None,
@@ -84,8 +90,8 @@ def topology_correction(image, shape_type,
                                        rootfile=image,
                                        suffix='tpc-obj'))
         if overwrite is False \
-            and os.path.isfile(corrected_file) \
-            and os.path.isfile(corrected_obj_file) :
+            and _is_cached(corrected_file) \
+            and _is_cached(corrected_obj_file) :
 
             print("skip computation (use existing results)")
             output = {'corrected': corrected_file,
@@ -93,11 +99,8 @@ def topology_correction(image, shape_type,
             return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.ShapeTopologyCorrection2()
@@ -106,15 +109,14 @@ def topology_correction(image, shape_type,
     img = load_volume(image)
     hdr = img.header
     aff = img.affine
-    data = img.get_data()
+    data = _volume_data(img, 'float')
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = data.shape
 
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
     algorithm.setDimensions(dimensions[0], dimensions[1], dimensions[2])
 
-    algorithm.setShapeImage(nighresjava.JArray('float')(
-                            (data.flatten('F')).astype(float)))
+    algorithm.setShapeImage(_to_java(data, 'float'))
 
     algorithm.setShapeImageType(shape_type)
 
@@ -126,6 +128,7 @@ def topology_correction(image, shape_type,
     algorithm.setMinimumDistance(minimum_distance)
 
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -135,17 +138,16 @@ def topology_correction(image, shape_type,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
-    corrected_data = np.reshape(np.array(algorithm.getCorrectedImage(),
-                               dtype=np.float32), dimensions, 'F')
+    corrected_data = _from_java(algorithm.getCorrectedImage(), dimensions)
 
     hdr['cal_min'] = np.nanmin(corrected_data)
     hdr['cal_max'] = np.nanmax(corrected_data)
     corrected = nb.Nifti1Image(corrected_data, aff, hdr)
 
-    corrected_obj_data = np.reshape(np.array(algorithm.getCorrectedObjectImage(),
-                               dtype=np.int32), dimensions, 'F')
+    corrected_obj_data = _from_java(algorithm.getCorrectedObjectImage(), dimensions, np.int32)
 
     hdr['cal_min'] = np.nanmin(corrected_obj_data)
     hdr['cal_max'] = np.nanmax(corrected_obj_data)
@@ -1 +1,5 @@
-from nighres.statistics.segmentation_statistics import segmentation_statistics
+from nighres._lazy import lazy_functions
+
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'segmentation_statistics': '.segmentation_statistics'})
@@ -4,10 +4,14 @@ import os
 import sys
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled, phase
+from ..jvm import start_jvm
 from ..utils import _output_dir_4saving, _fname_4saving, \
-                    _check_topology_lut_dir, _check_available_memory
+                    _check_topology_lut_dir, _to_java, \
+                    _from_java, _volume_data
 
 
+@profiled
 def segmentation_statistics(segmentation, intensity=None, template=None,
                             statistics=None, output_csv=None,
                             atlas=None, skip_first=True, ignore_zero=True,
@@ -98,17 +102,14 @@ def segmentation_statistics(segmentation, intensity=None, template=None,
         csv_file = output_csv
 
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     stats = nighresjava.StatisticsSegmentation()
 
     # load first image and use it to set dimensions and resolution
     img = load_volume(segmentation)
-    data = img.get_data()
+    data = _volume_data(img, 'int')
     affine = img.affine
     header = img.header
     resolution = [x.item() for x in header.get_zooms()]
@@ -117,21 +118,18 @@ def segmentation_statistics(segmentation, intensity=None, template=None,
     stats.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     stats.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    stats.setSegmentationImage(nighresjava.JArray('int')(
-                                    (data.flatten('F')).astype(int).tolist()))
+    stats.setSegmentationImage(_to_java(data, 'int'))
     stats.setSegmentationName(_fname_4saving(module=__name__,rootfile=segmentation))
 
     # other input images, if any
     if intensity is not None:
-        data = load_volume(intensity).get_data()
-        stats.setIntensityImage(nighresjava.JArray('float')(
-                                    (data.flatten('F')).astype(float)))
+        data = _volume_data(load_volume(intensity), 'float')
+        stats.setIntensityImage(_to_java(data, 'float'))
         stats.setIntensityName(_fname_4saving(module=__name__,rootfile=intensity))
 
     if template is not None:
-        data = load_volume(template).get_data()
-        stats.setTemplateImage(nighresjava.JArray('int')(
-                                    (data.flatten('F')).astype(int).tolist()))
+        data = _volume_data(load_volume(template), 'int')
+        stats.setTemplateImage(_to_java(data, 'int'))
         stats.setTemplateName(_fname_4saving(module=__name__,rootfile=template))
 
     # set algorithm parameters
@@ -147,6 +145,7 @@ def segmentation_statistics(segmentation, intensity=None, template=None,
     stats.setSpreadsheetFile(csv_file)
 
     # execute the algorithm
+    phase('execute')
     try:
         stats.execute()
 
@@ -156,6 +155,7 @@ def segmentation_statistics(segmentation, intensity=None, template=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # reshape output to what nibabel likes
     output = False
@@ -164,8 +164,7 @@ def segmentation_statistics(segmentation, intensity=None, template=None,
             output=True
 
     if (output):
-        data = np.reshape(np.array(stats.getOutputImage(),
-                                       dtype=np.int32), dimensions, 'F')
+        data = _from_java(stats.getOutputImage(), dimensions, np.int32)
         header['cal_min'] = np.nanmin(data)
         header['cal_max'] = np.nanmax(data)
         output = nb.Nifti1Image(data, affine, header)
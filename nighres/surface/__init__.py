@@ -1,11 +1,14 @@
-from nighres.surface.probability_to_levelset import probability_to_levelset
-from nighres.surface.levelset_to_mesh import levelset_to_mesh
-from nighres.surface.levelset_to_probability import levelset_to_probability
-from nighres.surface.mesh_to_levelset import mesh_to_levelset
-from nighres.surface.surface_inflation import surface_inflation
-from nighres.surface.surface_mesh_mapping import surface_mesh_mapping
-from nighres.surface.surface_som_mapping import surface_som_mapping
-from nighres.surface.volume_som_mapping import volume_som_mapping
-from nighres.surface.parcellation_to_meshes import parcellation_to_meshes
-from nighres.surface.levelset_curvature import levelset_curvature
+from nighres._lazy import lazy_functions
 
+# functions are imported from their modules when first used
+lazy_functions(__name__, {
+    'probability_to_levelset': '.probability_to_levelset',
+    'levelset_to_mesh': '.levelset_to_mesh',
+    'levelset_to_probability': '.levelset_to_probability',
+    'mesh_to_levelset': '.mesh_to_levelset',
+    'surface_inflation': '.surface_inflation',
+    'surface_mesh_mapping': '.surface_mesh_mapping',
+    'surface_som_mapping': '.surface_som_mapping',
+    'volume_som_mapping': '.volume_som_mapping',
+    'parcellation_to_meshes': '.parcellation_to_meshes',
+    'levelset_curvature': '.levelset_curvature'})
@@ -3,9 +3,14 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
-from ..utils import _output_dir_4saving, _fname_4saving
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving, _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def levelset_curvature(levelset_image, distance=1.0,
                             save_data=False, overwrite=False, output_dir=None,
                             file_name=None):
@@ -61,8 +66,8 @@ def levelset_curvature(levelset_image, distance=1.0,
                                        suffix='curv-gauss'))
 
         if overwrite is False \
-            and os.path.isfile(mcurv_file) \
-            and os.path.isfile(gcurv_file) :
+            and _is_cached(mcurv_file) \
+            and _is_cached(gcurv_file) :
 
             print("skip computation (use existing results)")
             output = {'mcurv': mcurv_file, 'gcurv': gcurv_file}
@@ -70,19 +75,15 @@ def levelset_curvature(levelset_image, distance=1.0,
 
     # load the data
     lvl_img = load_volume(levelset_image)
-    lvl_data = lvl_img.get_data()
     hdr = lvl_img.header
     aff = lvl_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
-    dimensions = lvl_data.shape
+    dimensions = lvl_img.shape
 
     # algorithm
     # start virtual machine, if not already running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
     # create algorithm instance
     algorithm = nighresjava.LevelsetCurvature()
 
@@ -91,7 +92,7 @@ def levelset_curvature(levelset_image, distance=1.0,
 
     # load images and set dimensions and resolution
     input_image = load_volume(levelset_image)
-    data = input_image.get_data()
+    data = _volume_data(input_image, 'float')
     affine = input_image.get_affine()
     header = input_image.get_header()
     resolution = [x.item() for x in header.get_zooms()]
@@ -100,10 +101,10 @@ def levelset_curvature(levelset_image, distance=1.0,
     algorithm.setDimensions(dimensions[0], dimensions[1], dimensions[2])
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
 
-    algorithm.setLevelsetImage(nighresjava.JArray('float')(
-                               (data.flatten('F')).astype(float)))
+    algorithm.setLevelsetImage(_to_java(data, 'float'))
 
     # execute
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -113,14 +114,11 @@ def levelset_curvature(levelset_image, distance=1.0,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # Collect output
-    mcurv_data = np.reshape(np.array(
-                                    algorithm.getMeanCurvatureImage(),
-                                    dtype=np.float32), dimensions, 'F')
-    gcurv_data = np.reshape(np.array(
-                                    algorithm.getGaussCurvatureImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    mcurv_data = _from_java(algorithm.getMeanCurvatureImage(), dimensions)
+    gcurv_data = _from_java(algorithm.getGaussCurvatureImage(), dimensions)
 
     hdr['cal_min'] = np.nanmin(mcurv_data)
     hdr['cal_max'] = np.nanmax(mcurv_data)
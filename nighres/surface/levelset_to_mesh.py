@@ -4,9 +4,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume, load_mesh_geometry, save_mesh_geometry
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def levelset_to_mesh(levelset_image, connectivity="18/6", level=0.0,
                      inclusive=True, save_data=False, overwrite=False,
                      output_dir=None, file_name=None):
@@ -73,25 +79,22 @@ def levelset_to_mesh(levelset_image, connectivity="18/6", level=0.0,
                                        suffix='l2m-mesh',ext="vtk"))
 
         if overwrite is False \
-            and os.path.isfile(mesh_file) :
+            and _is_cached(mesh_file) :
 
             print("skip computation (use existing results)")
             output = {'result': mesh_file}
             return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.SurfaceLevelsetToMesh()
 
     # load the data
     lvl_img = load_volume(levelset_image)
-    lvl_data = lvl_img.get_data()
+    lvl_data = _volume_data(lvl_img, 'float')
     hdr = lvl_img.header
     aff = lvl_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
@@ -100,14 +103,14 @@ def levelset_to_mesh(levelset_image, connectivity="18/6", level=0.0,
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
     algorithm.setDimensions(dimensions[0], dimensions[1], dimensions[2])
 
-    algorithm.setLevelsetImage(nighresjava.JArray('float')(
-                            (lvl_data.flatten('F')).astype(float)))
+    algorithm.setLevelsetImage(_to_java(lvl_data, 'float'))
 
     algorithm.setConnectivity(connectivity)
     algorithm.setZeroLevel(level)
     algorithm.setInclusive(inclusive)
 
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -117,15 +120,12 @@ def levelset_to_mesh(levelset_image, connectivity="18/6", level=0.0,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
-    npt = int(np.array(algorithm.getPointList(), dtype=np.float32).shape[0]/3)
-    mesh_points = np.reshape(np.array(algorithm.getPointList(),
-                               dtype=np.float32), (npt,3), 'C')
+    mesh_points = _from_java(algorithm.getPointList(), (-1, 3), order='C')
 
-    nfc = int(np.array(algorithm.getTriangleList(), dtype=np.int32).shape[0]/3)
-    mesh_faces = np.reshape(np.array(algorithm.getTriangleList(),
-                               dtype=np.int32), (nfc,3), 'C')
+    mesh_faces = _from_java(algorithm.getTriangleList(), (-1, 3), np.int32, order='C')
 
     # create the mesh dictionary
     mesh = {"points": mesh_points, "faces": mesh_faces}
@@ -3,9 +3,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
+from ..profiling import profiled
+from ..cache import cached, _is_cached
+from ..tiling import tileable
 from ..utils import _output_dir_4saving, _fname_4saving
 
 
+@tileable(images=('levelset_image',), halo=0)
+@profiled
+@cached
 def levelset_to_probability(levelset_image, distance_mm=5,
                             save_data=False, overwrite=False, output_dir=None,
                             file_name=None):
@@ -56,7 +62,7 @@ def levelset_to_probability(levelset_image, distance_mm=5,
                                        suffix='l2p-proba'))
 
         if overwrite is False \
-            and os.path.isfile(proba_file) :
+            and _is_cached(proba_file) :
 
             print("skip computation (use existing results)")
             output = {'result': proba_file}
@@ -3,10 +3,17 @@ import sys
 import numpy as np
 import nibabel as nb
 import nighresjava
-from ..io import load_volume, save_volume, load_mesh_geometry, save_mesh_geometry
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..io import load_volume_header, save_volume, load_mesh_geometry, \
+                save_mesh_geometry
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java
 
 
+@profiled
+@cached
 def mesh_to_levelset(surface_mesh, reference_image, 
                      save_data=False, overwrite=False,
                      output_dir=None, file_name=None):
@@ -59,18 +66,15 @@ def mesh_to_levelset(surface_mesh, reference_image,
                                        suffix='m2l-lvl'))
 
         if overwrite is False \
-            and os.path.isfile(lvl_file) :
+            and _is_cached(lvl_file) :
 
             print("skip computation (use existing results)")
             output = {'result': lvl_file}
             return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.SurfaceMeshToLevelsetPseudoNormals()
@@ -78,14 +82,11 @@ def mesh_to_levelset(surface_mesh, reference_image,
     # load the data
     mesh = load_mesh_geometry(surface_mesh)
     
-    algorithm.setSurfacePoints(nighresjava.JArray('float')(
-                            (mesh['points'].flatten('C')).astype(float)))
-    algorithm.setSurfaceTriangles(nighresjava.JArray('int')(
-                            (mesh['faces'].flatten('C')).astype(int).tolist()))
+    algorithm.setSurfacePoints(_to_java(mesh['points'], 'float', order='C'))
+    algorithm.setSurfaceTriangles(_to_java(mesh['faces'], 'int', order='C'))
     
-    ref_img = load_volume(reference_image)
-    hdr = ref_img.header
-    aff = ref_img.affine
+    hdr = load_volume_header(reference_image)
+    aff = hdr.get_best_affine()
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = hdr.get_data_shape()
 
@@ -93,6 +94,7 @@ def mesh_to_levelset(surface_mesh, reference_image,
     algorithm.setDimensions(dimensions[0], dimensions[1], dimensions[2])
 
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -102,15 +104,15 @@ def mesh_to_levelset(surface_mesh, reference_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
-    lvl_data = np.reshape(np.array(algorithm.getLevelsetImage(),
-                                    dtype=np.float32), dimensions, 'F')
+    lvl_data = _from_java(algorithm.getLevelsetImage(), dimensions)
 
     # create the mesh dictionary
-    header['cal_min'] = np.nanmin(lvl_data)
-    header['cal_max'] = np.nanmax(lvl_data)
-    lvl = nb.Nifti1Image(lvl_data, affine, header)
+    hdr['cal_min'] = np.nanmin(lvl_data)
+    hdr['cal_max'] = np.nanmax(lvl_data)
+    lvl = nb.Nifti1Image(lvl_data, aff, hdr)
 
     if save_data:
         save_volume(lvl_file, lvl)
@@ -4,9 +4,15 @@ import numpy
 import nibabel
 import nighresjava
 from ..io import load_volume, save_volume, load_mesh, save_mesh
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java
 
 
+@profiled
+@cached
 def parcellation_to_meshes(parcellation_image, connectivity="18/6", 
                      spacing = 0.0, smoothing=1.0,
                      save_data=False, overwrite=False,
@@ -68,7 +74,7 @@ def parcellation_to_meshes(parcellation_image, connectivity="18/6",
     
     # load the data
     p_img = load_volume(parcellation_image)
-    p_data = p_img.get_data()
+    p_data = numpy.asanyarray(p_img.dataobj)
     hdr = p_img.header
     aff = p_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
@@ -96,7 +102,7 @@ def parcellation_to_meshes(parcellation_image, connectivity="18/6",
             missing = False
             for num,label in enumerate(labels):
                 if num>0:
-                    if not os.path.isfile(mesh_files[num-1]) :
+                    if not _is_cached(mesh_files[num-1]) :
                         missing = True
 
             if not missing:
@@ -105,11 +111,8 @@ def parcellation_to_meshes(parcellation_image, connectivity="18/6",
                 return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.SurfaceLevelsetToMesh()
@@ -124,8 +127,7 @@ def parcellation_to_meshes(parcellation_image, connectivity="18/6",
         if num>0:
             lvl_data = -1.0*(p_data==label) +1.0*(p_data!=label)
             
-            algorithm.setLevelsetImage(nighresjava.JArray('float')(
-                                    (lvl_data.flatten('F')).astype(float)))
+            algorithm.setLevelsetImage(_to_java(lvl_data, 'float'))
     
             algorithm.setConnectivity(connectivity)
             algorithm.setZeroLevel(0.0)
@@ -133,6 +135,7 @@ def parcellation_to_meshes(parcellation_image, connectivity="18/6",
             algorithm.setSmoothing(smoothing)
 
             # execute class
+            phase('execute')
             try:
                 algorithm.execute()
     
@@ -142,15 +145,13 @@ def parcellation_to_meshes(parcellation_image, connectivity="18/6",
                 print(sys.exc_info()[0])
                 raise
                 return
-    
+            phase('from_java')
+
             # collect outputs
-            npt = int(numpy.array(algorithm.getPointList(), dtype=numpy.float32).shape[0]/3)
-            mesh_points = numpy.reshape(numpy.array(algorithm.getPointList(),
-                                   dtype=numpy.float32), (npt,3), 'C')
+            mesh_points = _from_java(algorithm.getPointList(), (-1, 3), order='C')
+            npt = mesh_points.shape[0]
     
-            nfc = int(numpy.array(algorithm.getTriangleList(), dtype=numpy.int32).shape[0]/3)
-            mesh_faces = numpy.reshape(numpy.array(algorithm.getTriangleList(),
-                                   dtype=numpy.int32), (nfc,3), 'C')
+            mesh_faces = _from_java(algorithm.getTriangleList(), (-1, 3), numpy.int32, order='C')
     
             mesh_label = label*numpy.ones((npt,1))
     
@@ -4,9 +4,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_volume, save_volume
-from ..utils import _output_dir_4saving, _fname_4saving, _check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving, \
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def probability_to_levelset(probability_image, mask_image=None,
                             save_data=False, overwrite=False, output_dir=None,
                             file_name=None):
@@ -61,38 +67,33 @@ def probability_to_levelset(probability_image, mask_image=None,
                                        suffix='p2l-surf'))
 
         if overwrite is False \
-            and os.path.isfile(levelset_file) :
+            and _is_cached(levelset_file) :
 
             print("skip computation (use existing results)")
             output = {'result': levelset_file}
             return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     prob2level = nighresjava.SurfaceProbabilityToLevelset()
 
     # load the data
     prob_img = load_volume(probability_image)
-    prob_data = prob_img.get_data()
+    prob_data = _volume_data(prob_img, 'float')
     hdr = prob_img.header
     aff = prob_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = prob_data.shape
 
     # set parameters from input data
-    prob2level.setProbabilityImage(nighresjava.JArray('float')(
-                                    (prob_data.flatten('F')).astype(float)))
+    prob2level.setProbabilityImage(_to_java(prob_data, 'float'))
     
     if (mask_image is not None):
-        mask_data = load_volume(mask_image).get_data()
-        prob2level.setMaskImage(nighresjava.JArray('int')(
-                                    (mask_data.flatten('F')).astype(int).tolist()))
+        mask_data = _volume_data(load_volume(mask_image), 'int')
+        prob2level.setMaskImage(_to_java(mask_data, 'int'))
         
     if len(dimensions)>2:
         prob2level.setResolutions(resolution[0], resolution[1], resolution[2])
@@ -102,6 +103,7 @@ def probability_to_levelset(probability_image, mask_image=None,
         prob2level.setDimensions(dimensions[0], dimensions[1], 1)
 
     # execute class
+    phase('execute')
     try:
         prob2level.execute()
 
@@ -111,10 +113,10 @@ def probability_to_levelset(probability_image, mask_image=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
-    levelset_data = np.reshape(np.array(prob2level.getLevelSetImage(),
-                               dtype=np.float32), dimensions, 'F')
+    levelset_data = _from_java(prob2level.getLevelSetImage(), dimensions)
 
     hdr['cal_max'] = np.nanmax(levelset_data)
     levelset = nb.Nifti1Image(levelset_data, aff, hdr)
@@ -4,9 +4,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_mesh, save_mesh
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java
 
 
+@profiled
+@cached
 def surface_inflation(surface_mesh, step_size=0.75, max_iter=2000, max_curv=10.0,
                         save_data=False, overwrite=False, output_dir=None,
                         file_name=None):
@@ -63,18 +69,15 @@ def surface_inflation(surface_mesh, step_size=0.75, max_iter=2000, max_curv=10.0
                                        suffix='infl-mesh',ext='vtk'))
 
         if overwrite is False \
-            and os.path.isfile(infl_file) :
+            and _is_cached(infl_file) :
             
             print("skip computation (use existing results)")
             output = {'result': infl_file}
             return output
                         
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.SurfaceInflation()
@@ -82,16 +85,15 @@ def surface_inflation(surface_mesh, step_size=0.75, max_iter=2000, max_curv=10.0
     # load the data
     orig_mesh = load_mesh(surface_mesh)
     
-    algorithm.setSurfacePoints(nighresjava.JArray('float')(
-                            (orig_mesh['points'].flatten('C')).astype(float)))
-    algorithm.setSurfaceTriangles(nighresjava.JArray('int')(
-                            (orig_mesh['faces'].flatten('C')).astype(int).tolist()))
+    algorithm.setSurfacePoints(_to_java(orig_mesh['points'], 'float', order='C'))
+    algorithm.setSurfaceTriangles(_to_java(orig_mesh['faces'], 'int', order='C'))
     
     algorithm.setStepSize(step_size)
     algorithm.setMaxIter(max_iter)
     algorithm.setMaxCurv(max_curv)
     
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -101,22 +103,17 @@ def surface_inflation(surface_mesh, step_size=0.75, max_iter=2000, max_curv=10.0
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
     print("collect outputs")
     
-    npt = int(np.array(algorithm.getInflatedSurfacePoints(), 
-                dtype=np.float32).shape[0]/3)
-    nfc = int(np.array(algorithm.getInflatedSurfaceTriangles(), 
-                dtype=np.int32).shape[0]/3) 
     
     print("surface...")
-    orig_points = np.reshape(np.array(algorithm.getInflatedSurfacePoints(),
-                               dtype=np.float32), (npt,3), 'C')
-    orig_faces = np.reshape(np.array(algorithm.getInflatedSurfaceTriangles(),
-                               dtype=np.int32), (nfc,3), 'C')
-    orig_data = np.reshape(np.array(algorithm.getInflatedSurfaceValues(),
-                               dtype=np.float32), (npt), 'F')
+    orig_points = _from_java(algorithm.getInflatedSurfacePoints(), (-1, 3), order='C')
+    npt = orig_points.shape[0]
+    orig_faces = _from_java(algorithm.getInflatedSurfaceTriangles(), (-1, 3), np.int32, order='C')
+    orig_data = _from_java(algorithm.getInflatedSurfaceValues(), (npt))
  
      
     # create the mesh dictionary
@@ -3,9 +3,15 @@ import sys
 import numpy as np
 import nighresjava
 from ..io import load_volume, save_volume, load_mesh_geometry, load_mesh, save_mesh
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def surface_mesh_mapping(intensity_image, surface_mesh, inflated_mesh=None,
                          mapping_method="closest_point",
                          save_data=False, overwrite=False, output_dir=None,
@@ -70,15 +76,15 @@ def surface_mesh_mapping(intensity_image, surface_mesh, inflated_mesh=None,
                                                rootfile=intensity_image,
                                                suffix='map-inf', ext="vtk"))
 
-        if (overwrite is False and os.path.isfile(orig_file) and
-                os.path.isfile(inf_file)):
+        if (overwrite is False and _is_cached(orig_file) and
+                _is_cached(inf_file)):
 
             print("skip computation (use existing results)")
             output = {'original': orig_file,
                       'inflated': inf_file}
             return output
 
-        elif (overwrite is False and os.path.isfile(orig_file) and
+        elif (overwrite is False and _is_cached(orig_file) and
                 inflated_mesh is None):
 
             print("skip computation (use existing results)")
@@ -87,18 +93,15 @@ def surface_mesh_mapping(intensity_image, surface_mesh, inflated_mesh=None,
             return output
 
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.CortexSurfaceMeshMapping()
 
     # load the data
     int_img = load_volume(intensity_image)
-    int_data = int_img.get_data()
+    int_data = _volume_data(int_img, 'float')
     hdr = int_img.header
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = int_data.shape
@@ -112,30 +115,24 @@ def surface_mesh_mapping(intensity_image, surface_mesh, inflated_mesh=None,
                                 dimensions[3])
         nt = dimensions[3]
 
-    algorithm.setIntensityImage(nighresjava.JArray('float')(
-                            (int_data.flatten('F')).astype(float)))
+    algorithm.setIntensityImage(_to_java(int_data, 'float'))
 
     orig_mesh = load_mesh(surface_mesh)
 
-    algorithm.setOriginalSurfacePoints(nighresjava.JArray('float')(
-                            (orig_mesh['points'].flatten('C')).astype(float)))
-    algorithm.setOriginalSurfaceTriangles(nighresjava.JArray('int')(
-                            (orig_mesh['faces'].flatten(
-                                'C')).astype(int).tolist()))
+    algorithm.setOriginalSurfacePoints(_to_java(orig_mesh['points'], 'float', order='C'))
+    algorithm.setOriginalSurfaceTriangles(_to_java(orig_mesh['faces'], 'int', order='C'))
 
     if inflated_mesh is not None:
         inf_mesh = load_mesh(inflated_mesh)
 
-        algorithm.setInflatedSurfacePoints(nighresjava.JArray('float')(
-                            (inf_mesh['points'].flatten('C')).astype(float)))
-        algorithm.setInflatedSurfaceTriangles(nighresjava.JArray('int')(
-                            (inf_mesh['faces'].flatten(
-                                'C')).astype(int).tolist()))
+        algorithm.setInflatedSurfacePoints(_to_java(inf_mesh['points'], 'float', order='C'))
+        algorithm.setInflatedSurfaceTriangles(_to_java(inf_mesh['faces'], 'int', order='C'))
 
     algorithm.setSurfaceConvention("voxels")
     algorithm.setMappingMethod(mapping_method)
 
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -145,33 +142,20 @@ def surface_mesh_mapping(intensity_image, surface_mesh, inflated_mesh=None,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
-    npt = int(np.array(algorithm.getMappedOriginalSurfacePoints(),
-                       dtype=np.float32).shape[0]/3)
-    nfc = int(np.array(algorithm.getMappedOriginalSurfaceTriangles(),
-                       dtype=np.int32).shape[0]/3)
-
-    orig_points = np.reshape(np.array(
-                            algorithm.getMappedOriginalSurfacePoints(),
-                            dtype=np.float32), (npt, 3), 'C')
-    orig_faces = np.reshape(np.array(
-                            algorithm.getMappedOriginalSurfaceTriangles(),
-                            dtype=np.int32), (nfc, 3), 'C')
-    orig_data = np.reshape(np.array(
-                           algorithm.getMappedOriginalSurfaceValues(),
-                           dtype=np.float32), (npt, nt), 'C')
+
+    orig_points = _from_java(algorithm.getMappedOriginalSurfacePoints(), (-1, 3), order='C')
+    npt = orig_points.shape[0]
+    orig_faces = _from_java(algorithm.getMappedOriginalSurfaceTriangles(), (-1, 3), np.int32, order='C')
+    nfc = orig_faces.shape[0]
+    orig_data = _from_java(algorithm.getMappedOriginalSurfaceValues(), (npt, nt), order='C')
 
     if inflated_mesh is not None:
-        inf_points = np.reshape(np.array(
-                                algorithm.getMappedInflatedSurfacePoints(),
-                                dtype=np.float32), (npt, 3), 'C')
-        inf_faces = np.reshape(np.array(
-                               algorithm.getMappedInflatedSurfaceTriangles(),
-                               dtype=np.int32), (nfc, 3), 'C')
-        inf_data = np.reshape(np.array(
-                              algorithm.getMappedInflatedSurfaceValues(),
-                              dtype=np.float32), (npt, nt), 'C')
+        inf_points = _from_java(algorithm.getMappedInflatedSurfacePoints(), (npt, 3), order='C')
+        inf_faces = _from_java(algorithm.getMappedInflatedSurfaceTriangles(), (nfc, 3), np.int32, order='C')
+        inf_data = _from_java(algorithm.getMappedInflatedSurfaceValues(), (npt, nt), order='C')
 
     # create the mesh dictionary
     mapped_orig_mesh = {"points": orig_points, "faces": orig_faces,
@@ -4,9 +4,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_mesh, save_mesh
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java
 
 
+@profiled
+@cached
 def surface_som_mapping(surface_mesh, mask_zeros=False,
                             som_size=100, learning_time=100000, total_time=500000,
                             save_data=False, overwrite=False, output_dir=None,
@@ -72,7 +78,7 @@ def surface_som_mapping(surface_mesh, mask_zeros=False,
                                        suffix='som-grid',ext='vtk'))
 
         if overwrite is False \
-            and os.path.isfile(orig_file) and os.path.isfile(som_file) :
+            and _is_cached(orig_file) and _is_cached(som_file) :
             
             print("skip computation (use existing results)")
             output = {'original': orig_file, 
@@ -80,11 +86,8 @@ def surface_som_mapping(surface_mesh, mask_zeros=False,
             return output
                         
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.SomSurfaceCoordinates()
@@ -92,13 +95,10 @@ def surface_som_mapping(surface_mesh, mask_zeros=False,
     # load the data
     orig_mesh = load_mesh(surface_mesh)
     
-    algorithm.setSurfacePoints(nighresjava.JArray('float')(
-                            (orig_mesh['points'].flatten('C')).astype(float)))
-    algorithm.setSurfaceTriangles(nighresjava.JArray('int')(
-                            (orig_mesh['faces'].flatten('C')).astype(int).tolist()))
+    algorithm.setSurfacePoints(_to_java(orig_mesh['points'], 'float', order='C'))
+    algorithm.setSurfaceTriangles(_to_java(orig_mesh['faces'], 'int', order='C'))
     if orig_mesh['data'] is not None:
-        algorithm.setSurfaceValues(nighresjava.JArray('float')(
-                            (orig_mesh['data'].flatten('C')).astype(float)))
+        algorithm.setSurfaceValues(_to_java(orig_mesh['data'], 'float', order='C'))
     
     algorithm.setMaskZeroValues(mask_zeros)
     algorithm.setSomDimension(2)
@@ -107,6 +107,7 @@ def surface_som_mapping(surface_mesh, mask_zeros=False,
     algorithm.setTotalTime(total_time)
     
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -116,22 +117,16 @@ def surface_som_mapping(surface_mesh, mask_zeros=False,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
     print("collect outputs")
     
-    npt = int(np.array(algorithm.getMappedSurfacePoints(), 
-                dtype=np.float32).shape[0]/3)
-    nfc = int(np.array(algorithm.getMappedSurfaceTriangles(), 
-                dtype=np.int32).shape[0]/3) 
-    
     print("surface...")
-    orig_points = np.reshape(np.array(algorithm.getMappedSurfacePoints(),
-                               dtype=np.float32), (npt,3), 'C')
-    orig_faces = np.reshape(np.array(algorithm.getMappedSurfaceTriangles(),
-                               dtype=np.int32), (nfc,3), 'C')
-    orig_data = np.reshape(np.array(algorithm.getMappedSurfaceValues(),
-                               dtype=np.float32), (npt,2), 'F')
+    orig_points = _from_java(algorithm.getMappedSurfacePoints(), (-1, 3), order='C')
+    npt = orig_points.shape[0]
+    orig_faces = _from_java(algorithm.getMappedSurfaceTriangles(), (-1, 3), np.int32, order='C')
+    orig_data = _from_java(algorithm.getMappedSurfaceValues(), (npt,2))
  
     #    som_points = np.reshape(np.array(algorithm.getMappedSurfacePoints(),
     #                               dtype=np.float32), (npt,3), 'C')
@@ -140,18 +135,12 @@ def surface_som_mapping(surface_mesh, mask_zeros=False,
     #    som_data = np.reshape(np.array(algorithm.getMappedSurfaceValues(),
     #                               dtype=np.float32), (npt,2), 'C')
  
-    npt2 = int(np.array(algorithm.getMappedSomPoints(), 
-                dtype=np.float32).shape[0]/3)
-    nfc2 = int(np.array(algorithm.getMappedSomTriangles(), 
-                dtype=np.int32).shape[0]/3)  
-    
+    som_points = _from_java(algorithm.getMappedSomPoints(), (-1, 3), order='C')
+    npt2 = som_points.shape[0]
+    som_faces = _from_java(algorithm.getMappedSomTriangles(), (-1, 3), np.int32, order='C')
+    nfc2 = som_faces.shape[0]
     print("som... ("+str(npt2)+", "+str(nfc2)+")")
-    som_points = np.reshape(np.array(algorithm.getMappedSomPoints(),
-                               dtype=np.float32), (npt2,3), 'C')
-    som_faces = np.reshape(np.array(algorithm.getMappedSomTriangles(),
-                               dtype=np.int32), (nfc2,3), 'C')
-    som_data = np.reshape(np.array(algorithm.getMappedSomValues(),
-                               dtype=np.float32), (npt2,2), 'F')
+    som_data = _from_java(algorithm.getMappedSomValues(), (npt2,2))
     
     # create the mesh dictionary
     mapped_orig_mesh = {"points": orig_points, "faces": orig_faces, 
@@ -4,9 +4,15 @@ import numpy as np
 import nibabel as nb
 import nighresjava
 from ..io import load_mesh, save_mesh, load_volume, save_volume
-from ..utils import _output_dir_4saving, _fname_4saving,_check_available_memory
+from ..profiling import profiled, phase
+from ..cache import cached, _is_cached
+from ..jvm import start_jvm
+from ..utils import _output_dir_4saving, _fname_4saving,\
+                    _to_java, _from_java, _volume_data
 
 
+@profiled
+@cached
 def volume_som_mapping(proba_image,
                             som_size=100, learning_time=100000, total_time=500000,
                             save_data=False, overwrite=False, output_dir=None,
@@ -69,7 +75,7 @@ def volume_som_mapping(proba_image,
                                        suffix='som-grid',ext='vtk'))
 
         if overwrite is False \
-            and os.path.isfile(map_file) and os.path.isfile(som_file) :
+            and _is_cached(map_file) and _is_cached(som_file) :
             
             print("skip computation (use existing results)")
             output = {'map': map_file, 
@@ -77,25 +83,21 @@ def volume_som_mapping(proba_image,
             return output
                         
     # start virtual machine if not running
-    try:
-        mem = _check_available_memory()
-        nighresjava.initVM(initialheap=mem['init'], maxheap=mem['max'])
-    except ValueError:
-        pass
+    start_jvm()
+    phase('to_java')
 
     # initiate class
     algorithm = nighresjava.SomVolumeCoordinates()
 
     # load the data
     prob_img = load_volume(proba_image)
-    prob_data = prob_img.get_data()
+    prob_data = _volume_data(prob_img, 'float')
     hdr = prob_img.header
     aff = prob_img.affine
     resolution = [x.item() for x in hdr.get_zooms()]
     dimensions = prob_data.shape
     
-    algorithm.setProbaImage(nighresjava.JArray('float')(
-                                    (prob_data.flatten('F')).astype(float)))
+    algorithm.setProbaImage(_to_java(prob_data, 'float'))
     
     algorithm.setResolutions(resolution[0], resolution[1], resolution[2])
     algorithm.setDimensions(dimensions[0], dimensions[1], dimensions[2])
@@ -106,6 +108,7 @@ def volume_som_mapping(proba_image,
     algorithm.setTotalTime(total_time)
     
     # execute class
+    phase('execute')
     try:
         algorithm.execute()
 
@@ -115,30 +118,25 @@ def volume_som_mapping(proba_image,
         print(sys.exc_info()[0])
         raise
         return
+    phase('from_java')
 
     # collect outputs
     print("collect outputs")
 
     print("volume...")
     dimensions = (dimensions[0],dimensions[1],dimensions[2],2)
-    map_data = np.reshape(np.array(algorithm.getMappedImage(),
-                               dtype=np.float32), dimensions, 'F')
+    map_data = _from_java(algorithm.getMappedImage(), dimensions)
 
     hdr['cal_max'] = np.nanmax(map_data)
     mapped_img = nb.Nifti1Image(map_data, aff, hdr)
 
-    npt = int(np.array(algorithm.getMappedSomPoints(), 
-                dtype=np.float32).shape[0]/3)
-    nfc = int(np.array(algorithm.getMappedSomTriangles(), 
-                dtype=np.int32).shape[0]/3)  
     
+    som_points = _from_java(algorithm.getMappedSomPoints(), (-1, 3), order='C')
+    npt = som_points.shape[0]
+    som_faces = _from_java(algorithm.getMappedSomTriangles(), (-1, 3), np.int32, order='C')
+    nfc = som_faces.shape[0]
     print("som... ("+str(npt)+", "+str(nfc)+")")
-    som_points = np.reshape(np.array(algorithm.getMappedSomPoints(),
-                               dtype=np.float32), (npt,3), 'C')
-    som_faces = np.reshape(np.array(algorithm.getMappedSomTriangles(),
-                               dtype=np.int32), (nfc,3), 'C')
-    som_data = np.reshape(np.array(algorithm.getMappedSomValues(),
-                               dtype=np.float32), (npt,2), 'F')
+    som_data = _from_java(algorithm.getMappedSomValues(), (npt,2))
     
     # create the mesh dictionary
     mapped_som_mesh = {"points": som_points, "faces": som_faces, 
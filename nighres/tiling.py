@@ -0,0 +1,203 @@
+import inspect
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import nibabel as nb
+from nighres.batch import _init_worker, _worker_settings
+from nighres.io import load_volume
+
+
+def tileable(images, halo):
+    """
+    Declare that a nighres function can run block by block with
+    :func:`tiled`
+
+    Parameters
+    ----------
+    images: tuple of str
+        Arguments of the function that are volumes to split into blocks,
+        the first one defines the geometry
+    halo: int or function
+        Overlap needed around each block, in voxels, for the outputs of the
+        block core to be the same as without tiling. Either a number, or a
+        function of the call arguments (as a dict) and the voxel sizes of
+        the first image returning that number
+
+    Returns
+    ----------
+    function
+        Decorator returning the function unchanged, with the declaration
+        stored in its tiling attribute
+    """
+    def decorator(func):
+        func.tiling = {'images': tuple(images), 'halo': halo}
+        return func
+    return decorator
+
+
+def _blocks(shape, tile_shape, halo):
+    # Core and extended (core plus halo, clipped to the volume) extents of
+    # each block, as lists of (start, stop) per dimension
+    ranges = [[(start, min(start + size, dim))
+               for start in range(0, dim, size)]
+              for dim, size in zip(shape, tile_shape)]
+    for core in itertools.product(*ranges):
+        extended = [(max(start - halo, 0), min(stop + halo, dim))
+                    for (start, stop), dim in zip(core, shape)]
+        yield core, extended
+
+
+def _block_image(image, extended):
+    # Block of an image (4th dimension kept whole), with the affine of its
+    # first voxel so that it stays in place in world coordinates
+    slices = tuple(slice(start, stop) for start, stop in extended)
+    data = np.asanyarray(image.dataobj[slices])
+    affine = image.affine.copy()
+    affine[:3, 3] = image.affine[:3, :3].dot(
+                        [start for start, stop in extended]) \
+        + image.affine[:3, 3]
+    block = nb.Nifti1Image(data, affine, image.header)
+    block.set_data_dtype(image.get_data_dtype())
+    return block
+
+
+def _run_block(func, kwargs):
+    # Run the function on one block, keeping only the image outputs as
+    # arrays (other outputs cannot be stitched)
+    result = func(**kwargs)
+    return {key: np.asanyarray(value.dataobj) for key, value in result.items()
+            if isinstance(value, nb.spatialimages.SpatialImage)}
+
+
+def tiled(func, tile_shape=256, workers=1, halo=None, tmp_dir=None,
+          **kwargs):
+    """
+    Run a nighres function on overlapping blocks of its input volumes and
+    stitch the results, so that volumes larger than the JVM heap can be
+    processed in bounded memory
+
+    The volumes are split into blocks of tile_shape voxels, each extended by
+    the halo the function declares (see :func:`tileable`). The function runs
+    on each extended block, in parallel worker processes, and the core of
+    each block output is copied into the full output. Uncompressed input
+    files are memory-mapped and read block by block; compressed (.nii.gz)
+    input files cannot be, and are read into memory in full.
+
+    Parameters
+    ----------
+    func: function
+        Tileable nighres function, e.g.
+        nighres.filtering.total_variation_filtering
+    tile_shape: int or tuple of int, optional
+        Size of the block cores in voxels along the three spatial
+        dimensions (default is 256)
+    workers: int, optional
+        Number of blocks processed at the same time, each in its own
+        process with its own JVM (default is 1, i.e. one block at a time in
+        this process)
+    halo: int, optional
+        Overlap between blocks in voxels, overriding the one declared by
+        the function
+    tmp_dir: str, optional
+        Directory where the stitched outputs are memory-mapped, rather
+        than held in memory
+    **kwargs
+        Arguments of func. The outputs are returned, not saved (save_data
+        is not supported), use :func:`nighres.io.save_volume` to save them
+
+    Returns
+    ----------
+    dict
+        Image outputs of func, stitched to the size of the input
+
+    Notes
+    ----------
+    Outputs that depend on the whole volume, such as connected component
+    labels or global intensity normalisations, are computed per block and
+    may therefore differ from those of a single run.
+    """
+    tiling = getattr(func, 'tiling', None)
+    if tiling is None:
+        raise ValueError("{0} does not declare how to process it by blocks "
+                         "(see nighres.tiling.tileable)".format(func.__name__))
+    if kwargs.get('save_data'):
+        raise ValueError("save_data is not supported when tiling, save the "
+                         "stitched outputs with nighres.io.save_volume")
+    arguments = inspect.signature(func).bind(**kwargs)
+    arguments.apply_defaults()
+    arguments = dict(arguments.arguments)
+
+    # only the blocks (halo included) of the mapped files are read
+    images = {name: load_volume(arguments[name], mmap=True)
+              for name in tiling['images'] if arguments.get(name) is not None}
+    reference = images[tiling['images'][0]]
+    shape = reference.shape[:3]
+    if np.isscalar(tile_shape):
+        tile_shape = (int(tile_shape),) * 3
+    if halo is None:
+        halo = tiling['halo']
+        if callable(halo):
+            resolution = [float(x) for x in reference.header.get_zooms()[:3]]
+            halo = halo(arguments, resolution)
+    halo = int(halo)
+
+    outputs = {}
+
+    def stitch(core, extended, block):
+        for key, data in block.items():
+            if key not in outputs:
+                full_shape = tuple(shape) + data.shape[3:]
+                if tmp_dir is None:
+                    outputs[key] = np.zeros(full_shape, dtype=data.dtype)
+                else:
+                    outputs[key] = np.lib.format.open_memmap(
+                        os.path.join(tmp_dir, '{0}_{1}.npy'.format(
+                            func.__name__, key)),
+                        mode='w+', dtype=data.dtype, shape=full_shape)
+            inside = tuple(slice(start - ext_start, stop - ext_start)
+                           for (start, stop), (ext_start, ext_stop)
+                           in zip(core, extended))
+            target = tuple(slice(start, stop) for start, stop in core)
+            outputs[key][target] = data[inside]
+
+    def block_kwargs(extended):
+        block = dict(kwargs, save_data=False)
+        for name, image in images.items():
+            block[name] = _block_image(image, extended)
+        return block
+
+    blocks = list(_blocks(shape, tile_shape, halo))
+    print("\nTiling {0}: {1} blocks of {2} voxels with a halo of {3}".format(
+          func.__name__, len(blocks), tile_shape, halo))
+    if workers <= 1:
+        for core, extended in blocks:
+            stitch(core, extended, _run_block(func, block_kwargs(extended)))
+    else:
+        # each worker gets its share of the default JVM heap
+        settings = _worker_settings(
+            JVM_PROCESSES=workers,
+            JVM_THREADS=max((os.cpu_count() or 1) // workers, 1))
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(settings,)) as pool:
+            running = {}
+            for core, extended in blocks:
+                # bound the number of blocks held in memory
+                while len(running) >= 2 * workers:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stitch(*running.pop(future), future.result())
+                running[pool.submit(_run_block, func,
+                                    block_kwargs(extended))] = \
+                    (core, extended)
+            for future in list(running):
+                stitch(*running.pop(future), future.result())
+
+    header = reference.header.copy()
+    results = {}
+    for key, data in outputs.items():
+        results[key] = nb.Nifti1Image(data, reference.affine, header)
+    return results
@@ -1,7 +1,21 @@
 import os
 import warnings
-import psutil
+import numpy as np
+import nibabel as nb
 from nighres.global_settings import TOPOLOGY_LUT_DIR, ATLAS_DIR, DEFAULT_ATLAS
+from nighres.io.io_volume import _volume_filename
+from nighres.jvm import _nighresjava
+
+# NumPy element type of the Java primitive arrays passed to nighresjava.
+# Dtype policy: volumes go to Java as float32 (or int32 for labels and
+# masks) straight from the image data, without a float64 intermediate, and
+# come back as float32 unless the module asks for another type.
+_JAVA_DTYPES = {'float': np.float32, 'int': np.int32, 'double': np.float64,
+                'byte': np.int8}
+
+# elements copied per bulk transfer between NumPy and Java, bounds the
+# transient byte buffers to 64 MB
+_JAVA_CHUNK = 1 << 24
 
 
 def _output_dir_4saving(output_dir=None, rootfile=None):
@@ -160,8 +174,8 @@ def _fname_4saving(file_name=None, rootfile=None, suffix=None, ext=None, module=
     else:
         fullname = base + '.' + ext
 
-    if fullname.endswith(".gz"):
-        fullname = fullname[0:len(fullname) - 3]
+    # NIfTI outputs follow global_settings.SAVE_COMPRESSION
+    fullname = _volume_filename(fullname)
 
     return fullname
 
@@ -197,9 +211,117 @@ def _check_atlas_file(atlas_file):
     return atlas_file
 
 
-def _check_available_memory():
-
-    init_memory = str(int(round(0.25*psutil.virtual_memory()[1])))
-    max_memory = str(int(round(0.95*psutil.virtual_memory()[1])))
-
-    return {"init": init_memory, "max": max_memory}
+def _nio_buffers(nighresjava):
+    # java.nio classes for bulk copies, if the nighresjava build wraps them
+    if nighresjava is None or \
+            not hasattr(nighresjava, 'ByteBuffer') or \
+            not hasattr(nighresjava, 'ByteOrder'):
+        return None
+    return nighresjava.ByteBuffer, nighresjava.ByteOrder.nativeOrder()
+
+
+def _java_type(jarray, nighresjava):
+    # Element type of a Java primitive array, None for other objects
+    for jtype in ('float', 'int', 'double', 'byte'):
+        if isinstance(jarray, nighresjava.JArray(jtype)):
+            return jtype
+    return None
+
+
+def _volume_data(image, jtype='float'):
+    # Data of a loaded image in the NumPy type of the Java array it is meant
+    # for: scaled images are read directly as float32 (get_data() would
+    # return float64), labels and masks are truncated to int32. Unscaled
+    # data already of the right type is returned without a copy.
+    dtype = _JAVA_DTYPES[jtype]
+    if np.issubdtype(dtype, np.floating):
+        return image.get_fdata(caching='unchanged', dtype=dtype)
+    return np.asanyarray(image.dataobj).astype(dtype, copy=False)
+
+
+def _to_java(data, jtype='float', order='F'):
+    # Convert an array (or sequence, or loaded image, see _volume_data) into
+    # a Java primitive array, flattened in Fortran order as the nighresjava
+    # modules expect for volumes (use order='C' for mesh points and faces).
+    # The data is cast to the Java element type in at most one copy (none
+    # for contiguous data of the right type) and the buffer is copied into
+    # Java in bulk chunks through java.nio, instead of element by element.
+    if jtype not in _JAVA_DTYPES:
+        raise ValueError("jtype must be one of {0}, not {1}".format(
+                         ', '.join(_JAVA_DTYPES), jtype))
+    if isinstance(data, nb.spatialimages.SpatialImage):
+        data = _volume_data(data, jtype)
+    dtype = _JAVA_DTYPES[jtype]
+    array = np.asarray(data, dtype=dtype).ravel(order)
+    nighresjava = _nighresjava()
+    nio = _nio_buffers(nighresjava)
+    if nio is None:
+        # older nighresjava builds: a list is the fastest sequence for JCC
+        return nighresjava.JArray(jtype)(array.tolist())
+
+    byte_buffer, order = nio
+    jarray = nighresjava.JArray(jtype)(array.size)
+    for start in range(0, array.size, _JAVA_CHUNK):
+        chunk = array[start:start+_JAVA_CHUNK]
+        raw = byte_buffer.wrap(nighresjava.JArray('byte')(chunk.tobytes()))
+        raw = raw.order(order)
+        if jtype == 'float':
+            typed = raw.asFloatBuffer()
+        elif jtype == 'int':
+            typed = raw.asIntBuffer()
+        elif jtype == 'double':
+            typed = raw.asDoubleBuffer()
+        elif jtype == 'byte':
+            # the raw bytes are already the elements
+            typed = raw
+        typed.get(jarray, start, chunk.size)
+    return jarray
+
+
+def _from_java(jarray, shape=None, dtype=np.float32, order='F'):
+    # Copy a Java primitive array returned by a nighresjava getter into a new
+    # array of the given dtype and shape, reshaped in Fortran order for
+    # volumes (order='C' for mesh points and faces). Primitive arrays are
+    # copied in bulk chunks through java.nio into one preallocated buffer,
+    # other sequences element by element.
+    nighresjava = _nighresjava()
+    jtype = _java_type(jarray, nighresjava) if nighresjava is not None \
+        else None
+    nio = _nio_buffers(nighresjava)
+    array = None
+    if jtype is not None and nio is not None:
+        array = _copy_from_java(jarray, jtype, nio)
+    if array is None:
+        array = np.array(jarray, dtype=dtype)
+    array = array.astype(dtype, copy=False)
+    if shape is not None:
+        array = np.reshape(array, shape, order)
+    return array
+
+
+def _copy_from_java(jarray, jtype, nio):
+    # Bulk copy of a Java primitive array into a NumPy array of the same
+    # element type, None if this nighresjava build cannot read byte arrays
+    byte_buffer, order = nio
+    java_dtype = np.dtype(_JAVA_DTYPES[jtype])
+    size = len(jarray)
+    array = np.empty(size, dtype=java_dtype)
+    for start in range(0, size, _JAVA_CHUNK):
+        count = min(_JAVA_CHUNK, size - start)
+        if jtype == 'byte':
+            raw = jarray[start:start+count]
+        else:
+            raw = byte_buffer.allocate(count*java_dtype.itemsize)
+            raw = raw.order(order)
+            if jtype == 'float':
+                raw.asFloatBuffer().put(jarray, start, count)
+            elif jtype == 'int':
+                raw.asIntBuffer().put(jarray, start, count)
+            elif jtype == 'double':
+                raw.asDoubleBuffer().put(jarray, start, count)
+            raw = raw.array()
+        data = getattr(raw, 'string_', None)
+        if data is None:
+            return None
+        array[start:start+count] = np.frombuffer(data, dtype=java_dtype)
+    return array
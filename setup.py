@@ -48,5 +48,10 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=['numpy', 'nibabel', 'psutil'],
+    entry_points={
+        'console_scripts': [
+            'nighres-timelog-report=nighres.io.io_report:main',
+        ],
+    },
     python_requires='>=3'
 )